@@ -1,17 +1,94 @@
-from flask import Flask, jsonify, request
+import startup
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
-from database import get_db_connection
+from database import get_db_connection, get_pool_stats, query_frame
 from forecaster import InventoryForecaster
+from model_engines import ENGINES
+from history_panel import get_history_panel
+from storage import get_sales_store
+from hierarchy import RECONCILIATION_METHODS
+from backtesting import BACKTEST_ENGINES
+from job_queue import submit_forecast_job, submit_job, get_job, serialize_job, start_job_worker
+from response_cache import cached_response, get_response_cache
+from response_formats import UnsupportedFormat, negotiate_format, table_response
+from downsampling import BUCKETS, bucket_frame, bucket_start, downsample
+from model_cache import get_model_cache
+from metrics import registry, render_prometheus
 from config import Config
 from datetime import datetime, timedelta
+import cProfile
+import io
+import os
+import pstats
+import re
+import time
+import numpy as np
+import pandas as pd
 
 app = Flask(__name__)
 CORS(app)
 app.config.from_object(Config)
 
+# Stateless, so one instance is shared by every request thread
 forecaster = InventoryForecaster()
 
+startup.record_phase('import_app', time.perf_counter() - startup.STARTED)
+
+def start_background_workers():
+    """Start this process's Prophet warm-up and forecast job threads
+    (after any fork; see gunicorn.conf.py)"""
+    startup.start_warmup()
+    try:
+        start_job_worker()
+    except Exception as e:
+        print(f"WARNING: forecast job worker not started: {e}")
+    print(f"API process {os.getpid()} started: {startup.startup_report()['phases']}")
+
+@app.before_request
+def start_request_timer():
+    """Reset per-request DB counters; start cProfile when profiling was asked for"""
+    g.request_started = time.perf_counter()
+    registry.reset_request()
+    g.profiler = None
+    if Config.PROFILING_ENABLED and (request.args.get('profile') == '1' or request.headers.get('X-Profile')):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def record_request_timing(response):
+    """Request duration histogram, Server-Timing header and optional profile dump"""
+    elapsed = time.perf_counter() - g.get('request_started', time.perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    registry.observe('http_request_seconds', elapsed,
+                     method=request.method, endpoint=endpoint, status=response.status_code)
+
+    queries, db_seconds = registry.request_db_stats()
+    response.headers['Server-Timing'] = (
+        f'db;dur={db_seconds * 1000:.1f};desc="{queries} queries", app;dur={elapsed * 1000:.1f}'
+    )
+
+    profiler = g.get('profiler')
+    if profiler is not None:
+        profiler.disable()
+        response.headers['X-Profile'] = dump_profile(profiler, endpoint)
+    return response
+
+def dump_profile(profiler, endpoint):
+    """Write a .prof file and a text summary of the top functions; returns the file stem"""
+    os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+    name = re.sub(r'[^A-Za-z0-9]+', '_', endpoint).strip('_') or 'root'
+    stem = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{name}"
+    path = os.path.join(Config.PROFILE_DIR, stem)
+    profiler.dump_stats(f"{path}.prof")
+
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(40)
+    with open(f"{path}.txt", 'w') as f:
+        f.write(summary.getvalue())
+    return stem
+
 @app.route('/api/products', methods=['GET'])
+@cached_response('sales')
 def get_products():
     """Get list of all products"""
     try:
@@ -29,7 +106,54 @@ def get_products():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def history_table(product_ids, days_back, with_product_id=False, bucket='day'):
+    """Most recent N days of sales (from the latest date among the products) as columns,
+    summed per week or month unless bucket is 'day'"""
+    if Config.USE_HISTORY_PANEL:
+        # Slice the in-memory panel instead of querying the sales store
+        panel = get_history_panel()
+        latest = [d for d in (panel.latest_date(pid) for pid in product_ids) if d is not None]
+        # From the start of the first week/month, so the leading bucket is complete
+        since = bucket_start(max(latest) - np.timedelta64(days_back, 'D'), bucket) if latest else None
+        parts = []
+        for pid in product_ids:
+            cols = panel.columns(pid, since=since) if since is not None else {'ds': []}
+            if len(cols['ds']):
+                parts.append(pd.DataFrame({
+                    'product_id': pid,
+                    'sale_date': cols['ds'],
+                    'quantity_sold': cols['y'],
+                    'total_amount': cols['total_amount']
+                }))
+        df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(
+            columns=['product_id', 'sale_date', 'quantity_sold', 'total_amount'])
+        if not with_product_id:
+            df = df.drop(columns='product_id')
+        return bucket_frame(df, 'sale_date', ['quantity_sold', 'total_amount'], bucket,
+                            by='product_id' if with_product_id else None)
+
+    # Get the most recent N days of available data (works with old datasets)
+    return get_sales_store().recent_history(product_ids, days_back, with_product_id, bucket)
+
+def parse_resolution():
+    """?bucket= (day, week or month totals) and ?points= (LTTB target per series)"""
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {BUCKETS}")
+    points = request.args.get('points', type=int)
+    if points is not None and points < 3:
+        raise ValueError("points must be at least 3")
+    return bucket, points
+
+def parse_product_ids():
+    """Comma-separated ?product_ids=, or every product when absent"""
+    raw = request.args.get('product_ids')
+    if raw:
+        return [int(pid) for pid in raw.split(',')]
+    return query_frame("SELECT product_id FROM products ORDER BY product_id")['product_id'].tolist()
+
 @app.route('/api/historical', methods=['GET'])
+@cached_response('sales')
 def get_historical_data():
     """Get historical sales data for a product"""
     try:
@@ -39,44 +163,44 @@ def get_historical_data():
         if not product_id:
             return jsonify({'error': 'product_id is required'}), 400
 
-        conn = get_db_connection()
-        cur = conn.cursor()
+        fmt = negotiate_format()
+        bucket, points = parse_resolution()
+        df = downsample(history_table([product_id], days_back, bucket=bucket),
+                        'sale_date', 'quantity_sold', points)
+        return table_response(df, fmt), 200
 
-        # Get the most recent N days of available data (works with old datasets)
-        query = """
-            SELECT
-                sale_date,
-                SUM(quantity_sold) as quantity_sold,
-                SUM(total_amount) as total_amount
-            FROM sales_data
-            WHERE product_id = %s
-            AND sale_date >= (
-                SELECT MAX(sale_date) - INTERVAL '%s days'
-                FROM sales_data
-                WHERE product_id = %s
-            )
-            GROUP BY sale_date
-            ORDER BY sale_date
-        """
-
-        cur.execute(query, (product_id, days_back, product_id))
-        historical_data = cur.fetchall()
+    except UnsupportedFormat as e:
+        return jsonify({'error': str(e)}), 406
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        cur.close()
-        conn.close()
+@app.route('/api/historical/panel', methods=['GET'])
+@cached_response('sales')
+def get_historical_panel():
+    """Get historical sales for many products (long format) in one response"""
+    try:
+        fmt = negotiate_format(default='columns')
+        product_ids = parse_product_ids()
+        days_back = request.args.get('days_back', default=90, type=int)
 
-        # Convert dates to strings for JSON serialization
-        for record in historical_data:
-            record['sale_date'] = record['sale_date'].isoformat()
+        bucket, points = parse_resolution()
 
-        return jsonify(historical_data), 200
+        df = history_table(product_ids, days_back, with_product_id=True, bucket=bucket)
+        df = downsample(df, 'sale_date', 'quantity_sold', points, by='product_id')
+        return table_response(df, fmt), 200
 
+    except UnsupportedFormat as e:
+        return jsonify({'error': str(e)}), 406
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/forecast', methods=['POST'])
 def generate_forecast():
-    """Generate forecast for a product"""
+    """Submit a forecast job for a product"""
     try:
         data = request.get_json()
         product_id = data.get('product_id')
@@ -85,83 +209,288 @@ def generate_forecast():
         if not product_id:
             return jsonify({'error': 'product_id is required'}), 400
 
-        # Generate forecast
-        forecast_df = forecaster.generate_forecast_for_product(product_id, forecast_days)
+        try:
+            product_id, forecast_days = int(product_id), int(forecast_days)
+        except (TypeError, ValueError):
+            raise ValueError('product_id and forecast_days must be integers')
+        if forecast_days < 1:
+            raise ValueError('forecast_days must be positive')
 
-        # Convert to list of dicts for JSON
-        forecast_list = []
-        for _, row in forecast_df.iterrows():
-            forecast_list.append({
-                'forecast_date': row['ds'].isoformat(),
-                'predicted_quantity': float(row['yhat']),
-                'lower_bound': float(row['yhat_lower']),
-                'upper_bound': float(row['yhat_upper'])
-            })
+        # Queue the Prophet fit instead of blocking this worker; poll /api/jobs/<id>
+        job, created = submit_forecast_job(product_id, forecast_days)
+        response = serialize_job(job)
+        response['coalesced'] = not created
 
-        return jsonify({
-            'product_id': product_id,
-            'forecast': forecast_list
-        }), 200
+        return jsonify(response), 202
 
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_forecast_job(job_id):
+    """Get state, timings and result of a forecast job"""
+    try:
+        job = get_job(job_id)
+
+        if job is None:
+            return jsonify({'error': f'Job {job_id} not found'}), 404
+
+        return jsonify(serialize_job(job)), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/forecast/batch', methods=['POST'])
+def generate_batch_forecast():
+    """Submit a batch forecast job for many products; poll /api/jobs/<id> for the summary"""
+    try:
+        data = request.get_json(silent=True) or {}
+        product_ids = data.get('product_ids')
+        engine = data.get('engine')
+
+        if engine is not None and engine not in ENGINES:
+            raise ValueError(f"engine must be one of {ENGINES}")
+        try:
+            if product_ids is not None:
+                product_ids = [int(product_id) for product_id in product_ids]
+            numbers = {key: int(data[key]) for key in ('forecast_days', 'max_workers', 'timeout')
+                       if data.get(key) is not None}
+        except (TypeError, ValueError):
+            raise ValueError('product_ids, forecast_days, max_workers and timeout must be integers')
+
+        job = submit_job('batch', {
+            'product_ids': product_ids,
+            'engine': engine,
+            'incremental': bool(data.get('incremental')),
+            **numbers
+        })
+        return jsonify(serialize_job(job)), 202
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/forecast/hierarchy', methods=['POST'])
+def generate_hierarchy_forecast():
+    """Submit a reconciled store x family forecast job; poll /api/jobs/<id> for the summary"""
+    try:
+        data = request.get_json(silent=True) or {}
+        method = data.get('method', 'mint')
+
+        if method not in RECONCILIATION_METHODS:
+            raise ValueError(f'method must be one of {RECONCILIATION_METHODS}')
+        try:
+            numbers = {key: int(data[key]) for key in ('forecast_days', 'max_workers')
+                       if data.get(key) is not None}
+        except (TypeError, ValueError):
+            raise ValueError('forecast_days and max_workers must be integers')
+        if any(value < 1 for value in numbers.values()):
+            raise ValueError('forecast_days and max_workers must be positive')
+
+        job = submit_job('hierarchy', {'method': method, **numbers})
+        return jsonify(serialize_job(job)), 202
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+FORECAST_QUERY = """
+    SELECT
+        {columns}forecast_date,
+        predicted_quantity,
+        lower_bound,
+        upper_bound,
+        confidence_level,
+        generated_at,
+        run_id
+    FROM forecasts
+    WHERE product_id = ANY(%s)
+    ORDER BY {columns}forecast_date
+"""
+
+# Bounds are summed too, which gives a conservative interval for the bucket total
+BUCKETED_FORECAST_QUERY = """
+    SELECT
+        {columns}date_trunc('{bucket}', forecast_date)::date AS forecast_date,
+        SUM(predicted_quantity) AS predicted_quantity,
+        SUM(lower_bound) AS lower_bound,
+        SUM(upper_bound) AS upper_bound,
+        MAX(confidence_level) AS confidence_level,
+        MAX(generated_at) AS generated_at,
+        MAX(run_id) AS run_id,
+        COUNT(*) AS days
+    FROM forecasts
+    WHERE product_id = ANY(%s)
+    GROUP BY {columns}date_trunc('{bucket}', forecast_date)
+    ORDER BY {columns}forecast_date
+"""
+
+def forecast_table(product_ids, with_product_id=False, bucket='day', points=None):
+    """Saved forecasts, optionally summed per week/month and LTTB-downsampled per product"""
+    columns = 'product_id, ' if with_product_id else ''
+    query = FORECAST_QUERY if bucket == 'day' else BUCKETED_FORECAST_QUERY
+    df = query_frame(query.format(columns=columns, bucket=bucket), (list(product_ids),),
+                     parse_dates=['forecast_date', 'generated_at'], dtype={'run_id': 'Int64'})
+    return downsample(df, 'forecast_date', 'predicted_quantity', points,
+                      by='product_id' if with_product_id else None)
+
 @app.route('/api/forecast/<int:product_id>', methods=['GET'])
+@cached_response('forecasts')
 def get_saved_forecast(product_id):
     """Get saved forecast for a product"""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
+        fmt = negotiate_format()
+        bucket, points = parse_resolution()
+        return table_response(forecast_table([product_id], bucket=bucket, points=points), fmt), 200
 
-        query = """
-            SELECT
-                forecast_date,
-                predicted_quantity,
-                lower_bound,
-                upper_bound,
-                confidence_level,
-                generated_at
-            FROM forecasts
-            WHERE product_id = %s
-            ORDER BY forecast_date
-        """
-
-        cur.execute(query, (product_id,))
-        forecasts = cur.fetchall()
-
-        cur.close()
-        conn.close()
-
-        # Convert dates to strings for JSON serialization
-        for record in forecasts:
-            record['forecast_date'] = record['forecast_date'].isoformat()
-            record['generated_at'] = record['generated_at'].isoformat()
+    except UnsupportedFormat as e:
+        return jsonify({'error': str(e)}), 406
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        return jsonify(forecasts), 200
+@app.route('/api/forecast/panel', methods=['GET'])
+@cached_response('forecasts')
+def get_forecast_panel():
+    """Get saved forecasts for many products (long format) in one response"""
+    try:
+        fmt = negotiate_format(default='columns')
+        bucket, points = parse_resolution()
+        df = forecast_table(parse_product_ids(), with_product_id=True, bucket=bucket, points=points)
+        return table_response(df, fmt), 200
 
+    except UnsupportedFormat as e:
+        return jsonify({'error': str(e)}), 406
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/accuracy/<int:product_id>', methods=['GET'])
 def get_accuracy(product_id):
-    """Get accuracy metrics for a product's forecast"""
+    """Get accuracy metrics for a product's forecast from its latest backtest"""
     try:
-        metrics = forecaster.get_accuracy_metrics(product_id)
+        metrics = forecaster.get_accuracy_metrics(product_id, request.args.get('engine', 'prophet'))
 
         if metrics is None:
-            return jsonify({'error': 'Insufficient data for accuracy calculation'}), 400
+            return jsonify({'error': 'No backtest results for this product; run backtesting.py'}), 400
 
         return jsonify(metrics), 200
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/backtest', methods=['POST'])
+def run_backtest_endpoint():
+    """Submit a rolling-origin backtest job; poll /api/jobs/<id> for the summary"""
+    try:
+        data = request.get_json(silent=True) or {}
+        product_ids = data.get('product_ids')
+        engines = data.get('engines')
+
+        if engines is not None and (not isinstance(engines, list)
+                                   or any(engine not in BACKTEST_ENGINES for engine in engines)):
+            raise ValueError(f"engines must be a list drawn from {BACKTEST_ENGINES}")
+        if product_ids is not None and not isinstance(product_ids, list):
+            raise ValueError('product_ids must be a list of integers')
+        try:
+            if product_ids is not None:
+                product_ids = [int(product_id) for product_id in product_ids]
+            numbers = {key: int(data[key]) for key in ('horizon', 'cutoffs', 'period', 'max_workers')
+                       if data.get(key) is not None}
+        except (TypeError, ValueError):
+            raise ValueError('product_ids, horizon, cutoffs, period and max_workers must be integers')
+        if any(value < 1 for value in numbers.values()):
+            raise ValueError('horizon, cutoffs, period and max_workers must be positive')
+
+        job = submit_job('backtest', {
+            'product_ids': product_ids,
+            'horizon': numbers.get('horizon'),
+            'num_cutoffs': numbers.get('cutoffs'),
+            'period': numbers.get('period'),
+            'max_workers': numbers.get('max_workers'),
+            'engines': engines or None
+        })
+        return jsonify(serialize_job(job)), 202
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()}), 200
+    """Liveness check: the process is up and serving (no DB access)"""
+    cache = get_response_cache()
+    return jsonify({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'db_pool': get_pool_stats(),
+        'response_cache': cache.stats() if cache is not None else None
+    }), 200
+
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness check: 200 once the database answers, so read endpoints can serve
+
+    Forecasting dependencies may still be warming up (see 'forecasting');
+    ?require=forecasting also waits for them.
+    """
+    report = startup.startup_report()
+    report['forecasting'] = startup.forecasting_ready()
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.close()
+        conn.close()
+        report['database'] = True
+    except Exception as e:
+        report['database'] = False
+        report['database_error'] = str(e)
+
+    ready = report['database'] and (request.args.get('require') != 'forecasting' or report['forecasting'])
+    report['status'] = 'ready' if ready else 'starting'
+    return jsonify(report), 200 if ready else 503
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Timing histograms and cache/pool counters in Prometheus text format"""
+    extra = {}
+    pool = get_pool_stats()
+    if pool is not None:
+        extra.update({
+            'db_pool_connections_in_use': ('gauge', 'Pooled connections checked out', pool['in_use']),
+            'db_pool_connections_open': ('gauge', 'Open pooled connections', pool['open']),
+            'db_pool_checkouts_total': ('counter', 'Pool checkouts', pool['checkouts']),
+            'db_pool_timeouts_total': ('counter', 'Pool checkouts that timed out', pool['timeouts']),
+            'db_pool_wait_seconds_total': ('counter', 'Time spent waiting for a pooled connection', pool['wait_seconds'])
+        })
+    cache = get_response_cache()
+    if cache is not None:
+        stats = cache.stats()
+        extra.update({
+            'response_cache_hits_total': ('counter', 'Response cache hits', stats['hits']),
+            'response_cache_misses_total': ('counter', 'Response cache misses', stats['misses']),
+            'response_cache_not_modified_total': ('counter', '304 responses sent', stats['not_modified'])
+        })
+    model_cache = get_model_cache()
+    if model_cache is not None:
+        stats = model_cache.stats()
+        extra.update({
+            'model_cache_hits_total': ('counter', 'Prophet model cache hits', stats['hits']),
+            'model_cache_misses_total': ('counter', 'Prophet model cache misses', stats['misses']),
+            'model_cache_bytes': ('gauge', 'Size of cached models on disk', stats['bytes'])
+        })
+    return Response(render_prometheus(extra), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
+    # With the debug reloader, only the serving child process runs jobs
+    if not Config.DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_workers()
     app.run(host='0.0.0.0', port=Config.FLASK_PORT, debug=Config.DEBUG)
@@ -0,0 +1,239 @@
+"""
+Rolling-origin backtesting of the production forecast model.
+
+For each product, the model is refitted at several cutoffs (spaced `period`
+days apart, the last one `horizon` days before the end of the data) with the
+same Prophet configuration and regressors as train_and_forecast, and
+evaluated on the following `horizon` days. Future regressors follow the
+production assumptions: last known oil price, known holidays, no promotions.
+(product, cutoff) pairs run in parallel across a process pool. The
+statistical engines from model_engines are scored at the same cutoffs, all
+products per cutoff in one array operation. Per-cutoff metrics are stored in
+backtest_results so /api/accuracy and the engine selection policy can use
+them without refitting.
+
+Usage:
+    python backtesting.py --horizon 30 --cutoffs 3 --period 30 --workers 4
+    python backtesting.py --engines seasonal_naive,holt_winters,croston
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+from config import Config
+from database import get_db_connection
+from forecaster import InventoryForecaster, PROPHET_PARAMS
+from history_panel import load_history_panel
+from model_engines import STATISTICAL_ENGINES, get_engine
+
+# Engines a backtest can score
+BACKTEST_ENGINES = ['prophet'] + STATISTICAL_ENGINES
+
+# History panel shared with pool workers, set once per worker by _init_worker
+_worker_panel = None
+
+
+def _init_worker(panel):
+    global _worker_panel
+    _worker_panel = panel
+
+
+def rolling_cutoffs(dates, horizon, num_cutoffs, period):
+    """Cutoff dates, oldest first, leaving `horizon` days after the last one"""
+    last = pd.Timestamp(dates.max())
+    cutoffs = [last - pd.Timedelta(days=horizon + i * period) for i in range(num_cutoffs)]
+    return sorted(c for c in cutoffs if c > pd.Timestamp(dates.min()))
+
+
+def evaluate(actual, yhat, lower, upper):
+    """MAE, MAPE (non-zero actuals only), RMSE and interval coverage"""
+    errors = actual - yhat
+    non_zero = actual != 0
+    return {
+        'mae': float(np.abs(errors).mean()),
+        'mape': float((np.abs(errors[non_zero] / actual[non_zero]) * 100).mean()) if non_zero.any() else None,
+        'rmse': float(np.sqrt((errors ** 2).mean())),
+        'coverage': float(((actual >= lower) & (actual <= upper)).mean())
+    }
+
+
+def backtest_cutoff(product_id, history, cutoff, horizon):
+    """Fit on data up to cutoff and score the next `horizon` days"""
+    train = history[history['ds'] <= cutoff]
+    test = history[(history['ds'] > cutoff) & (history['ds'] <= cutoff + pd.Timedelta(days=horizon))]
+    if len(train) < 10 or test.empty:
+        return None
+
+    # Uncached: backtest fits must not evict or replace the production models
+    forecaster = InventoryForecaster(model_cache=False, warm_start=False)
+    regressors = forecaster.available_regressors(train)
+    model, _ = forecaster.fit_model(product_id, train, PROPHET_PARAMS, regressors)
+
+    future = test[['ds']].copy()
+    if 'oil_price' in regressors:
+        future['oil_price'] = train['oil_price'].iloc[-1]
+    if 'is_holiday' in regressors:
+        future['is_holiday'] = test['is_holiday'].values
+    if 'on_promotion' in regressors:
+        future['on_promotion'] = 0
+
+    forecast = model.predict(future)
+    metrics = evaluate(test['y'].to_numpy(dtype=float), forecast['yhat'].to_numpy(),
+                       forecast['yhat_lower'].to_numpy(), forecast['yhat_upper'].to_numpy())
+    metrics.update({'product_id': product_id, 'cutoff': cutoff.date(), 'horizon': horizon, 'engine': 'prophet'})
+    return metrics
+
+
+def backtest_statistical(panel, tasks, horizon, engines):
+    """Score statistical engines for every (product, cutoff) task, batched per cutoff"""
+    by_cutoff = {}
+    for product_id, cutoff in tasks:
+        by_cutoff.setdefault(cutoff, []).append(product_id)
+
+    results = []
+    for cutoff, product_ids in by_cutoff.items():
+        dates, y = panel.matrix(product_ids, until=cutoff, days=Config.STAT_HISTORY_DAYS)
+        if len(dates) == 0:
+            continue
+        origin = dates[-1]
+        forecasts = {name: get_engine(name).forecast(y, horizon) for name in engines}
+        observed = (~np.isnan(y)).sum(axis=0)
+
+        for i, product_id in enumerate(product_ids):
+            test = panel.columns(product_id, since=origin + np.timedelta64(1, 'D'))
+            pos = (test['ds'] - origin).astype(int) - 1
+            keep = pos < horizon
+            if observed[i] < 10 or not keep.any():
+                continue
+            actual = test['y'][keep].astype(float)
+            for name, (yhat, lower, upper) in forecasts.items():
+                metrics = evaluate(actual, yhat[pos[keep], i], lower[pos[keep], i], upper[pos[keep], i])
+                metrics.update({'product_id': product_id, 'cutoff': cutoff.date(),
+                                'horizon': horizon, 'engine': name})
+                results.append(metrics)
+    return results
+
+
+def _backtest_worker(product_id, cutoff, horizon):
+    try:
+        return backtest_cutoff(product_id, _worker_panel.frame(product_id), cutoff, horizon), None
+    except Exception as e:
+        return None, f"product {product_id} cutoff {cutoff.date()}: {e}"
+
+
+def run_backtest(product_ids=None, horizon=30, num_cutoffs=3, period=30, max_workers=None,
+                 progress_callback=None, engines=None):
+    """Backtest products in parallel and store the results as a new backtest run
+
+    engines defaults to Prophet plus every statistical engine.
+
+    Returns:
+        Summary dict with run_id, evaluated/failed counts and duration
+    """
+    started = time.time()
+    panel = load_history_panel()
+    if product_ids is None:
+        product_ids = panel.product_ids
+    max_workers = max_workers or Config.BATCH_MAX_WORKERS or os.cpu_count()
+
+    tasks = []
+    for product_id in product_ids:
+        dates = panel.columns(product_id)['ds']
+        if len(dates) == 0:
+            continue
+        tasks += [(product_id, cutoff) for cutoff in rolling_cutoffs(dates, horizon, num_cutoffs, period)]
+
+    engines = engines or BACKTEST_ENGINES
+    statistical = [name for name in engines if name != 'prophet']
+    results = backtest_statistical(panel, tasks, horizon, statistical) if statistical else []
+    errors = []
+
+    prophet_tasks = tasks if 'prophet' in engines else []
+    if prophet_tasks:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(panel,)) as executor:
+            futures = [executor.submit(_backtest_worker, product_id, cutoff, horizon)
+                       for product_id, cutoff in prophet_tasks]
+            for done, future in enumerate(as_completed(futures), start=1):
+                result, error = future.result()
+                if result is not None:
+                    results.append(result)
+                if error is not None:
+                    errors.append(error)
+                if progress_callback:
+                    progress_callback(done, len(futures))
+
+    run_id = save_backtest(results, horizon, num_cutoffs, period)
+    return {
+        'run_id': run_id,
+        'products': len({r['product_id'] for r in results}),
+        'evaluations': len(results),
+        'errors': errors,
+        'duration_seconds': time.time() - started
+    }
+
+
+def save_backtest(results, horizon, num_cutoffs, period):
+    """Store per-cutoff metrics under a new backtest run; returns its run_id"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO backtest_runs (horizon, num_cutoffs, period) VALUES (%s, %s, %s) RETURNING run_id",
+        (horizon, num_cutoffs, period)
+    )
+    run_id = cur.fetchone()['run_id']
+
+    execute_values(
+        cur,
+        """
+        INSERT INTO backtest_results (run_id, product_id, engine, cutoff, horizon, mae, mape, rmse, coverage)
+        VALUES %s
+        """,
+        [(run_id, int(r['product_id']), r['engine'], r['cutoff'], r['horizon'],
+          r['mae'], r['mape'], r['rmse'], r['coverage'])
+         for r in results],
+        page_size=1000
+    )
+    cur.execute("UPDATE backtest_runs SET completed_at = CURRENT_TIMESTAMP WHERE run_id = %s", (run_id,))
+    conn.commit()
+    cur.close()
+    conn.close()
+    return run_id
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rolling-origin backtest of the forecast model')
+    parser.add_argument('--horizon', type=int, default=30,
+                      help='Days forecast after each cutoff')
+    parser.add_argument('--cutoffs', type=int, default=3,
+                      help='Number of cutoffs per product')
+    parser.add_argument('--period', type=int, default=30,
+                      help='Days between cutoffs')
+    parser.add_argument('--workers', type=int, default=None,
+                      help='Number of worker processes (default: BATCH_MAX_WORKERS or CPU count)')
+    parser.add_argument('--products', type=str, default=None,
+                      help='Comma-separated product ids (default: all products)')
+    parser.add_argument('--engines', type=str, default=None,
+                      help='Comma-separated engines to score (default: prophet and all statistical engines)')
+
+    args = parser.parse_args()
+    product_ids = [int(p) for p in args.products.split(',')] if args.products else None
+    engines = args.engines.split(',') if args.engines else None
+
+    print("Starting backtest...")
+    summary = run_backtest(product_ids, args.horizon, args.cutoffs, args.period, args.workers,
+                           progress_callback=lambda done, total: print(f"  [{done}/{total}] cutoffs evaluated"),
+                           engines=engines)
+
+    print("\n" + "="*60)
+    print("Backtest completed!")
+    print("="*60)
+    print(f"Run id: {summary['run_id']}")
+    print(f"Products: {summary['products']}, evaluations: {summary['evaluations']}")
+    for error in summary['errors']:
+        print(f"  {error}")
+    print(f"Duration: {summary['duration_seconds']:.1f}s")
@@ -0,0 +1,262 @@
+"""
+Batch forecasting for every product in the catalogue.
+
+Products are first routed to an engine (see model_engines.select_engines).
+Statistical engines forecast all of their products in one array operation
+per last-sale date, and the global engine (global_model.py) trains once on
+the whole panel and predicts its products the same way; the rest fan
+InventoryForecaster.train_and_forecast out over a process pool so each
+Prophet/Stan fit runs on its own core. Every successful forecast is written
+back in a single transaction.
+
+Usage:
+    python batch_forecaster.py --forecast-days 30 --workers 4 --timeout 300
+    python batch_forecaster.py --engine prophet
+    python batch_forecaster.py --engine global
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from config import Config
+from database import get_db_connection
+from forecaster import InventoryForecaster
+from global_model import GlobalModel
+from history_panel import load_history_panel
+from model_engines import (ENGINES, STATISTICAL_ENGINES, forecast_frames, get_engine,
+                           load_backtest_errors, select_engines)
+
+
+# History panel shared with pool workers, set once per worker by _init_worker
+_worker_panel = None
+
+
+def _init_worker(panel):
+    global _worker_panel
+    _worker_panel = panel
+
+
+def get_all_product_ids():
+    """Return every product_id in the products table"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT product_id FROM products ORDER BY product_id")
+    product_ids = [row['product_id'] for row in cur.fetchall()]
+    cur.close()
+    conn.close()
+    return product_ids
+
+
+def _forecast_worker(product_id, forecast_days, timeout):
+    """Fit and forecast one product inside a pool worker
+
+    Never raises: failures are returned as data so one bad product cannot
+    take down the rest of the batch. The timeout is enforced by cmdstanpy,
+    which kills the Stan process when it expires, so timed-out fits don't
+    leave optimizers running alongside the rest of the batch.
+    """
+    started = time.time()
+    try:
+        history = _worker_panel.frame(product_id) if _worker_panel is not None else None
+        forecast = InventoryForecaster().train_and_forecast(product_id, forecast_days, history=history,
+                                                            engine='prophet', timeout=timeout)
+        return {'product_id': product_id, 'status': 'succeeded', 'forecast': forecast,
+                'duration': time.time() - started}
+    except TimeoutError:
+        return {'product_id': product_id, 'status': 'timed_out',
+                'error': f"Exceeded {timeout}s timeout", 'duration': time.time() - started}
+    except Exception as e:
+        return {'product_id': product_id, 'status': 'failed', 'error': str(e),
+                'duration': time.time() - started}
+
+
+def assign_engines(panel, product_ids, engine):
+    """Engine name per product; 'auto' applies the backtest-driven selection policy"""
+    if engine != 'auto':
+        return dict.fromkeys(product_ids, engine)
+
+    _, y = panel.matrix(product_ids, days=Config.STAT_HISTORY_DAYS)
+    errors = load_backtest_errors(product_ids)
+    names = select_engines(y, [errors.get(product_id) for product_id in product_ids])
+    return dict(zip(product_ids, names))
+
+
+def statistical_batch(panel, product_ids, forecast_days, engine):
+    """Forecast products with one statistical engine, one array operation per last-sale date
+
+    Products with fewer than 10 days of history are left out.
+    """
+    groups = {}
+    for product_id in product_ids:
+        if len(panel.columns(product_id)['ds']) >= 10:
+            groups.setdefault(panel.latest_date(product_id), []).append(product_id)
+
+    forecasts = {}
+    for last_date, group in groups.items():
+        _, y = panel.matrix(group, days=Config.STAT_HISTORY_DAYS)
+        yhat, lower, upper = get_engine(engine).forecast(y, forecast_days)
+        forecasts.update(zip(group, forecast_frames(last_date, yhat, lower, upper)))
+    return forecasts
+
+
+def run_batch_forecast(product_ids=None, forecast_days=30, max_workers=None, timeout=None,
+                       progress_callback=None, save=True, engine=None):
+    """Forecast many products in parallel and bulk-save the results
+
+    Args:
+        product_ids: Products to forecast, or None for every product
+        forecast_days: Forecast horizon in days
+        max_workers: Pool size, defaults to Config.BATCH_MAX_WORKERS
+        timeout: Per-product timeout in seconds, defaults to Config.BATCH_TIMEOUT
+        progress_callback: Called as callback(done, total, result) after each product
+        save: Write successful forecasts to the database in one transaction
+        engine: 'auto', 'prophet' or a statistical engine, defaults to Config.FORECAST_ENGINE
+
+    Returns:
+        Summary dict with succeeded/failed/timed_out product ids, engine counts and timings
+    """
+    engine = engine or Config.FORECAST_ENGINE
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of {ENGINES}")
+
+    # One bulk query for all history instead of one connection and join per product
+    panel = load_history_panel()
+    if product_ids is None:
+        product_ids = get_all_product_ids()
+    max_workers = max_workers or Config.BATCH_MAX_WORKERS or os.cpu_count()
+    timeout = timeout if timeout is not None else Config.BATCH_TIMEOUT
+
+    started = time.time()
+    forecasts = {}
+    summary = {
+        'total': len(product_ids),
+        'succeeded': [],
+        'failed': {},
+        'timed_out': [],
+        'engines': {},
+        'durations': {}
+    }
+    done = 0
+
+    def record(result):
+        nonlocal done
+        product_id = result['product_id']
+        if result['status'] == 'succeeded':
+            forecasts[product_id] = result['forecast']
+            summary['succeeded'].append(product_id)
+        elif result['status'] == 'timed_out':
+            summary['timed_out'].append(product_id)
+        else:
+            summary['failed'][product_id] = result['error']
+        summary['durations'][product_id] = result['duration']
+
+        done += 1
+        if progress_callback:
+            progress_callback(done, len(product_ids), result)
+
+    assigned = assign_engines(panel, product_ids, engine)
+    for name in set(assigned.values()):
+        summary['engines'][name] = sum(1 for e in assigned.values() if e == name)
+
+    batched_fits = []
+    for name in STATISTICAL_ENGINES + ['global']:
+        group = [product_id for product_id, e in assigned.items() if e == name]
+        if not group:
+            continue
+        engine_started = time.time()
+        if name == 'global':
+            # One training pass over the panel, then one batched predict per last-sale date
+            batch = GlobalModel().fit(panel).forecast(panel, group, forecast_days)
+        else:
+            batch = statistical_batch(panel, group, forecast_days, name)
+        duration = (time.time() - engine_started) / len(group)
+        for product_id in group:
+            if product_id in batch:
+                ds = panel.columns(product_id)['ds']
+                batched_fits.append((product_id, ds[-1].item(), len(ds), duration, False, name))
+                record({'product_id': product_id, 'status': 'succeeded', 'forecast': batch[product_id],
+                        'duration': duration})
+            else:
+                record({'product_id': product_id, 'status': 'failed',
+                        'error': f"Insufficient data for product {product_id}", 'duration': duration})
+
+    prophet_ids = [product_id for product_id, e in assigned.items() if e == 'prophet']
+    if prophet_ids:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(panel,)) as executor:
+            futures = {
+                executor.submit(_forecast_worker, product_id, forecast_days, timeout): product_id
+                for product_id in prophet_ids
+            }
+
+            for future in as_completed(futures):
+                product_id = futures[future]
+                try:
+                    result = future.result()
+                except BrokenProcessPool as e:
+                    # A worker died (e.g. OOM-killed); record it and keep draining
+                    result = {'product_id': product_id, 'status': 'failed',
+                              'error': f"Worker process died: {e}", 'duration': None}
+                record(result)
+
+    if save and forecasts:
+        InventoryForecaster().save_forecasts(forecasts)
+    if save and batched_fits:
+        InventoryForecaster.record_fits(batched_fits)
+
+    summary['duration_seconds'] = time.time() - started
+    return summary
+
+
+def _print_progress(done, total, result):
+    duration = f"{result['duration']:.1f}s" if result['duration'] is not None else '-'
+    print(f"  [{done}/{total}] product {result['product_id']}: {result['status']} ({duration})")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Forecast all products in parallel')
+    parser.add_argument('--forecast-days', type=int, default=30,
+                      help='Number of days to forecast')
+    parser.add_argument('--workers', type=int, default=None,
+                      help='Number of worker processes (default: BATCH_MAX_WORKERS or CPU count)')
+    parser.add_argument('--timeout', type=int, default=None,
+                      help='Per-product timeout in seconds (default: BATCH_TIMEOUT)')
+    parser.add_argument('--products', type=str, default=None,
+                      help='Comma-separated product ids (default: all products)')
+    parser.add_argument('--incremental', action='store_true',
+                      help='Only refit products that received new sales since their last fit')
+    parser.add_argument('--dry-run', action='store_true',
+                      help='Fit and forecast without saving results')
+    parser.add_argument('--engine', choices=ENGINES, default=None,
+                      help='Forecast engine (default: FORECAST_ENGINE, normally auto)')
+
+    args = parser.parse_args()
+    product_ids = [int(p) for p in args.products.split(',')] if args.products else None
+    if args.incremental and product_ids is None:
+        product_ids = InventoryForecaster().get_products_with_new_data()
+        print(f"{len(product_ids)} products have new sales since their last fit")
+
+    print("Starting batch forecast...")
+    summary = run_batch_forecast(
+        product_ids=product_ids,
+        forecast_days=args.forecast_days,
+        max_workers=args.workers,
+        timeout=args.timeout,
+        progress_callback=_print_progress,
+        save=not args.dry_run,
+        engine=args.engine
+    )
+
+    print("\n" + "="*60)
+    print("Batch forecast completed!")
+    print("="*60)
+    print(f"Succeeded: {len(summary['succeeded'])} / {summary['total']}")
+    for name, count in sorted(summary['engines'].items()):
+        print(f"  {name}: {count} products")
+    print(f"Failed: {len(summary['failed'])}")
+    for product_id, error in summary['failed'].items():
+        print(f"  product {product_id}: {error}")
+    print(f"Timed out: {len(summary['timed_out'])}")
+    print(f"Duration: {summary['duration_seconds']:.1f}s")
@@ -0,0 +1,368 @@
+"""
+Benchmark harness for the forecast pipeline.
+
+Generates a synthetic dataset with NumPy (weekly/yearly seasonality, trend,
+promotions, holidays, an oil-price random walk and a share of intermittent
+products), optionally loads it into the database, and times each stage of
+the pipeline:
+
+    generate        NumPy generation of the synthetic dataset (with --load)
+    load            COPY of the synthetic dataset and sales_daily rebuild
+    duckdb_export   Parquet export of sales_daily for the duckdb store (with --backends)
+    <backend>_*     sales store reads per backend: the whole panel, one product's
+                    history, and its last 90 days (with --backends)
+    history_panel   bulk load of every product's history (STORAGE_BACKEND)
+    statistical_*   batched statistical engine forecast for every product
+    global_fit      global model training pass over the whole panel
+    global_predict  global model forecast for every product
+    db_fetch        per-product history query
+    prep            rows -> forecaster DataFrame
+    serialize_*     API rendering of the history in each response format
+    fit             Prophet fit (model cache off, cold)
+    predict         future frame + predict
+    persist         save_forecasts for the sampled products
+
+Each stage reports count, total seconds, throughput, p50/p95/max latency and
+the process's peak RSS after the stage. Results are written as JSON (with
+the git commit) so runs can be compared with --compare.
+
+Usage:
+    python benchmark.py --products 2000 --days 1095 --load --sample 20 --output bench.json
+    python benchmark.py --sample 20 --output new.json --compare bench.json
+    python benchmark.py --sample 50 --no-prophet --backends postgres,duckdb
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import time
+from datetime import date, datetime, timedelta
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+from daily_aggregates import ROLLUP_HISTORY_QUERY, refresh_sales_daily
+from database import copy_dataframe, get_db_connection
+from forecaster import InventoryForecaster, PROPHET_PARAMS
+from global_model import GlobalModel
+from history_panel import invalidate_history_panel, load_history_panel
+from import_kaggle_store_sales import peak_rss_mb
+from model_engines import STATISTICAL_ENGINES, forecast_frames, get_engine
+from partitions import ensure_partitions, truncate_sales
+from regressor_calendar import invalidate_regressor_calendar
+from response_cache import invalidate_responses
+from response_formats import render_table
+from storage import BACKENDS, make_sales_store, refresh_sales_store
+
+CATEGORIES = ['Grocery', 'Beverages', 'Home Care', 'Personal Care', 'Stationery', 'Electronics']
+
+
+def synthetic_dataset(num_products=1000, days=730, end=None, intermittent_share=0.2, seed=0):
+    """Synthetic catalogue, daily sales and regressors built with array operations
+
+    Returns a dict with 'products', 'sales', 'oil' and 'holidays' DataFrames.
+    Sales reference products by their row position in 'products'.
+    """
+    rng = np.random.default_rng(seed)
+    end = end or date.today()
+    dates = np.arange(np.datetime64(end - timedelta(days=days - 1)), np.datetime64(end) + 1)
+    t = np.arange(days)
+
+    # Calendar regressors shared by all products
+    oil = np.clip(60 + np.cumsum(rng.normal(0, 0.8, days)), 20, None)
+    is_holiday = rng.random(days) < 12 / 365
+    weekday = (dates.astype('datetime64[D]').view('int64') - 4) % 7  # 0 = Monday
+
+    # Per-product parameters
+    base = rng.lognormal(mean=2.5, sigma=1.0, size=num_products)
+    trend = rng.normal(0, 0.3, num_products) / 365
+    weekly = 1 + rng.uniform(0, 0.4, num_products)[:, None] * np.where(weekday >= 5, -1.0, 0.25)
+    phase = rng.integers(0, 365, num_products)[:, None]
+    yearly = 1 + rng.uniform(0, 0.3, num_products)[:, None] * np.sin(2 * np.pi * (t + phase) / 365.25)
+    promo = rng.random((num_products, days)) < rng.uniform(0, 0.15, num_products)[:, None]
+    oil_elasticity = rng.normal(0, 0.004, num_products)[:, None]
+
+    rate = (base[:, None] * (1 + trend[:, None] * t) * weekly * yearly
+            * np.where(promo, 1.4, 1.0) * np.where(is_holiday, 1.3, 1.0)
+            * np.exp(oil_elasticity * (oil - oil.mean())))
+    intermittent = rng.random(num_products) < intermittent_share
+    rate[intermittent] *= 0.05
+    quantity = rng.poisson(np.clip(rate, 0, None))
+
+    unit_price = np.round(rng.uniform(1, 50, num_products), 2)
+    products = pd.DataFrame({
+        'product_name': [f"Synthetic Product {i + 1}" for i in range(num_products)],
+        'category': np.array(CATEGORIES)[rng.integers(0, len(CATEGORIES), num_products)],
+        'unit_price': unit_price
+    })
+    sales = pd.DataFrame({
+        'product_index': np.repeat(np.arange(num_products), days),
+        'sale_date': np.tile(dates, num_products),
+        'quantity_sold': quantity.ravel(),
+        'total_amount': np.round(quantity * unit_price[:, None], 2).ravel(),
+        'on_promotion': promo.astype(np.int32).ravel()
+    })
+    oil_prices = pd.DataFrame({'date': dates, 'dcoilwtico': np.round(oil, 2)})
+    holiday_dates = dates[is_holiday]
+    holidays = pd.DataFrame({
+        'date': holiday_dates,
+        'type': 'Holiday',
+        'locale': 'National',
+        'locale_name': 'Synthetic',
+        'description': 'Synthetic holiday',
+        'transferred': False
+    })
+    return {'products': products, 'sales': sales, 'oil': oil_prices, 'holidays': holidays}
+
+
+def load_dataset(data):
+    """Replace all sales data, oil prices and holidays with the synthetic dataset"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    truncate_sales(cur)
+    for table in ['forecasts', 'hierarchy_forecasts', 'forecast_jobs', 'model_fits', 'backtest_results',
+                  'products', 'oil_prices', 'holidays']:
+        cur.execute(f'DELETE FROM {table}')
+
+    product_ids = execute_values(
+        cur,
+        "INSERT INTO products (product_name, category, unit_price) VALUES %s RETURNING product_id",
+        list(data['products'].itertuples(index=False, name=None)),
+        page_size=1000,
+        fetch=True
+    )
+    product_ids = np.array([row['product_id'] for row in product_ids])
+
+    sales = data['sales'].assign(product_id=product_ids[data['sales']['product_index'].to_numpy()])
+    ensure_partitions(cur, 'sales_data', sales['sale_date'].min(), sales['sale_date'].max())
+    copy_dataframe(cur, sales, 'sales_data',
+                   ['product_id', 'sale_date', 'quantity_sold', 'total_amount', 'on_promotion'])
+    copy_dataframe(cur, data['oil'], 'oil_prices', ['date', 'dcoilwtico'])
+    copy_dataframe(cur, data['holidays'], 'holidays',
+                   ['date', 'type', 'locale', 'locale_name', 'description', 'transferred'])
+    refresh_sales_daily(conn)
+    conn.commit()
+    cur.close()
+    conn.close()
+    invalidate_responses('sales', 'forecasts')
+    refresh_sales_store()
+    invalidate_history_panel()
+    invalidate_regressor_calendar()
+    return product_ids.tolist()
+
+
+class StageTimer:
+    """Collects per-call latencies for named pipeline stages"""
+
+    def __init__(self):
+        self.samples = {}
+        self.units = {}
+        self.peak_rss = {}
+
+    def time(self, stage, func, *args, units=1, **kwargs):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.samples.setdefault(stage, []).append(time.perf_counter() - started)
+        self.units[stage] = self.units.get(stage, 0) + units
+        self.peak_rss[stage] = peak_rss_mb()
+        return result
+
+    def report(self):
+        stages = {}
+        for stage, samples in self.samples.items():
+            latencies = np.array(samples) * 1000
+            total = float(np.sum(samples))
+            stages[stage] = {
+                'count': len(samples),
+                'units': self.units[stage],
+                'total_seconds': round(total, 4),
+                'throughput_per_second': round(self.units[stage] / total, 2) if total > 0 else None,
+                'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+                'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+                'max_ms': round(float(latencies.max()), 3),
+                'peak_rss_mb': round(self.peak_rss[stage], 1) if self.peak_rss[stage] else None
+            }
+        return stages
+
+
+def fetch_history_rows(product_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(ROLLUP_HISTORY_QUERY, (product_id,))
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+    return rows
+
+
+def fit_prophet(forecaster, product_id, df):
+    regressors = forecaster.available_regressors(df)
+    model, _ = forecaster.fit_model(product_id, df, PROPHET_PARAMS, regressors)
+    return model, regressors
+
+
+def predict_prophet(forecaster, model, df, forecast_days, regressors):
+    forecast = model.predict(forecaster.future_frame(model, df, forecast_days, regressors))
+    return forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']]
+
+
+def statistical_all(panel, product_ids, forecast_days, engine):
+    dates, y = panel.matrix(product_ids, days=365)
+    yhat, lower, upper = get_engine(engine).forecast(y, forecast_days)
+    return dict(zip(product_ids, forecast_frames(dates[-1], yhat, lower, upper)))
+
+
+def storage_benchmark(timer, backends, product_ids, sampled, days_back=90):
+    """Time the sales store reads on each backend (the duckdb mirror is exported first)"""
+    for backend in backends:
+        store = make_sales_store(backend)
+        if backend == 'duckdb':
+            timer.time('duckdb_export', store.refresh)
+        timer.time(f'{backend}_panel', store.panel_frame, units=len(product_ids))
+        for product_id in sampled:
+            timer.time(f'{backend}_product_history', store.product_history, product_id)
+            timer.time(f'{backend}_recent_history', store.recent_history, [product_id], days_back)
+
+
+def run_benchmark(product_ids, sample=20, forecast_days=30, prophet=True, seed=0, backends=()):
+    """Time every pipeline stage; product_ids is the catalogue to sample from"""
+    if not product_ids:
+        raise ValueError("No products to benchmark; load a dataset first (--load)")
+
+    timer = StageTimer()
+    rng = np.random.default_rng(seed)
+    sampled = sorted(rng.choice(product_ids, size=min(sample, len(product_ids)), replace=False).tolist())
+    forecaster = InventoryForecaster(model_cache=False, warm_start=False)
+    forecasts = {}
+
+    storage_benchmark(timer, backends, product_ids, sampled)
+
+    panel = timer.time('history_panel', load_history_panel, units=len(product_ids))
+    for engine in STATISTICAL_ENGINES:
+        timer.time(f'statistical_{engine}', statistical_all, panel, product_ids, forecast_days, engine,
+                   units=len(product_ids))
+    model = timer.time('global_fit', GlobalModel().fit, panel, units=len(product_ids))
+    timer.time('global_predict', model.forecast, panel, product_ids, forecast_days, units=len(product_ids))
+
+    for product_id in sampled:
+        rows = timer.time('db_fetch', fetch_history_rows, product_id)
+        df = timer.time('prep', forecaster.history_frame, rows)
+        if len(df) < 10:
+            continue
+
+        for fmt in ['records', 'columns', 'arrow', 'parquet']:
+            api_df = df[['ds', 'y']].rename(columns={'ds': 'sale_date', 'y': 'quantity_sold'})
+            try:
+                timer.time(f'serialize_{fmt}', render_table, api_df, fmt)
+            except ValueError:
+                pass
+
+        if prophet:
+            model, regressors = timer.time('fit', fit_prophet, forecaster, product_id, df)
+            forecasts[product_id] = timer.time('predict', predict_prophet, forecaster, model, df,
+                                               forecast_days, regressors)
+
+    if forecasts:
+        timer.time('persist', forecaster.save_forecasts, forecasts,
+                   units=sum(len(f) for f in forecasts.values()))
+    return timer.report()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline):
+    """Print p50 and throughput ratios of current vs baseline stages"""
+    print(f"\n{'stage':<28}{'p50 ms':>12}{'baseline':>12}{'ratio':>8}")
+    for stage, stats in current['stages'].items():
+        base = baseline['stages'].get(stage)
+        if base is None:
+            print(f"{stage:<28}{stats['p50_ms']:>12.2f}{'-':>12}{'-':>8}")
+            continue
+        ratio = stats['p50_ms'] / base['p50_ms'] if base['p50_ms'] else float('nan')
+        print(f"{stage:<28}{stats['p50_ms']:>12.2f}{base['p50_ms']:>12.2f}{ratio:>8.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the forecast pipeline stage by stage')
+    parser.add_argument('--products', type=int, default=1000,
+                      help='Synthetic products to generate (with --load)')
+    parser.add_argument('--days', type=int, default=730,
+                      help='Days of synthetic history (with --load)')
+    parser.add_argument('--intermittent-share', type=float, default=0.2,
+                      help='Share of low-volume intermittent products (with --load)')
+    parser.add_argument('--load', action='store_true',
+                      help='Replace ALL sales, products, oil prices and holidays with a synthetic dataset')
+    parser.add_argument('--sample', type=int, default=20,
+                      help='Products sampled for the per-product stages')
+    parser.add_argument('--forecast-days', type=int, default=30,
+                      help='Forecast horizon in days')
+    parser.add_argument('--no-prophet', action='store_true',
+                      help='Skip the Prophet fit/predict/persist stages')
+    parser.add_argument('--seed', type=int, default=0,
+                      help='Random seed for data generation and sampling')
+    parser.add_argument('--backends', type=str, default='',
+                      help=f'Comma-separated sales store backends to compare ({",".join(BACKENDS)})')
+    parser.add_argument('--output', type=str, default=None,
+                      help='Write the JSON results to this file')
+    parser.add_argument('--compare', type=str, default=None,
+                      help='Baseline JSON results to compare against')
+
+    args = parser.parse_args()
+    backends = [backend for backend in args.backends.split(',') if backend]
+    unknown = set(backends) - set(BACKENDS)
+    if unknown:
+        parser.error(f"unknown backends {sorted(unknown)}; choose from {BACKENDS}")
+    timer = StageTimer()
+    dataset = None
+
+    if args.load:
+        print(f"Generating {args.products:,} products x {args.days:,} days...")
+        data = timer.time('generate', synthetic_dataset, args.products, args.days,
+                          intermittent_share=args.intermittent_share, seed=args.seed,
+                          units=args.products * args.days)
+        print(f"Loading {len(data['sales']):,} sales rows...")
+        product_ids = timer.time('load', load_dataset, data, units=len(data['sales']))
+        dataset = {'products': args.products, 'days': args.days, 'rows': len(data['sales']),
+                   'intermittent_share': args.intermittent_share, 'seed': args.seed}
+        del data
+    else:
+        from batch_forecaster import get_all_product_ids
+        product_ids = get_all_product_ids()
+
+    print(f"Benchmarking {min(args.sample, len(product_ids))} of {len(product_ids):,} products...")
+    stages = timer.report()
+    stages.update(run_benchmark(product_ids, args.sample, args.forecast_days,
+                                prophet=not args.no_prophet, seed=args.seed, backends=backends))
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'dataset': dataset or {'products': len(product_ids)},
+        'config': {'sample': args.sample, 'forecast_days': args.forecast_days,
+                   'prophet': not args.no_prophet, 'backends': backends},
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': stages
+    }
+
+    print(f"\n{'stage':<28}{'count':>7}{'p50 ms':>12}{'p95 ms':>12}{'per sec':>12}{'rss MB':>9}")
+    for stage, stats in stages.items():
+        throughput = stats['throughput_per_second'] or 0
+        rss = stats['peak_rss_mb'] or 0
+        print(f"{stage:<28}{stats['count']:>7}{stats['p50_ms']:>12.2f}{stats['p95_ms']:>12.2f}"
+              f"{throughput:>12.1f}{rss:>9.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
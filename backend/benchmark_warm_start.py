@@ -0,0 +1,67 @@
+"""
+Before/after benchmark for warm-started incremental refits.
+
+For each product, fits a model on all history except the last N days (the
+"previous" fit), then times refitting on the full history both cold and
+warm-started from the previous fit's parameters.
+
+Usage:
+    python benchmark_warm_start.py --products 1,2,3 --new-days 1
+"""
+
+import argparse
+import time
+from batch_forecaster import get_all_product_ids
+from forecaster import InventoryForecaster, PROPHET_PARAMS, warm_start_params
+
+REGRESSORS = ['oil_price', 'is_holiday', 'on_promotion']
+
+
+def time_fit(df, init=None):
+    model = InventoryForecaster._new_model(PROPHET_PARAMS, REGRESSORS)
+    started = time.time()
+    if init is None:
+        model.fit(df[['ds', 'y'] + REGRESSORS])
+    else:
+        model.fit(df[['ds', 'y'] + REGRESSORS], init=init)
+    return model, time.time() - started
+
+
+def benchmark(product_ids, new_days=1):
+    forecaster = InventoryForecaster(model_cache=False, warm_start=False)
+    results = []
+
+    for product_id in product_ids:
+        df = forecaster.get_historical_data(product_id)
+        if len(df) <= new_days + 10:
+            continue
+
+        previous_model, _ = time_fit(df.iloc[:-new_days])
+        _, cold_seconds = time_fit(df)
+        _, warm_seconds = time_fit(df, init=warm_start_params(previous_model))
+        results.append((product_id, len(df), cold_seconds, warm_seconds))
+        print(f"  product {product_id}: {len(df)} rows, cold {cold_seconds:.2f}s, warm {warm_seconds:.2f}s")
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark cold vs warm-started refits')
+    parser.add_argument('--products', type=str, default=None,
+                      help='Comma-separated product ids (default: first 10 products)')
+    parser.add_argument('--new-days', type=int, default=1,
+                      help='Number of newly arrived days to simulate')
+
+    args = parser.parse_args()
+    product_ids = [int(p) for p in args.products.split(',')] if args.products else get_all_product_ids()[:10]
+
+    print(f"Benchmarking {len(product_ids)} products with {args.new_days} new day(s)...")
+    results = benchmark(product_ids, args.new_days)
+
+    if results:
+        cold_total = sum(r[2] for r in results)
+        warm_total = sum(r[3] for r in results)
+        print("\n" + "="*60)
+        print(f"Cold refit total: {cold_total:.2f}s")
+        print(f"Warm refit total: {warm_total:.2f}s")
+        print(f"Speedup: {cold_total / warm_total:.2f}x")
@@ -8,3 +8,45 @@ class Config:
     FLASK_ENV = os.getenv('FLASK_ENV', 'development')
     FLASK_PORT = int(os.getenv('FLASK_PORT', 5000))
     DEBUG = FLASK_ENV == 'development'
+    BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', 0)) or None
+    BATCH_TIMEOUT = int(os.getenv('BATCH_TIMEOUT', 600))
+    USE_HISTORY_PANEL = os.getenv('USE_HISTORY_PANEL', 'false').lower() == 'true'
+    DB_POOL_ENABLED = os.getenv('DB_POOL_ENABLED', 'true').lower() == 'true'
+    DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))
+    DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 10))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+    DB_POOL_HEALTH_CHECK_INTERVAL = int(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', 30))
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 2.0))
+    JOB_STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', 1800))
+    WEB_WORKERS = int(os.getenv('WEB_WORKERS', 2))
+    WEB_THREADS = int(os.getenv('WEB_THREADS', 8))
+    WEB_TIMEOUT = int(os.getenv('WEB_TIMEOUT', 120))
+    PRELOAD_FORECASTING = os.getenv('PRELOAD_FORECASTING', 'true').lower() == 'true'
+    MODEL_CACHE_ENABLED = os.getenv('MODEL_CACHE_ENABLED', 'true').lower() == 'true'
+    MODEL_CACHE_DIR = os.getenv('MODEL_CACHE_DIR', os.path.join(os.path.dirname(__file__), '..', 'data', 'model_cache'))
+    MODEL_CACHE_MAX_ENTRIES = int(os.getenv('MODEL_CACHE_MAX_ENTRIES', 500))
+    MODEL_CACHE_MAX_MB = int(os.getenv('MODEL_CACHE_MAX_MB', 512))
+    WARM_START_ENABLED = os.getenv('WARM_START_ENABLED', 'true').lower() == 'true'
+    FORECAST_ENGINE = os.getenv('FORECAST_ENGINE', 'auto')
+    STAT_HISTORY_DAYS = int(os.getenv('STAT_HISTORY_DAYS', 365))
+    INTERMITTENT_ZERO_SHARE = float(os.getenv('INTERMITTENT_ZERO_SHARE', 0.5))
+    ENGINE_ESCALATION_MARGIN = float(os.getenv('ENGINE_ESCALATION_MARGIN', 0.1))
+    RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 300))
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1000))
+    RESPONSE_CACHE_SHARED = os.getenv('RESPONSE_CACHE_SHARED', 'false').lower() == 'true'
+    RESPONSE_CACHE_DIR = os.getenv('RESPONSE_CACHE_DIR', os.path.join(os.path.dirname(__file__), '..', 'data', 'response_cache'))
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(__file__), '..', 'data', 'profiles'))
+    CALENDAR_VERSION_FILE = os.getenv('CALENDAR_VERSION_FILE', os.path.join(os.path.dirname(__file__), '..', 'data', 'regressor_calendar.version'))
+    HISTORY_PANEL_VERSION_FILE = os.getenv('HISTORY_PANEL_VERSION_FILE', os.path.join(os.path.dirname(__file__), '..', 'data', 'history_panel.version'))
+    SALES_ARCHIVE_DIR = os.getenv('SALES_ARCHIVE_DIR', os.path.join(os.path.dirname(__file__), '..', 'data', 'sales_archive'))
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'postgres')
+    WAREHOUSE_DIR = os.getenv('WAREHOUSE_DIR', os.path.join(os.path.dirname(__file__), '..', 'data', 'warehouse'))
+    SCHEDULER_CRON = os.getenv('SCHEDULER_CRON', '0 2 * * *')
+    SCHEDULER_DEBOUNCE_SECONDS = int(os.getenv('SCHEDULER_DEBOUNCE_SECONDS', 60))
+    SCHEDULER_BUDGET_SECONDS = int(os.getenv('SCHEDULER_BUDGET_SECONDS', 3600))
+    SCHEDULER_CONCURRENCY = int(os.getenv('SCHEDULER_CONCURRENCY', 2))
+    SCHEDULER_FORECAST_DAYS = int(os.getenv('SCHEDULER_FORECAST_DAYS', 30))
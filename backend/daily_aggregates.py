@@ -0,0 +1,176 @@
+"""
+Maintenance of the sales_daily rollup table.
+
+sales_daily holds one row per product and day with quantities summed and the
+oil price (forward/backward filled over the calendar) and national-holiday
+flag already resolved, with the same rules as regressor_calendar.py, so the
+forecaster, the history panel and /api/historical read it directly instead of
+grouping sales_data and joining oil_prices/holidays on every request.
+
+Usage:
+    python daily_aggregates.py                       # full rebuild
+    python daily_aggregates.py --since 2017-08-01    # incremental refresh
+    python daily_aggregates.py --benchmark 1         # EXPLAIN ANALYZE raw vs rollup
+"""
+
+import argparse
+import time
+from database import get_db_connection
+from partitions import clear_sales, ensure_partitions
+from history_panel import invalidate_history_panel
+from response_cache import invalidate_responses
+from storage import refresh_sales_store
+
+REFRESH_QUERY = """
+    INSERT INTO sales_daily
+        (product_id, sale_date, quantity_sold, total_amount, on_promotion, oil_price, is_holiday)
+    WITH days AS (
+        SELECT
+            product_id,
+            sale_date,
+            SUM(quantity_sold) AS quantity_sold,
+            SUM(total_amount) AS total_amount,
+            SUM(on_promotion) AS on_promotion
+        FROM sales_data
+        WHERE {where}
+        GROUP BY product_id, sale_date
+    ),
+    calendar AS (
+        SELECT
+            d.sale_date,
+            COALESCE(
+                (SELECT o.dcoilwtico FROM oil_prices o
+                 WHERE o.date <= d.sale_date AND o.dcoilwtico IS NOT NULL
+                 ORDER BY o.date DESC LIMIT 1),
+                (SELECT o.dcoilwtico FROM oil_prices o
+                 WHERE o.dcoilwtico IS NOT NULL
+                 ORDER BY o.date LIMIT 1)
+            ) AS oil_price,
+            CASE WHEN EXISTS (
+                SELECT 1 FROM holidays h
+                WHERE h.date = d.sale_date AND h.locale = 'National'
+                AND NOT COALESCE(h.transferred, FALSE) AND COALESCE(h.type, '') <> 'Work Day'
+            ) THEN 1 ELSE 0 END AS is_holiday
+        FROM (SELECT DISTINCT sale_date FROM days) d
+    )
+    SELECT
+        days.product_id, days.sale_date, days.quantity_sold, days.total_amount,
+        days.on_promotion, calendar.oil_price, calendar.is_holiday
+    FROM days
+    JOIN calendar ON calendar.sale_date = days.sale_date
+"""
+
+# The pre-rollup read path, kept for the EXPLAIN benchmark
+RAW_HISTORY_QUERY = """
+    SELECT
+        s.sale_date as ds,
+        SUM(s.quantity_sold) as y,
+        SUM(s.on_promotion) as on_promotion,
+        o.dcoilwtico as oil_price,
+        CASE WHEN h.date IS NOT NULL THEN 1 ELSE 0 END as is_holiday
+    FROM sales_data s
+    LEFT JOIN oil_prices o ON s.sale_date = o.date
+    LEFT JOIN holidays h ON s.sale_date = h.date AND h.locale = 'National'
+    WHERE s.product_id = %s
+    GROUP BY s.sale_date, o.dcoilwtico, h.date
+    ORDER BY s.sale_date
+"""
+
+ROLLUP_HISTORY_QUERY = """
+    SELECT sale_date as ds, quantity_sold as y, on_promotion, oil_price, is_holiday
+    FROM sales_daily
+    WHERE product_id = %s
+    ORDER BY sale_date
+"""
+
+
+def refresh_sales_daily(conn=None, since=None, product_ids=None):
+    """Rebuild sales_daily, fully or only for recent dates / some products
+
+    Args:
+        conn: Connection to use (committed by the caller), or None for a new one
+        since: Only rebuild rows with sale_date >= since
+        product_ids: Only rebuild these products
+
+    Returns:
+        Number of rollup rows written
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    cur = conn.cursor()
+
+    conditions, params = [], []
+    if since is not None:
+        conditions.append("sale_date >= %s")
+        params.append(since)
+    if product_ids is not None:
+        conditions.append("product_id = ANY(%s)")
+        params.append(list(product_ids))
+
+    where = ' AND '.join(conditions) or 'TRUE'
+    if since is None and product_ids is None:
+        # Full rebuild: whole monthly partitions are truncated rather than deleted from
+        clear_sales(cur, 'sales_daily')
+    else:
+        # DELETE takes row locks only (TRUNCATE would take ACCESS EXCLUSIVE locks
+        # and block every history read until the refresh commits)
+        cur.execute(f"DELETE FROM sales_daily WHERE {where}", params)
+
+    cur.execute(f"SELECT MIN(sale_date) AS first, MAX(sale_date) AS last FROM sales_data WHERE {where}", params)
+    bounds = cur.fetchone()
+    ensure_partitions(cur, 'sales_daily', bounds['first'], bounds['last'])
+
+    cur.execute(REFRESH_QUERY.format(where=where), params)
+    rows = cur.rowcount
+    cur.execute("ANALYZE sales_daily")
+    cur.close()
+
+    if own_conn:
+        conn.commit()
+        conn.close()
+        invalidate_responses('sales')
+        refresh_sales_store(since)
+        invalidate_history_panel()
+    return rows
+
+
+def _explain_ms(cur, query, params):
+    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + query, params)
+    plan = cur.fetchone()
+    plan = plan['QUERY PLAN'] if isinstance(plan, dict) else plan[0]
+    return plan[0]['Planning Time'] + plan[0]['Execution Time']
+
+
+def benchmark_read_paths(product_id, repeat=5):
+    """EXPLAIN ANALYZE the raw join vs the rollup read for one product
+
+    Returns the best planning + execution time of each in milliseconds.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    raw = min(_explain_ms(cur, RAW_HISTORY_QUERY, (product_id,)) for _ in range(repeat))
+    rollup = min(_explain_ms(cur, ROLLUP_HISTORY_QUERY, (product_id,)) for _ in range(repeat))
+    cur.close()
+    conn.close()
+    return {'raw_ms': raw, 'rollup_ms': rollup}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Maintain the sales_daily rollup table')
+    parser.add_argument('--since', type=str, default=None,
+                      help='Only refresh dates on or after YYYY-MM-DD')
+    parser.add_argument('--benchmark', type=int, default=None, metavar='PRODUCT_ID',
+                      help='Compare raw vs rollup history query latency for a product')
+
+    args = parser.parse_args()
+
+    if args.benchmark is not None:
+        result = benchmark_read_paths(args.benchmark)
+        print(f"Raw sales_data join: {result['raw_ms']:.2f} ms")
+        print(f"sales_daily rollup:  {result['rollup_ms']:.2f} ms")
+        print(f"Speedup: {result['raw_ms'] / result['rollup_ms']:.1f}x")
+    else:
+        started = time.time()
+        rows = refresh_sales_daily(since=args.since)
+        print(f"Refreshed {rows:,} sales_daily rows in {time.time() - started:.1f}s")
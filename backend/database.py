@@ -1,12 +1,271 @@
+import io
+import os
+import threading
+import time
+from contextlib import contextmanager
+import pandas as pd
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
 from config import Config
+from metrics import InstrumentedCursor
+
+
+# Cursor class for every connection; InstrumentedCursor feeds db_query_seconds
+CURSOR_FACTORY = InstrumentedCursor if Config.METRICS_ENABLED else RealDictCursor
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available in time"""
+
+
+class PooledConnection:
+    """Proxy for a pooled psycopg2 connection
+
+    Behaves like the underlying connection, except close() hands it back to the
+    pool instead of closing the socket, so existing get/close call sites keep
+    working unchanged. As a context manager it commits on success, rolls back
+    on error and then returns the connection.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise psycopg2.InterfaceError('connection already returned to pool')
+        return getattr(self._conn, name)
+
+    @property
+    def closed(self):
+        return self._conn is None or self._conn.closed
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.putconn(self._conn)
+            self._conn = None
+
+    def __del__(self):
+        # Safety net for call sites that raise before reaching close()
+        if getattr(self, '_conn', None) is not None:
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._conn is not None and not self._conn.closed:
+                if exc_type is None:
+                    self._conn.commit()
+                else:
+                    self._conn.rollback()
+        finally:
+            self.close()
+        return False
+
+
+class ConnectionPool:
+    """Thread-safe, bounded psycopg2 connection pool with health checks
+
+    Blocks up to `timeout` seconds when all `maxconn` connections are checked
+    out. Connections idle for longer than `health_check_interval` seconds are
+    pinged with SELECT 1 before being handed out and replaced if dead.
+    """
+
+    def __init__(self, dsn, minconn, maxconn, timeout=30, health_check_interval=30):
+        self._pool = ThreadedConnectionPool(minconn, maxconn, dsn, cursor_factory=CURSOR_FACTORY)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._stats = {'checkouts': 0, 'in_use': 0, 'discarded': 0, 'timeouts': 0, 'wait_seconds': 0.0}
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if time.time() - self._last_used.get(id(conn), 0) < self.health_check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        started = time.time()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise PoolTimeout(f"No database connection available within {self.timeout}s")
+
+        try:
+            conn = self._pool.getconn()
+            while not self._is_healthy(conn):
+                self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+                with self._lock:
+                    self._stats['discarded'] += 1
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['in_use'] += 1
+            self._stats['wait_seconds'] += time.time() - started
+        return PooledConnection(self, conn)
+
+    def putconn(self, conn):
+        try:
+            if not conn.closed and conn.autocommit:
+                conn.autocommit = False
+            if conn.closed:
+                self._last_used.pop(id(conn), None)
+            else:
+                self._last_used[id(conn)] = time.time()
+            self._pool.putconn(conn, close=conn.closed)
+        finally:
+            with self._lock:
+                self._stats['in_use'] -= 1
+            self._slots.release()
+
+    def closeall(self):
+        self._pool.closeall()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            'min_size': self.minconn,
+            'max_size': self.maxconn,
+            'idle': len(self._pool._pool),
+            'open': len(self._pool._pool) + stats['in_use']
+        })
+        return stats
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+# Pools inherited from a parent process. Their connections share the parent's
+# sockets, so a forked child keeps them referenced and never closes them:
+# deallocating a psycopg2 connection sends Terminate and ends the parent's session.
+_inherited_pools = []
+
+
+def _detach_pool():
+    """After fork: set the parent's pool aside so the child opens its own"""
+    global _pool, _pool_pid, _pool_lock
+    if _pool is not None:
+        _inherited_pools.append(_pool)
+    _pool = None
+    _pool_pid = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_detach_pool)
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use
+
+    A forked child (e.g. a batch forecast worker) gets its own pool rather
+    than sharing the parent's sockets.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            if _pool is not None:
+                _inherited_pools.append(_pool)
+            _pool = ConnectionPool(
+                Config.DATABASE_URL,
+                minconn=Config.DB_POOL_MIN,
+                maxconn=Config.DB_POOL_MAX,
+                timeout=Config.DB_POOL_TIMEOUT,
+                health_check_interval=Config.DB_POOL_HEALTH_CHECK_INTERVAL
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def get_pool_stats():
+    """Pool statistics, or None when pooling is disabled or not yet used"""
+    if not Config.DB_POOL_ENABLED or _pool is None or _pool_pid != os.getpid():
+        return None
+    return _pool.stats()
+
 
 def get_db_connection():
-    """Create and return a database connection"""
-    conn = psycopg2.connect(Config.DATABASE_URL, cursor_factory=RealDictCursor)
+    """Create and return a database connection
+
+    Returns a pooled connection when DB_POOL_ENABLED is set; calling close()
+    on it returns it to the pool.
+    """
+    if Config.DB_POOL_ENABLED:
+        return get_pool().getconn()
+    conn = psycopg2.connect(Config.DATABASE_URL, cursor_factory=CURSOR_FACTORY)
     return conn
 
+
+@contextmanager
+def db_connection():
+    """Context manager yielding a connection; commits on success, rolls back on error"""
+    conn = get_db_connection()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def copy_dataframe(cur, df, table, columns):
+    """Stream DataFrame columns into a table with COPY FROM STDIN (CSV)
+
+    Missing values are written as empty fields, which COPY loads as NULL.
+    Returns the number of rows copied.
+    """
+    buf = io.StringIO()
+    df[columns].to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+    return len(df)
+
+
+def query_frame(query, params=None, parse_dates=None, dtype=None, conn=None):
+    """Run a SELECT through COPY ... TO STDOUT and load it as a DataFrame
+
+    Columns arrive as NumPy arrays parsed by read_csv rather than as one dict
+    per row. NULLs become NaN.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    cur = conn.cursor()
+
+    sql = cur.mogrify(query, params).decode() if params is not None else query
+    buf = io.BytesIO()
+    cur.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)", buf)
+    cur.close()
+    if own_conn:
+        conn.close()
+
+    buf.seek(0)
+    return pd.read_csv(buf, parse_dates=parse_dates, dtype=dtype)
+
+
 def init_db():
     """Initialize the database with schema"""
     conn = get_db_connection()
@@ -0,0 +1,85 @@
+"""
+Time-bucket aggregation and visual downsampling of chart series.
+
+    bucket   day / week / month totals. The SQL read paths aggregate with
+             date_trunc; bucket_frame() does the same in pandas for data
+             already in memory (history panel, archived months). Weeks start
+             on Monday, as with date_trunc('week'). A days_back window is
+             widened back to the start of its first bucket (bucket_start) so
+             the leading bucket is complete, and every bucketed row carries
+             `days`, the number of daily rows summed into it, so the partial
+             trailing bucket (and a forecast's partial leading one) can be told
+             apart.
+    points   Largest-Triangle-Three-Buckets (LTTB) selection of at most N
+             rows per series. It keeps the first and last row and, from each
+             bucket of rows in between, the one forming the largest triangle
+             with its neighbours, so peaks and dips survive.
+
+Bucketing changes the values (sums); LTTB only drops rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+BUCKETS = ['day', 'week', 'month']
+
+PERIODS = {'week': 'W-SUN', 'month': 'M'}
+
+
+def bucket_start(day, bucket):
+    """First day of the week/month containing `day` (`day` itself for 'day')"""
+    day = pd.Timestamp(day)
+    return day if bucket == 'day' else day.to_period(PERIODS[bucket]).start_time
+
+
+def bucket_frame(df, date_column, value_columns, bucket, by=None):
+    """Sum value_columns per week/month (labelled by the bucket's first day)
+
+    Adds a `days` column with the number of rows summed into each bucket.
+    """
+    if bucket == 'day':
+        return df
+    keys = [by] if by else []
+    if df.empty:
+        return df[keys + [date_column] + list(value_columns)].assign(days=pd.Series(dtype='int64'))
+    starts = pd.to_datetime(df[date_column]).dt.to_period(PERIODS[bucket]).dt.start_time
+    out = df.assign(**{date_column: starts}).groupby(keys + [date_column], as_index=False, sort=True)
+    return out.agg(**{name: (name, 'sum') for name in value_columns}, days=(date_column, 'size'))
+
+
+def lttb_indices(x, y, threshold):
+    """Row positions LTTB keeps to draw y against x with `threshold` points"""
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+
+    # Bucket edges for the n - 2 inner points
+    edges = (np.floor(np.arange(threshold - 1) * (n - 2) / (threshold - 2)) + 1).astype(int)
+    edges[-1] = n - 1
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (the last point for the final bucket)
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(df, date_column, value_column, points, by=None):
+    """Keep at most `points` rows per series (per `by` value) chosen by LTTB"""
+    if not points or df.empty:
+        return df
+    groups = [df] if by is None else [group for _, group in df.groupby(by, sort=False)]
+    kept = []
+    for group in groups:
+        days = pd.to_datetime(group[date_column]).to_numpy().astype('datetime64[D]').astype(np.int64)
+        kept.append(group.iloc[lttb_indices(days, group[value_column].to_numpy(), points)])
+    return pd.concat(kept, ignore_index=True)
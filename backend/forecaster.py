@@ -1,70 +1,198 @@
+import time
+import numpy as np
 import pandas as pd
-from prophet import Prophet
-from database import get_db_connection
+from psycopg2.extras import execute_values
+from config import Config
+from database import get_db_connection, copy_dataframe
+from storage import get_sales_store
+from model_cache import get_model_cache
+from response_cache import invalidate_responses
+from regressor_calendar import get_regressor_calendar
+from metrics import span, timed
+from model_engines import get_engine, history_matrix, forecast_frames, select_engines, load_backtest_errors
+from global_model import get_global_model
 from datetime import datetime, timedelta
 
-class InventoryForecaster:
-    def __init__(self):
-        self.model = None
+FORECAST_COLUMNS = ['product_id', 'forecast_date', 'predicted_quantity', 'lower_bound', 'upper_bound']
+
+# Prophet settings for the production forecast model
+PROPHET_PARAMS = {
+    'yearly_seasonality': True,
+    'weekly_seasonality': True,
+    'daily_seasonality': False,
+    'interval_width': 0.95  # 95% confidence interval
+}
+
+def warm_start_params(model):
+    """Extract fitted Stan parameters (k, m, sigma_obs, delta, beta) to initialise a refit"""
+    params = {}
+    for name in ['k', 'm', 'sigma_obs']:
+        if model.mcmc_samples == 0:
+            params[name] = model.params[name][0][0]
+        else:
+            params[name] = np.mean(model.params[name])
+    for name in ['delta', 'beta']:
+        if model.mcmc_samples == 0:
+            params[name] = model.params[name][0]
+        else:
+            params[name] = np.mean(model.params[name], axis=0)
+    return params
 
-    def get_historical_data(self, product_id, days_back=None):
-        """Fetch historical sales data for a product with external regressors
+class InventoryForecaster:
+    """Forecasting API; holds configuration only, so one instance can serve
+    concurrent requests (fitted models are returned, never stored on self)"""
+
+    def __init__(self, model_cache=None, warm_start=None, engine=None):
+        # model_cache=False disables caching for this instance
+        self.model_cache = get_model_cache() if model_cache is None else (model_cache or None)
+        self.warm_start = Config.WARM_START_ENABLED if warm_start is None else warm_start
+        self.engine = engine or Config.FORECAST_ENGINE
+
+    @staticmethod
+    def _new_model(params, regressors):
+        # Imported on first fit so the API starts without loading Prophet/Stan
+        from prophet import Prophet
+        model = Prophet(**params)
+        for regressor in regressors:
+            model.add_regressor(regressor)
+        return model
+
+    def fit_model(self, product_id, train_df, params, regressors=(), warm_start=False, timeout=None):
+        """Fit a Prophet model, or load it from the cache if the data is unchanged
 
         Args:
-            product_id: ID of the product
-            days_back: Number of days back to fetch, or None for all data
+            product_id: ID of the product (part of the cache key)
+            train_df: Training data with ds, y and the regressor columns
+            params: Prophet constructor arguments
+            regressors: Names of extra regressor columns to add
+            warm_start: Initialise the optimizer from the product's previous fit
+            timeout: Seconds after which cmdstanpy kills the Stan process and
+                raises TimeoutError
+
+        Returns:
+            (model, fit) where fit has cached, warm_started, engine and seconds
+        """
+        regressors = list(regressors)
+        columns = ['ds', 'y'] + regressors
+        config = {'params': params, 'regressors': regressors}
+
+        if self.model_cache is not None:
+            model = self.model_cache.get(product_id, config, train_df, columns)
+            if model is not None:
+                return model, {'cached': True, 'warm_started': False, 'engine': 'prophet', 'seconds': 0.0}
+
+        init = None
+        if warm_start and self.model_cache is not None:
+            previous = self.model_cache.get_latest(product_id, config)
+            if previous is not None:
+                init = warm_start_params(previous)
+
+        started = time.time()
+        stan_args = {'timeout': timeout} if timeout else {}
+        model = self._new_model(params, regressors)
+        if init is not None:
+            try:
+                model.fit(train_df[columns], init=init, **stan_args)
+            except TimeoutError:
+                raise
+            except Exception:
+                # Parameter shapes can change (e.g. fewer changepoints); refit cold
+                init = None
+                model = self._new_model(params, regressors)
+                if timeout:
+                    stan_args['timeout'] = max(timeout - (time.time() - started), 1)
+                model.fit(train_df[columns], **stan_args)
+        else:
+            model.fit(train_df[columns], **stan_args)
+
+        fit = {'cached': False, 'warm_started': init is not None, 'engine': 'prophet',
+               'seconds': time.time() - started}
+        if self.model_cache is not None:
+            self.model_cache.put(product_id, config, train_df, columns, model)
+        return model, fit
+
+    def record_fit(self, product_id, df, fit):
+        """Store the last sale date the product's production model was trained on
+
+        A cached model keeps the fit_seconds of the fit that produced it.
         """
+        self.record_fits([(product_id, df['ds'].max().date(), len(df), None if fit['cached'] else fit['seconds'],
+                           fit['warm_started'], fit['engine'])])
+
+    @staticmethod
+    def record_fits(fits):
+        """Upsert model_fits rows of (product_id, fitted_through, training_rows,
+        fit_seconds, warm_started, engine); a None fit_seconds keeps the stored one"""
         conn = get_db_connection()
         cur = conn.cursor()
+        execute_values(
+            cur,
+            """
+            INSERT INTO model_fits
+                (product_id, fitted_through, training_rows, fit_seconds, warm_started, engine)
+            VALUES %s
+            ON CONFLICT (product_id) DO UPDATE SET
+                fitted_through = EXCLUDED.fitted_through,
+                training_rows = EXCLUDED.training_rows,
+                fit_seconds = COALESCE(EXCLUDED.fit_seconds, model_fits.fit_seconds),
+                warm_started = EXCLUDED.warm_started,
+                engine = EXCLUDED.engine,
+                fitted_at = CURRENT_TIMESTAMP
+            """,
+            fits,
+            page_size=1000
+        )
+        conn.commit()
+        cur.close()
+        conn.close()
 
-        if days_back is None:
-            # Get all available data with regressors
-            query = """
-                SELECT
-                    s.sale_date as ds,
-                    SUM(s.quantity_sold) as y,
-                    SUM(s.on_promotion) as on_promotion,
-                    o.dcoilwtico as oil_price,
-                    CASE WHEN h.date IS NOT NULL THEN 1 ELSE 0 END as is_holiday
-                FROM sales_data s
-                LEFT JOIN oil_prices o ON s.sale_date = o.date
-                LEFT JOIN holidays h ON s.sale_date = h.date AND h.locale = 'National'
-                WHERE s.product_id = %s
-                GROUP BY s.sale_date, o.dcoilwtico, h.date
-                ORDER BY s.sale_date
+    def get_products_with_new_data(self):
+        """Product ids whose latest sale_date is newer than their last model fit"""
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute(
             """
-            cur.execute(query, (product_id,))
-        else:
-            # Get data from last N days with regressors
-            query = """
-                SELECT
-                    s.sale_date as ds,
-                    SUM(s.quantity_sold) as y,
-                    SUM(s.on_promotion) as on_promotion,
-                    o.dcoilwtico as oil_price,
-                    CASE WHEN h.date IS NOT NULL THEN 1 ELSE 0 END as is_holiday
-                FROM sales_data s
-                LEFT JOIN oil_prices o ON s.sale_date = o.date
-                LEFT JOIN holidays h ON s.sale_date = h.date AND h.locale = 'National'
-                WHERE s.product_id = %s
-                AND s.sale_date >= CURRENT_DATE - INTERVAL '%s days'
-                GROUP BY s.sale_date, o.dcoilwtico, h.date
-                ORDER BY s.sale_date
+            SELECT s.product_id
+            FROM sales_daily s
+            LEFT JOIN model_fits f ON f.product_id = s.product_id
+            GROUP BY s.product_id, f.fitted_through
+            HAVING f.fitted_through IS NULL OR MAX(s.sale_date) > f.fitted_through
+            ORDER BY s.product_id
             """
-            cur.execute(query, (product_id, days_back))
-
-        rows = cur.fetchall()
+        )
+        product_ids = [row['product_id'] for row in cur.fetchall()]
         cur.close()
         conn.close()
+        return product_ids
+
+    def get_historical_data(self, product_id, days_back=None, panel=None):
+        """Fetch historical sales data for a product with external regressors
 
-        # Convert to DataFrame
+        Args:
+            product_id: ID of the product
+            days_back: Number of days back to fetch, or None for all data
+            panel: Optional preloaded HistoryPanel to slice instead of querying
+        """
+        if panel is not None:
+            since = None
+            if days_back is not None:
+                since = (datetime.now() - timedelta(days=days_back)).date()
+            return panel.frame(product_id, since=since)
+
+        rows = get_sales_store().product_history(product_id, days_back)
+        return self.history_frame(rows)
+
+    @staticmethod
+    def history_frame(rows):
+        """Forecaster-shaped DataFrame from sales_daily history rows"""
         df = pd.DataFrame(rows)
         if not df.empty:
             df['ds'] = pd.to_datetime(df['ds'])
 
-            # Fill missing oil prices with forward fill then backward fill
+            # Oil prices are already filled over the calendar by the rollup;
+            # NULL only remains when no oil prices were imported at all
             if 'oil_price' in df.columns:
-                df['oil_price'] = df['oil_price'].fillna(method='ffill').fillna(method='bfill').fillna(0)
+                df['oil_price'] = df['oil_price'].astype(float).fillna(0)
 
             # Ensure numeric columns
             df['on_promotion'] = df['on_promotion'].fillna(0).astype(float)
@@ -72,67 +200,122 @@ class InventoryForecaster:
 
         return df
 
-    def train_and_forecast(self, product_id, forecast_days=30):
-        """Train Prophet model with external regressors and generate forecasts"""
-        # Get historical data with regressors
-        df = self.get_historical_data(product_id)
-
-        if df.empty or len(df) < 10:
-            raise ValueError(f"Insufficient data for product {product_id}")
-
-        # Initialize Prophet model
-        self.model = Prophet(
-            yearly_seasonality=True,
-            weekly_seasonality=True,
-            daily_seasonality=False,
-            interval_width=0.95  # 95% confidence interval
-        )
-
-        # Add regressors if data available
+    @staticmethod
+    def available_regressors(df):
+        """Regressor columns the production model uses for this history"""
         has_oil = 'oil_price' in df.columns and df['oil_price'].notna().any()
         has_holiday = 'is_holiday' in df.columns
         has_promo = 'on_promotion' in df.columns and df['on_promotion'].notna().any()
 
-        if has_oil:
-            self.model.add_regressor('oil_price')
-        if has_holiday:
-            self.model.add_regressor('is_holiday')
-        if has_promo:
-            self.model.add_regressor('on_promotion')
-
-        # Fit model with available regressors
-        self.model.fit(df[['ds', 'y'] + [col for col in ['oil_price', 'is_holiday', 'on_promotion'] if col in df.columns]])
-
-        # Create future dataframe
-        future = self.model.make_future_dataframe(periods=forecast_days)
+        return [name for name, available in (('oil_price', has_oil),
+                                             ('is_holiday', has_holiday),
+                                             ('on_promotion', has_promo)) if available]
+
+    def select_engine(self, product_id, df):
+        """Engine the auto policy picks for one product (see model_engines.select_engines)"""
+        errors = load_backtest_errors([product_id]).get(product_id)
+        return select_engines(history_matrix(df), [errors])[0]
+
+    def statistical_forecast(self, df, forecast_days, engine):
+        """Forecast one history with a vectorized statistical engine; returns (forecast, fit)"""
+        started = time.time()
+        yhat, lower, upper = get_engine(engine).forecast(history_matrix(df), forecast_days)
+        fit = {'cached': False, 'warm_started': False, 'engine': engine, 'seconds': time.time() - started}
+        return forecast_frames(df['ds'].max(), yhat, lower, upper)[0], fit
+
+    def global_forecast(self, df, forecast_days):
+        """Forecast one history with the shared global model; returns (forecast, fit)"""
+        started = time.time()
+        y = history_matrix(df, days=Config.STAT_HISTORY_DAYS)
+        promo = (history_matrix(df, days=Config.STAT_HISTORY_DAYS, column='on_promotion')
+                 if 'on_promotion' in df.columns else np.zeros_like(y))
+        last_date = np.datetime64(df['ds'].max().date(), 'D')
+        dates = last_date - np.arange(len(y) - 1, -1, -1)
+        yhat, lower, upper = get_global_model().predict(y, np.nan_to_num(promo), dates, forecast_days)
+        fit = {'cached': False, 'warm_started': False, 'engine': 'global', 'seconds': time.time() - started}
+        return forecast_frames(df['ds'].max(), yhat, lower, upper)[0], fit
+
+    @staticmethod
+    def future_frame(model, df, forecast_days, regressors):
+        """Horizon dates after the history with future regressor values filled in"""
+        # Create future dataframe (horizon only; history is not returned)
+        future = model.make_future_dataframe(periods=forecast_days, include_history=False)
 
         # Add future regressor values
-        if has_oil:
+        if 'oil_price' in regressors:
             # Use last known oil price for future predictions
             last_oil_price = df['oil_price'].iloc[-1] if not df['oil_price'].isna().all() else 0
             future['oil_price'] = last_oil_price
 
-        if has_holiday:
-            # Get future holidays from database
-            conn = get_db_connection()
-            cur = conn.cursor()
-            max_date = future['ds'].max().date()
-            cur.execute(
-                "SELECT date FROM holidays WHERE locale = 'National' AND date > %s AND date <= %s",
-                (df['ds'].max().date(), max_date)
-            )
-            future_holidays = [row['date'] for row in cur.fetchall()]
-            cur.close()
-            conn.close()
-
-            future['is_holiday'] = future['ds'].apply(lambda x: 1 if x.date() in future_holidays else 0)
-
-        if has_promo:
+        if 'is_holiday' in regressors:
+            with span('holiday_lookup'):
+                # National holidays from the shared calendar (no per-product query)
+                future['is_holiday'] = get_regressor_calendar().is_holiday(future['ds'].values)
+
+        if 'on_promotion' in regressors:
             # Assume no future promotions (conservative forecast)
             future['on_promotion'] = 0
 
+        return future
+
+    def train_and_forecast(self, product_id, forecast_days=30, history=None, record=True, engine=None,
+                           timeout=None):
+        """Train the selected model with external regressors and generate forecasts
+
+        Args:
+            product_id: ID of the product (or a cache key for non-product series)
+            forecast_days: Number of days to forecast
+            history: Optional pre-fetched history DataFrame (see get_historical_data)
+            record: Store the fit watermark in model_fits (products only)
+            engine: 'prophet', 'global', a statistical engine or 'auto' (default: self.engine)
+            timeout: Prophet only; seconds before the Stan fit is killed (TimeoutError)
+        """
+        # Get historical data with regressors
+        if history is None:
+            with span('history_fetch'):
+                history = self.get_historical_data(product_id)
+        df = history
+
+        if df.empty or len(df) < 10:
+            raise ValueError(f"Insufficient data for product {product_id}")
+
+        engine = engine or self.engine
+        if engine == 'auto':
+            with span('select_engine'):
+                engine = self.select_engine(product_id, df)
+        if engine == 'global':
+            with span('global_forecast'):
+                forecast, fit = self.global_forecast(df, forecast_days)
+            if record:
+                with span('record_fit'):
+                    self.record_fit(product_id, df, fit)
+            return forecast
+        if engine != 'prophet':
+            with span('statistical_forecast', engine=engine):
+                forecast, fit = self.statistical_forecast(df, forecast_days, engine)
+            if record:
+                with span('record_fit'):
+                    self.record_fit(product_id, df, fit)
+            return forecast
+
+        # Add regressors if data available
+        regressors = self.available_regressors(df)
+
+        # Fit model with available regressors (skipped if cached for identical data,
+        # warm-started from the previous fit if only new rows were added)
+        with span('fit'):
+            model, fit = self.fit_model(product_id, df, PROPHET_PARAMS, regressors, warm_start=self.warm_start,
+                                        timeout=timeout)
+        if record:
+            with span('record_fit'):
+                self.record_fit(product_id, df, fit)
+
+        with span('future_frame'):
+            future = self.future_frame(model, df, forecast_days, regressors)
+
         # Make predictions
-        forecast = self.model.predict(future)
+        with span('predict'):
+            forecast = model.predict(future)
 
         # Return only future predictions
         future_forecast = forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(forecast_days)
@@ -141,25 +324,90 @@ class InventoryForecaster:
 
     def save_forecast(self, product_id, forecast_df):
         """Save forecast results to database"""
+        return self.save_forecasts({product_id: forecast_df})
+
+    @timed('save_forecasts')
+    def save_forecasts(self, forecasts):
+        """Save forecasts for many products in a single transaction
+
+        Rows are COPYed into a temp staging table, upserted on
+        (product_id, forecast_date) and stamped with a new forecast run id;
+        rows from earlier runs that the new set does not cover are then
+        removed. Readers see either the complete old set or the complete new
+        one, never an empty or partial forecast.
+
+        Args:
+            forecasts: Dict mapping product_id to a forecast DataFrame
+
+        Returns:
+            The run_id of this write
+        """
+        staging = pd.concat([
+            pd.DataFrame({
+                'product_id': product_id,
+                'forecast_date': forecast_df['ds'].dt.date,
+                'predicted_quantity': forecast_df['yhat'].clip(lower=0).round(2),
+                'lower_bound': forecast_df['yhat_lower'].clip(lower=0).round(2),
+                'upper_bound': forecast_df['yhat_upper'].clip(lower=0).round(2)
+            })
+            for product_id, forecast_df in forecasts.items()
+        ], ignore_index=True)
+
         conn = get_db_connection()
         cur = conn.cursor()
 
-        # Clear old forecasts for this product
-        cur.execute("DELETE FROM forecasts WHERE product_id = %s", (product_id,))
+        cur.execute(
+            "INSERT INTO forecast_runs (product_count) VALUES (%s) RETURNING run_id",
+            (len(forecasts),)
+        )
+        run_id = cur.fetchone()['run_id']
 
-        # Insert new forecasts
-        for _, row in forecast_df.iterrows():
-            cur.execute(
-                """
-                INSERT INTO forecasts (product_id, forecast_date, predicted_quantity, lower_bound, upper_bound)
-                VALUES (%s, %s, %s, %s, %s)
-                """,
-                (product_id, row['ds'].date(), max(0, row['yhat']), max(0, row['yhat_lower']), max(0, row['yhat_upper']))
-            )
+        cur.execute(
+            """
+            CREATE TEMP TABLE forecast_staging (
+                product_id INTEGER, forecast_date DATE, predicted_quantity DECIMAL(10, 2),
+                lower_bound DECIMAL(10, 2), upper_bound DECIMAL(10, 2)
+            ) ON COMMIT DROP
+            """
+        )
+        with span('save_copy'):
+            copy_dataframe(cur, staging, 'forecast_staging', FORECAST_COLUMNS)
+
+        cur.execute(
+            """
+            INSERT INTO forecasts
+                (product_id, forecast_date, predicted_quantity, lower_bound, upper_bound, run_id, generated_at)
+            SELECT product_id, forecast_date, predicted_quantity, lower_bound, upper_bound, %s, CURRENT_TIMESTAMP
+            FROM forecast_staging
+            ON CONFLICT (product_id, forecast_date) DO UPDATE SET
+                predicted_quantity = EXCLUDED.predicted_quantity,
+                lower_bound = EXCLUDED.lower_bound,
+                upper_bound = EXCLUDED.upper_bound,
+                run_id = EXCLUDED.run_id,
+                generated_at = EXCLUDED.generated_at
+            """,
+            (run_id,)
+        )
+
+        # Drop dates from older runs that the new forecast no longer covers
+        cur.execute(
+            """
+            DELETE FROM forecasts
+            WHERE product_id = ANY(%s) AND run_id IS DISTINCT FROM %s
+            """,
+            ([int(product_id) for product_id in forecasts.keys()], run_id)
+        )
+
+        cur.execute(
+            "UPDATE forecast_runs SET status = 'completed', completed_at = CURRENT_TIMESTAMP WHERE run_id = %s",
+            (run_id,)
+        )
 
         conn.commit()
         cur.close()
         conn.close()
+        invalidate_responses('forecasts')
+        return run_id
 
     def generate_forecast_for_product(self, product_id, forecast_days=30):
         """Generate and save forecast for a specific product"""
@@ -167,46 +415,46 @@ class InventoryForecaster:
         self.save_forecast(product_id, forecast)
         return forecast
 
-    def get_accuracy_metrics(self, product_id):
-        """Calculate historical accuracy metrics"""
-        # Get all available data for accuracy calculation
-        df = self.get_historical_data(product_id)
-
-        if df.empty or len(df) < 100:
-            return None
-
-        # Train on first 80% of data
-        split_idx = int(len(df) * 0.8)
-        train_df = df[:split_idx]
-        test_df = df[split_idx:]
-
-        # Train model
-        model = Prophet(
-            yearly_seasonality=True,
-            weekly_seasonality=True,
-            daily_seasonality=False
+    def get_accuracy_metrics(self, product_id, engine='prophet'):
+        """Accuracy metrics from the product's latest stored backtest (see backtesting.py)"""
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT
+                r.engine,
+                r.run_id AS backtest_run_id,
+                AVG(r.mae) AS mae,
+                AVG(r.mape) AS mape,
+                AVG(r.rmse) AS rmse,
+                AVG(r.coverage) AS coverage,
+                COUNT(*) AS cutoffs,
+                MAX(r.horizon) AS horizon,
+                MAX(r.created_at) AS evaluated_at
+            FROM backtest_results r
+            WHERE r.product_id = %s AND r.engine = %s
+            AND r.run_id = (SELECT MAX(run_id) FROM backtest_results WHERE product_id = %s AND engine = %s)
+            GROUP BY r.engine, r.run_id
+            """,
+            (product_id, engine, product_id, engine)
         )
-        model.fit(train_df)
-
-        # Predict on test set
-        forecast = model.predict(test_df[['ds']])
-
-        # Calculate metrics
-        actual = test_df['y'].values
-        predicted = forecast['yhat'].values
-
-        mae = abs(actual - predicted).mean()
+        row = cur.fetchone()
+        cur.close()
+        conn.close()
 
-        # Calculate MAPE excluding zero values to avoid division by zero
-        non_zero_mask = actual != 0
-        if non_zero_mask.sum() > 0:
-            mape = (abs((actual[non_zero_mask] - predicted[non_zero_mask]) / actual[non_zero_mask]) * 100).mean()
-        else:
-            mape = 0.0
+        if row is None:
+            return None
 
         return {
-            'mae': float(mae),
-            'mape': float(mape)
+            'engine': row['engine'],
+            'mae': float(row['mae']),
+            'mape': float(row['mape']) if row['mape'] is not None else None,
+            'rmse': float(row['rmse']),
+            'coverage': float(row['coverage']),
+            'cutoffs': row['cutoffs'],
+            'horizon': row['horizon'],
+            'backtest_run_id': row['backtest_run_id'],
+            'evaluated_at': row['evaluated_at'].isoformat()
         }
 
 if __name__ == '__main__':
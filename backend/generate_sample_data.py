@@ -1,6 +1,11 @@
 import random
 from datetime import datetime, timedelta
 from database import get_db_connection
+from daily_aggregates import refresh_sales_daily
+from partitions import ensure_partitions, truncate_sales
+from history_panel import invalidate_history_panel
+from response_cache import invalidate_responses
+from storage import refresh_sales_store
 
 def generate_sample_data():
     """Generate realistic sample retail sales data"""
@@ -10,7 +15,11 @@ def generate_sample_data():
     # Clear existing data to prevent duplicates
     print("Clearing existing data...")
     cur.execute('DELETE FROM forecasts')
-    cur.execute('DELETE FROM sales_data')
+    cur.execute('DELETE FROM hierarchy_forecasts')
+    cur.execute('DELETE FROM forecast_jobs')
+    cur.execute('DELETE FROM model_fits')
+    cur.execute('DELETE FROM backtest_results')
+    truncate_sales(cur)
     cur.execute('DELETE FROM products')
     conn.commit()
 
@@ -78,12 +87,20 @@ def generate_sample_data():
         current_date += timedelta(days=1)
 
     # Batch insert sales data
+    ensure_partitions(cur, 'sales_data', start_date, end_date)
     cur.executemany(
         "INSERT INTO sales_data (product_id, sale_date, quantity_sold, total_amount) VALUES (%s, %s, %s, %s)",
         sales_records
     )
 
     conn.commit()
+
+    # Rebuild the daily rollup the read paths query
+    refresh_sales_daily(conn)
+    conn.commit()
+    invalidate_responses('sales', 'forecasts')
+    refresh_sales_store()
+    invalidate_history_panel()
     cur.close()
     conn.close()
 
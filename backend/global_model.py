@@ -0,0 +1,198 @@
+"""
+Global cross-series forecast model.
+
+One ridge regression is trained over every product at once instead of one
+Prophet model per product. Each series is divided by its mean so products of
+any volume share the coefficients, and the features for every (day, product)
+are built with array operations over the whole history panel:
+
+    lag_1, lag_7, lag_14, lag_28    scaled sales on those earlier days
+    mean_7, mean_28                 rolling means ending the day before
+    dow_0 .. dow_6                  day of week (Monday = 0)
+    holiday                         national holiday (regressor calendar)
+    promo                           log(1 + items on promotion)
+    oil                             oil price relative to its training mean
+
+Training is a single least-squares solve. Forecasts are recursive over the
+horizon (each predicted day feeds the lags of the next) but batched over
+products, so one predict() call forecasts every product. Future promotions
+are assumed to be 0, as for Prophet. The process-wide model is refitted
+after each history panel invalidation (see get_global_model).
+"""
+
+import threading
+import numpy as np
+from config import Config
+from history_panel import get_history_panel
+from model_engines import SEASON, Z_95, fill_leading, forecast_frames
+from regressor_calendar import get_regressor_calendar
+
+LAGS = (1, 7, 14, 28)
+WINDOWS = (7, 28)
+MAX_LAG = max(LAGS + WINDOWS)
+
+FEATURES = ([f'lag_{k}' for k in LAGS] + [f'mean_{w}' for w in WINDOWS] +
+            [f'dow_{d}' for d in range(7)] + ['holiday', 'promo', 'oil'])
+
+RIDGE = 1.0
+
+
+def series_scale(y):
+    """Mean of each column's observed days (1 for empty or all-zero columns)"""
+    observed = ~np.isnan(y)
+    scale = np.nansum(y, axis=0) / np.maximum(observed.sum(axis=0), 1)
+    return np.where(scale > 0, scale, 1.0)
+
+
+class GlobalModel:
+    """Ridge regression shared by all series; fit() once, then predict() in batches"""
+
+    def __init__(self, history_days=None, ridge=RIDGE):
+        self.history_days = history_days or Config.STAT_HISTORY_DAYS
+        self.ridge = ridge
+        self.coef = None
+        self.sigma = None
+        self.oil_mean = 1.0
+
+    def _features(self, f, promo, dates, targets, calendar):
+        """(len(targets) x series x features) array for the given day indices
+
+        f is the scaled history with leading NaNs filled; every target index
+        must be at least MAX_LAG.
+        """
+        n, num_series = len(targets), f.shape[1]
+        X = np.empty((n, num_series, len(FEATURES)))
+        csum = np.vstack([np.zeros((1, num_series)), np.cumsum(f, axis=0)])
+
+        for i, k in enumerate(LAGS):
+            X[:, :, i] = f[targets - k]
+        for i, w in enumerate(WINDOWS, start=len(LAGS)):
+            X[:, :, i] = (csum[targets] - csum[targets - w]) / w
+
+        day = dates[targets].astype('datetime64[D]')
+        # 1970-01-01 was a Thursday
+        dow = (day.astype(np.int64) + 3) % 7
+        first = len(LAGS) + len(WINDOWS)
+        X[:, :, first:first + 7] = (dow[:, None] == np.arange(7))[:, None, :]
+        X[:, :, first + 7] = calendar.is_holiday(day)[:, None]
+        X[:, :, first + 8] = np.log1p(np.maximum(promo[targets], 0))
+        X[:, :, first + 9] = (calendar.oil(day) / self.oil_mean - 1)[:, None]
+        return X
+
+    @staticmethod
+    def _pad(y, promo, dates):
+        """Prepend NaN days so there are at least MAX_LAG + 1 rows"""
+        missing = MAX_LAG + 1 - len(y)
+        if missing <= 0:
+            return y, promo, dates
+        y = np.vstack([np.full((missing, y.shape[1]), np.nan), y])
+        promo = np.vstack([np.zeros((missing, promo.shape[1])), promo])
+        dates = np.concatenate([dates[0] - np.arange(missing, 0, -1), dates])
+        return y, promo, dates
+
+    def fit(self, panel, product_ids=None):
+        """Train on the last history_days of every product in a HistoryPanel"""
+        product_ids = panel.product_ids if product_ids is None else product_ids
+        dates, y = panel.matrix(product_ids, days=self.history_days)
+        _, promo = panel.matrix(product_ids, days=self.history_days, column='on_promotion')
+        if len(dates) <= MAX_LAG:
+            raise ValueError(f"The global model needs more than {MAX_LAG} days of history")
+
+        calendar = get_regressor_calendar()
+        self.oil_mean = float(calendar.oil(dates).mean()) or 1.0
+
+        observed = ~np.isnan(y)
+        f = fill_leading(y / series_scale(y))
+        targets = np.arange(MAX_LAG, len(dates))
+        X = self._features(f, np.nan_to_num(promo), dates, targets, calendar)
+
+        # Train only on days whose target and longest lag were really observed
+        mask = observed[targets] & observed[targets - MAX_LAG]
+        rows, target = X[mask], f[targets][mask]
+        if len(rows) == 0:
+            raise ValueError("No series has enough history to train the global model")
+
+        gram = rows.T @ rows + self.ridge * np.eye(len(FEATURES))
+        self.coef = np.linalg.solve(gram, rows.T @ target)
+        self.sigma = float(np.sqrt(np.mean((rows @ self.coef - target) ** 2)))
+        return self
+
+    def predict(self, y, promo, dates, forecast_days):
+        """Forecast every column of a (days x series) history ending on dates[-1]
+
+        Args:
+            y: History matrix, NaN before a series started
+            promo: Items on promotion, same shape as y
+            dates: datetime64 date of each row
+            forecast_days: Horizon in days
+
+        Returns:
+            (yhat, lower, upper) arrays of shape (forecast_days x series), 95% intervals
+        """
+        if self.coef is None:
+            raise ValueError("GlobalModel must be fitted before predict()")
+        y, promo, dates = self._pad(np.asarray(y, dtype=float), np.nan_to_num(promo),
+                                    np.asarray(dates, dtype='datetime64[D]'))
+        calendar = get_regressor_calendar()
+        observed = ~np.isnan(y)
+        scale = series_scale(y)
+        f = fill_leading(y / scale)
+
+        # Interval width from each series' one-step in-sample errors
+        targets = np.arange(MAX_LAG, len(y))
+        errors = self._features(f, promo, dates, targets, calendar) @ self.coef - f[targets]
+        counts = observed[targets].sum(axis=0)
+        sigma = np.sqrt(np.where(observed[targets], errors ** 2, 0.0).sum(axis=0) / np.maximum(counts, 1))
+        sigma = np.where(counts >= 2 * SEASON, sigma, self.sigma)
+
+        horizon = dates[-1] + np.arange(1, forecast_days + 1)
+        dates = np.concatenate([dates, horizon])
+        f = np.vstack([f, np.zeros((forecast_days, f.shape[1]))])
+        promo = np.vstack([promo, np.zeros((forecast_days, promo.shape[1]))])
+        for t in range(len(y), len(f)):
+            x = self._features(f, promo, dates, np.array([t]), calendar)[0]
+            f[t] = np.maximum(x @ self.coef, 0.0)
+
+        steps = np.arange(1, forecast_days + 1)
+        yhat = f[len(y):] * scale
+        half_width = Z_95 * sigma * scale * np.sqrt(steps)[:, None]
+        return yhat, yhat - half_width, yhat + half_width
+
+    def forecast(self, panel, product_ids, forecast_days):
+        """Forecast panel products, one batched predict() per last-sale date
+
+        Products with fewer than 10 days of history are left out.
+        Returns {product_id: forecast DataFrame}.
+        """
+        groups = {}
+        for product_id in product_ids:
+            if len(panel.columns(product_id)['ds']) >= 10:
+                groups.setdefault(panel.latest_date(product_id), []).append(product_id)
+
+        forecasts = {}
+        for last_date, group in groups.items():
+            dates, y = panel.matrix(group, days=self.history_days)
+            _, promo = panel.matrix(group, days=self.history_days, column='on_promotion')
+            yhat, lower, upper = self.predict(y, promo, dates, forecast_days)
+            forecasts.update(zip(group, forecast_frames(last_date, yhat, lower, upper)))
+        return forecasts
+
+
+_model = None
+_model_panel = None
+_model_lock = threading.Lock()
+
+
+def get_global_model():
+    """Process-wide model, retrained whenever get_history_panel() returns a new panel
+
+    invalidate_history_panel() (called by every sales_daily writer) bumps the
+    panel version, so the next call here reloads the panel and refits.
+    """
+    global _model, _model_panel
+    panel = get_history_panel()
+    with _model_lock:
+        if _model is None or _model_panel is not panel:
+            _model = GlobalModel().fit(panel)
+            _model_panel = panel
+        return _model
@@ -0,0 +1,34 @@
+"""
+Gunicorn settings for the production API server.
+
+    cd backend && gunicorn -c gunicorn.conf.py wsgi:app
+
+WEB_WORKERS processes each serve requests on WEB_THREADS threads (gthread).
+Request handlers are mostly database and serialization work, so threads scale
+reads within a worker; Prophet fits run on the JOB_WORKERS job threads that
+every worker process starts, so total fit concurrency is
+WEB_WORKERS x JOB_WORKERS.
+"""
+
+import gc
+from config import Config
+
+bind = f"0.0.0.0:{Config.FLASK_PORT}"
+workers = Config.WEB_WORKERS
+threads = Config.WEB_THREADS
+worker_class = 'gthread'
+timeout = Config.WEB_TIMEOUT
+graceful_timeout = 30
+preload_app = True
+
+
+def when_ready(server):
+    # Move everything the preload allocated out of the GC's reach so that
+    # collections in the workers don't write to (and un-share) those pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Threads and DB connections don't survive fork; each worker starts its own
+    from app import start_background_workers
+    start_background_workers()
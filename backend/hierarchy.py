@@ -0,0 +1,340 @@
+"""
+Hierarchical forecasting for store x family products.
+
+The hierarchy is total -> family -> store x family (the leaf products created
+by `import_kaggle_store_sales.py --level store`). Prophet is only fitted for
+aggregate nodes (one total model plus one per family), so the number of
+Stan fits does not grow with the number of stores. Leaves get the
+vectorized seasonal-naive engine's base forecast (model_engines.py), computed
+for all of them in one array operation, and the reconciliation step makes
+every level add up:
+
+    bottom_up   leaves' base forecasts summed upwards (no Prophet fits)
+    top_down    total model split by historical leaf proportions (1 fit)
+    middle_out  family models split by each store's share (one fit per family)
+    mint        MinT with structural (WLS) weights combining all levels
+
+Usage:
+    python hierarchy.py --method mint --forecast-days 30
+"""
+
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+from config import Config
+from database import get_db_connection
+from forecaster import InventoryForecaster
+from history_panel import load_history_panel
+from model_engines import get_engine
+
+RECONCILIATION_METHODS = ['bottom_up', 'top_down', 'middle_out', 'mint']
+
+# Window used for leaf proportions and naive forecast error
+PROPORTION_DAYS = 90
+
+
+def load_leaf_products():
+    """Store x family leaf products, ordered by family then store"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT product_id, family, store_nbr FROM products
+        WHERE store_nbr IS NOT NULL AND family IS NOT NULL
+        ORDER BY family, store_nbr
+        """
+    )
+    leaves = pd.DataFrame(cur.fetchall(), columns=['product_id', 'family', 'store_nbr'])
+    cur.close()
+    conn.close()
+    return leaves
+
+
+class Hierarchy:
+    """Dense daily history for all leaves plus the family/total aggregation
+
+    Attributes:
+        dates: datetime64[D] array of all sale dates
+        y: (dates x leaves) quantity matrix, 0 where a leaf had no sales row
+        promo: (dates x leaves) on_promotion matrix
+        oil_price, is_holiday: per-date calendar regressors
+        family_index: family position of each leaf
+    """
+
+    def __init__(self, leaves, panel):
+        self.leaf_ids = leaves['product_id'].to_numpy()
+        self.families = sorted(leaves['family'].unique())
+        family_pos = {family: i for i, family in enumerate(self.families)}
+        self.family_index = leaves['family'].map(family_pos).to_numpy()
+
+        columns = [panel.columns(int(pid)) for pid in self.leaf_ids]
+        ds_all = np.concatenate([c['ds'] for c in columns])
+        self.dates, date_pos = np.unique(ds_all, return_inverse=True)
+        leaf_pos = np.repeat(np.arange(len(columns)), [len(c['ds']) for c in columns])
+
+        self.y = np.zeros((len(self.dates), len(columns)))
+        self.y[date_pos, leaf_pos] = np.concatenate([c['y'] for c in columns])
+        self.promo = np.zeros((len(self.dates), len(columns)))
+        self.promo[date_pos, leaf_pos] = np.concatenate([c['on_promotion'] for c in columns])
+        self.oil_price = np.zeros(len(self.dates))
+        self.oil_price[date_pos] = np.concatenate([c['oil_price'] for c in columns])
+        self.is_holiday = np.zeros(len(self.dates), dtype=int)
+        self.is_holiday[date_pos] = np.concatenate([c['is_holiday'] for c in columns])
+
+        # Leaf -> family aggregation matrix
+        self.family_matrix = np.zeros((len(columns), len(self.families)))
+        self.family_matrix[np.arange(len(columns)), self.family_index] = 1.0
+
+    @property
+    def num_leaves(self):
+        return len(self.leaf_ids)
+
+    def summing_matrix(self):
+        """S with rows [total, families..., leaves...] and one column per leaf"""
+        return np.vstack([
+            np.ones((1, self.num_leaves)),
+            self.family_matrix.T,
+            np.eye(self.num_leaves)
+        ])
+
+    def node_history(self, y, promo):
+        """Forecaster-shaped history DataFrame for an aggregate series"""
+        return pd.DataFrame({
+            'ds': self.dates.astype('datetime64[ns]'),
+            'y': y,
+            'on_promotion': promo,
+            'oil_price': self.oil_price,
+            'is_holiday': self.is_holiday
+        })
+
+    def total_history(self):
+        return self.node_history(self.y.sum(axis=1), self.promo.sum(axis=1))
+
+    def family_history(self, family_idx):
+        mask = self.family_index == family_idx
+        return self.node_history(self.y[:, mask].sum(axis=1), self.promo[:, mask].sum(axis=1))
+
+
+def node_key(level, name=None):
+    """Model cache key for an aggregate node"""
+    if level == 'total':
+        return 'hierarchy_total'
+    return 'hierarchy_family_' + re.sub(r'[^A-Za-z0-9]+', '_', name)
+
+
+def _fit_node(key, history, forecast_days):
+    """Prophet forecast for one aggregate node (runs in a pool worker)"""
+    forecast = InventoryForecaster().train_and_forecast(key, forecast_days, history=history,
+                                                        record=False, engine='prophet')
+    return (forecast['yhat'].to_numpy(), forecast['yhat_lower'].to_numpy(),
+            forecast['yhat_upper'].to_numpy())
+
+
+def reconcile(hierarchy, method, base):
+    """Coherent leaf forecasts (forecast_days x leaves) from base forecasts
+
+    Args:
+        hierarchy: Hierarchy instance
+        method: One of RECONCILIATION_METHODS
+        base: Dict with 'total' (h,), 'families' (h x families) and 'leaves'
+              (h x leaves) base yhat arrays; only the levels the method needs
+    """
+    recent = hierarchy.y[-PROPORTION_DAYS:].sum(axis=0)
+
+    if method == 'bottom_up':
+        return base['leaves']
+
+    if method == 'top_down':
+        proportions = recent / max(recent.sum(), 1e-9)
+        return base['total'][:, None] * proportions[None, :]
+
+    if method == 'middle_out':
+        family_totals = recent @ hierarchy.family_matrix
+        shares = recent / np.maximum(family_totals[hierarchy.family_index], 1e-9)
+        return base['families'][:, hierarchy.family_index] * shares[None, :]
+
+    if method == 'mint':
+        # MinT with W = diag(number of leaves under each node)
+        S = hierarchy.summing_matrix()
+        w_inv = 1.0 / S.sum(axis=1)
+        stacked = np.hstack([base['total'][:, None], base['families'], base['leaves']])
+        A = S.T @ (w_inv[:, None] * S)
+        B = S.T @ (w_inv[:, None] * stacked.T)
+        return np.linalg.solve(A, B).T
+
+    raise ValueError(f"Unknown reconciliation method: {method}")
+
+
+def _relative_bounds(yhat, lower, upper):
+    safe = np.where(yhat > 0, yhat, 1.0)
+    return np.where(yhat > 0, lower / safe, 1.0), np.where(yhat > 0, upper / safe, 1.0)
+
+
+def _frame(dates, yhat, lower, upper):
+    return pd.DataFrame({
+        'ds': pd.to_datetime(dates),
+        'yhat': yhat,
+        'yhat_lower': np.minimum(lower, yhat),
+        'yhat_upper': np.maximum(upper, yhat)
+    })
+
+
+def forecast_hierarchy(method='mint', forecast_days=30, max_workers=None, panel=None):
+    """Forecast every node of the store x family hierarchy, reconciled
+
+    Returns:
+        Dict with 'total' DataFrame, 'families' {family: DataFrame},
+        'leaves' {product_id: DataFrame} and 'fits' (number of Prophet fits)
+    """
+    if method not in RECONCILIATION_METHODS:
+        raise ValueError(f"method must be one of {RECONCILIATION_METHODS}")
+
+    leaves = load_leaf_products()
+    if leaves.empty:
+        raise ValueError("No store-level products found; import with --level store first")
+
+    hierarchy = Hierarchy(leaves, panel if panel is not None else load_history_panel())
+    future_dates = hierarchy.dates[-1] + np.arange(1, forecast_days + 1).astype('timedelta64[D]')
+
+    # Only fit the aggregate Prophet models this method actually uses
+    jobs = {}
+    if method in ('top_down', 'mint'):
+        jobs[('total', None)] = hierarchy.total_history()
+    if method in ('middle_out', 'mint'):
+        for i, family in enumerate(hierarchy.families):
+            jobs[('family', i)] = hierarchy.family_history(i)
+
+    results = {}
+    if jobs:
+        max_workers = max_workers or Config.BATCH_MAX_WORKERS or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for (level, idx), history in jobs.items():
+                key = node_key(level, hierarchy.families[idx] if idx is not None else None)
+                futures[(level, idx)] = executor.submit(_fit_node, key, history, forecast_days)
+            results = {node: future.result() for node, future in futures.items()}
+
+    leaf_yhat, leaf_lower, leaf_upper = get_engine('seasonal_naive').forecast(hierarchy.y, forecast_days)
+    base = {'leaves': leaf_yhat}
+    if ('total', None) in results:
+        base['total'] = results[('total', None)][0]
+    if method in ('middle_out', 'mint'):
+        base['families'] = np.column_stack([results[('family', i)][0] for i in range(len(hierarchy.families))])
+
+    reconciled = np.maximum(reconcile(hierarchy, method, base), 0)
+    family_yhat = reconciled @ hierarchy.family_matrix
+    total_yhat = reconciled.sum(axis=1)
+
+    # Intervals keep each node's base relative width; leaves split from a
+    # parent model inherit the parent's width
+    if method == 'top_down':
+        rel_lower, rel_upper = _relative_bounds(base['total'], *results[('total', None)][1:])
+        leaf_rel = (rel_lower[:, None], rel_upper[:, None])
+    elif method == 'middle_out':
+        family_rel = [_relative_bounds(*results[('family', i)]) for i in range(len(hierarchy.families))]
+        leaf_rel = (np.column_stack([r[0] for r in family_rel])[:, hierarchy.family_index],
+                    np.column_stack([r[1] for r in family_rel])[:, hierarchy.family_index])
+    else:
+        leaf_rel = _relative_bounds(leaf_yhat, leaf_lower, leaf_upper)
+    leaf_lower = reconciled * leaf_rel[0]
+    leaf_upper = reconciled * leaf_rel[1]
+
+    def aggregate_bounds(node, yhat, lower_sum, upper_sum):
+        if node in results:
+            rel_lower, rel_upper = _relative_bounds(*results[node])
+            return yhat * rel_lower, yhat * rel_upper
+        return lower_sum, upper_sum
+
+    total_lower, total_upper = aggregate_bounds(('total', None), total_yhat,
+                                                leaf_lower.sum(axis=1), leaf_upper.sum(axis=1))
+    families = {}
+    for i, family in enumerate(hierarchy.families):
+        lower, upper = aggregate_bounds(('family', i), family_yhat[:, i],
+                                        (leaf_lower @ hierarchy.family_matrix)[:, i],
+                                        (leaf_upper @ hierarchy.family_matrix)[:, i])
+        families[family] = _frame(future_dates, family_yhat[:, i], lower, upper)
+
+    return {
+        'total': _frame(future_dates, total_yhat, total_lower, total_upper),
+        'families': families,
+        'leaves': {
+            int(pid): _frame(future_dates, reconciled[:, j], leaf_lower[:, j], leaf_upper[:, j])
+            for j, pid in enumerate(hierarchy.leaf_ids)
+        },
+        'fits': len(jobs)
+    }
+
+
+def save_hierarchy_forecast(result, method):
+    """Persist leaf forecasts to forecasts and aggregate nodes to hierarchy_forecasts"""
+    InventoryForecaster().save_forecasts(result['leaves'])
+
+    nodes = [('total', 'total', result['total'])]
+    nodes += [('family', family, df) for family, df in result['families'].items()]
+    rows = [
+        (level, node, ds.date(), float(yhat), float(lower), float(upper), method)
+        for level, node, df in nodes
+        for ds, yhat, lower, upper in zip(df['ds'], df['yhat'], df['yhat_lower'], df['yhat_upper'])
+    ]
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM hierarchy_forecasts")
+    execute_values(
+        cur,
+        """
+        INSERT INTO hierarchy_forecasts
+            (level, node, forecast_date, predicted_quantity, lower_bound, upper_bound, method)
+        VALUES %s
+        """,
+        rows,
+        page_size=1000
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def run_hierarchy_forecast(method='mint', forecast_days=30, max_workers=None, save=True):
+    """Forecast, reconcile and (optionally) save the hierarchy; returns a summary"""
+    started = time.time()
+    result = forecast_hierarchy(method, forecast_days, max_workers)
+    if save:
+        save_hierarchy_forecast(result, method)
+
+    return {
+        'method': method,
+        'leaves': len(result['leaves']),
+        'families': len(result['families']),
+        'prophet_fits': result['fits'],
+        'duration_seconds': time.time() - started
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reconciled store x family hierarchy forecast')
+    parser.add_argument('--method', choices=RECONCILIATION_METHODS, default='mint',
+                      help='Reconciliation method')
+    parser.add_argument('--forecast-days', type=int, default=30,
+                      help='Number of days to forecast')
+    parser.add_argument('--workers', type=int, default=None,
+                      help='Number of worker processes for aggregate Prophet fits')
+    parser.add_argument('--dry-run', action='store_true',
+                      help='Forecast without saving results')
+
+    args = parser.parse_args()
+
+    print(f"Forecasting hierarchy with {args.method} reconciliation...")
+    summary = run_hierarchy_forecast(args.method, args.forecast_days, args.workers, save=not args.dry_run)
+
+    print("\n" + "="*60)
+    print("Hierarchy forecast completed!")
+    print("="*60)
+    print(f"Leaves: {summary['leaves']} across {summary['families']} families")
+    print(f"Prophet fits: {summary['prophet_fits']}")
+    print(f"Duration: {summary['duration_seconds']:.1f}s")
@@ -0,0 +1,181 @@
+"""
+Bulk loader for the full sales history panel.
+
+Pulls every product's daily sales plus the oil/holiday regressors from the
+sales_daily rollup in one read of the sales store (a single COPY ... TO STDOUT
+on PostgreSQL, one Parquet scan on DuckDB; see storage.py), instead of one
+connection and one query per product, and keeps
+the result as contiguous NumPy columns sorted by (product_id, ds).
+Per-product series are then plain slices (views) of those columns.
+
+Writers to sales_daily call invalidate_history_panel() after committing;
+like the regressor calendar, that bumps a version file so every server
+process reloads its panel on next use.
+"""
+
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from config import Config
+from storage import get_sales_store
+
+
+class HistoryPanel:
+    """Columnar sales history for all products, sliceable by product_id"""
+
+    def __init__(self, df):
+        df = df.sort_values(['product_id', 'ds'], kind='stable')
+
+        self.ds = df['ds'].values.astype('datetime64[D]')
+        self.y = np.ascontiguousarray(df['y'].values, dtype=np.float64)
+        self.total_amount = np.ascontiguousarray(df['total_amount'].fillna(0).values, dtype=np.float64)
+        self.on_promotion = np.ascontiguousarray(df['on_promotion'].fillna(0).values, dtype=np.float32)
+        self.is_holiday = np.ascontiguousarray(df['is_holiday'].fillna(0).values, dtype=np.int8)
+        self.oil_price = self._fill_oil(df['ds'], df['oil_price'])
+
+        product_ids = df['product_id'].values
+        if len(product_ids):
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(product_ids)) + 1))
+            ends = np.append(starts[1:], len(product_ids))
+            self._offsets = {int(product_ids[s]): (int(s), int(e)) for s, e in zip(starts, ends)}
+        else:
+            self._offsets = {}
+
+    @staticmethod
+    def _fill_oil(ds, oil_price):
+        """Forward/backward fill oil prices over the calendar, not per product"""
+        by_date = pd.Series(oil_price.values, index=ds.values).groupby(level=0).first().sort_index()
+        by_date = by_date.ffill().bfill().fillna(0)
+        return np.ascontiguousarray(by_date.reindex(ds.values).values, dtype=np.float64)
+
+    @property
+    def product_ids(self):
+        return list(self._offsets.keys())
+
+    def __contains__(self, product_id):
+        return product_id in self._offsets
+
+    def __len__(self):
+        return len(self.y)
+
+    def _bounds(self, product_id, since=None):
+        start, end = self._offsets.get(product_id, (0, 0))
+        if since is not None and end > start:
+            start += int(np.searchsorted(self.ds[start:end], np.datetime64(since, 'D'), side='left'))
+        return start, end
+
+    def latest_date(self, product_id):
+        """Most recent sale date for a product, or None"""
+        start, end = self._bounds(product_id)
+        return self.ds[end - 1] if end > start else None
+
+    def columns(self, product_id, since=None):
+        """Dict of array views for one product, optionally from `since` onwards"""
+        start, end = self._bounds(product_id, since)
+        return {
+            'ds': self.ds[start:end],
+            'y': self.y[start:end],
+            'total_amount': self.total_amount[start:end],
+            'on_promotion': self.on_promotion[start:end],
+            'oil_price': self.oil_price[start:end],
+            'is_holiday': self.is_holiday[start:end]
+        }
+
+    def matrix(self, product_ids, until=None, days=None, column='y'):
+        """Dense (dates x products) quantity matrix on a shared daily calendar
+
+        Days before a product's first sale are NaN and missing days inside its
+        history are 0. `until` drops later dates and `days` keeps only the
+        last N calendar days. `column` picks another per-day column (e.g.
+        'on_promotion') laid out the same way.
+
+        Returns (dates, matrix).
+        """
+        bounds = []
+        for product_id in product_ids:
+            start, end = self._bounds(product_id)
+            if until is not None and end > start:
+                end = start + int(np.searchsorted(self.ds[start:end], np.datetime64(until, 'D'), side='right'))
+            bounds.append((start, end))
+
+        present = [(start, end) for start, end in bounds if end > start]
+        if not present:
+            return np.array([], dtype='datetime64[D]'), np.full((0, len(product_ids)), np.nan)
+
+        last = max(self.ds[end - 1] for _, end in present)
+        first = min(self.ds[start] for start, _ in present)
+        if days is not None:
+            first = max(first, last - np.timedelta64(days - 1, 'D'))
+        dates = np.arange(first, last + np.timedelta64(1, 'D'))
+
+        values = getattr(self, column)
+        matrix = np.full((len(dates), len(product_ids)), np.nan)
+        for i, (start, end) in enumerate(bounds):
+            if end == start:
+                continue
+            pos = (self.ds[start:end] - first).astype(int)
+            keep = pos >= 0
+            matrix[max(pos[0], 0):, i] = 0.0
+            matrix[pos[keep], i] = values[start:end][keep]
+        return dates, matrix
+
+    def frame(self, product_id, since=None):
+        """Forecaster-shaped DataFrame (ds, y, on_promotion, oil_price, is_holiday)"""
+        cols = self.columns(product_id, since)
+        if len(cols['y']) == 0:
+            return pd.DataFrame()
+
+        return pd.DataFrame({
+            'ds': cols['ds'].astype('datetime64[ns]'),
+            'y': cols['y'],
+            'on_promotion': cols['on_promotion'].astype(float),
+            'oil_price': cols['oil_price'],
+            'is_holiday': cols['is_holiday'].astype(int)
+        }, copy=False)
+
+
+def load_history_panel(conn=None):
+    """Load the whole sales panel from the configured sales store"""
+    return HistoryPanel(get_sales_store().panel_frame(conn))
+
+
+_panel = None
+_panel_version = None
+_panel_lock = threading.Lock()
+
+
+def _read_version():
+    try:
+        with open(Config.HISTORY_PANEL_VERSION_FILE) as f:
+            return f.read()
+    except FileNotFoundError:
+        return '0'
+
+
+def get_history_panel(refresh=False):
+    """Process-wide panel, reloaded when another process invalidated it"""
+    global _panel, _panel_version
+    version = _read_version()
+    with _panel_lock:
+        if _panel is None or refresh or version != _panel_version:
+            _panel = load_history_panel()
+            _panel_version = version
+        return _panel
+
+
+def invalidate_history_panel():
+    """Reload the panel everywhere on next use (call after changing sales_daily)"""
+    global _panel
+    with _panel_lock:
+        _panel = None
+    try:
+        path = Config.HISTORY_PANEL_VERSION_FILE
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(f"{time.time_ns()}-{os.getpid()}")
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"WARNING: could not invalidate history panel: {e}")
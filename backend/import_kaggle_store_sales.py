@@ -6,38 +6,244 @@ Instructions:
 1. Download the dataset from Kaggle (requires Kaggle account)
 2. Extract all CSV files to a folder (e.g., data/store-sales/)
 3. Run this script: python import_kaggle_store_sales.py --data-dir data/store-sales/
+
+For the full store-level data, stream train.csv in bounded memory and keep one
+product per store x family:
+    python import_kaggle_store_sales.py --data-dir data/store-sales/ --chunksize 500000 --level store
 """
 
 import pandas as pd
 import argparse
-from database import get_db_connection
-from datetime import datetime
+import os
+import time
+from database import get_db_connection, copy_dataframe
+from daily_aggregates import refresh_sales_daily
+from partitions import ensure_partitions, truncate_sales
+from regressor_calendar import invalidate_regressor_calendar
+from history_panel import invalidate_history_panel
+from response_cache import invalidate_responses
+from storage import refresh_sales_store
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SALES_COLUMNS = ['product_id', 'sale_date', 'quantity_sold', 'total_amount', 'on_promotion']
+
+# Compact dtypes for train.csv (the id column is never read)
+TRAIN_COLUMNS = ['date', 'store_nbr', 'family', 'sales', 'onpromotion']
+TRAIN_DTYPES = {
+    'store_nbr': 'int32',
+    'family': 'category',
+    'sales': 'float32',
+    'onpromotion': 'float32'
+}
+
+# Assign reasonable prices to product families (estimated retail prices)
+FAMILY_PRICES = {
+    'AUTOMOTIVE': 45.99,
+    'BABY CARE': 12.99,
+    'BEAUTY': 18.99,
+    'BEVERAGES': 3.99,
+    'BOOKS': 14.99,
+    'BREAD/BAKERY': 4.99,
+    'CELEBRATION': 24.99,
+    'CLEANING': 8.99,
+    'DAIRY': 5.99,
+    'DELI': 7.99,
+    'EGGS': 3.99,
+    'FROZEN FOODS': 6.99,
+    'GROCERY I': 9.99,
+    'GROCERY II': 11.99,
+    'HARDWARE': 15.99,
+    'HOME AND KITCHEN I': 22.99,
+    'HOME AND KITCHEN II': 28.99,
+    'HOME APPLIANCES': 89.99,
+    'HOME CARE': 12.99,
+    'LADIESWEAR': 34.99,
+    'LAWN AND GARDEN': 19.99,
+    'LINGERIE': 16.99,
+    'LIQUOR,WINE,BEER': 18.99,
+    'MAGAZINES': 5.99,
+    'MEATS': 12.99,
+    'PERSONAL CARE': 9.99,
+    'PET SUPPLIES': 13.99,
+    'PLAYERS AND ELECTRONICS': 129.99,
+    'POULTRY': 8.99,
+    'PREPARED FOODS': 7.99,
+    'PRODUCE': 4.99,
+    'SCHOOL AND OFFICE SUPPLIES': 11.99,
+    'SEAFOOD': 14.99
+}
+
+
+def family_category(family):
+    """Map a Kaggle product family onto a product category"""
+    if 'CARE' in family or 'BEAUTY' in family or 'LINGERIE' in family:
+        return 'Personal Care'
+    elif 'ELECTRONICS' in family or 'PLAYERS' in family or 'APPLIANCES' in family:
+        return 'Electronics'
+    elif 'HOME' in family or 'KITCHEN' in family or 'HARDWARE' in family:
+        return 'Home & Kitchen'
+    elif 'WEAR' in family or 'CLOTHING' in family:
+        return 'Apparel'
+    elif 'AUTOMOTIVE' in family:
+        return 'Automotive'
+    elif 'BOOKS' in family or 'MAGAZINES' in family:
+        return 'Books & Media'
+    return 'Grocery'
+
+
+def create_products(cur, keys):
+    """Insert products for new (family,) or (store_nbr, family) keys
+
+    Returns a DataFrame of the key columns plus product_id and unit_price.
+    """
+    rows = []
+    for key in sorted(keys.itertuples(index=False, name=None)):
+        store_nbr, family = (int(key[0]), key[1]) if len(key) == 2 else (None, key[0])
+        price = FAMILY_PRICES.get(family, 9.99)
+
+        # Clean up family name for product name
+        product_name = family.title().replace('And', 'and')
+        if store_nbr is not None:
+            product_name = f"{product_name} - Store {store_nbr}"
 
-def import_store_sales_data(data_dir):
-    """Import Kaggle Store Sales dataset into PostgreSQL"""
+        cur.execute(
+            """
+            INSERT INTO products (product_name, category, unit_price, family, store_nbr)
+            VALUES (%s, %s, %s, %s, %s) RETURNING product_id
+            """,
+            (product_name, family_category(family), price, family, store_nbr)
+        )
+        rows.append(tuple(key) + (cur.fetchone()['product_id'], price))
+
+    return pd.DataFrame(rows, columns=list(keys.columns) + ['product_id', 'unit_price'])
+
+
+def complete_date_chunks(reader):
+    """Re-chunk a date-sorted CSV reader so no date is split across chunks
+
+    The rows for the last date of each chunk are held back and prepended to
+    the next one, so per-date aggregates computed chunk by chunk are final.
+    """
+    carry = None
+    last_yielded = None
+    for chunk in reader:
+        if carry is not None and len(carry):
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+            chunk['family'] = chunk['family'].astype('category')
+
+        last_date = chunk['date'].max()
+        carry = chunk[chunk['date'] == last_date]
+        done = chunk[chunk['date'] < last_date]
+
+        if len(done):
+            if last_yielded is not None and done['date'].min() <= last_yielded:
+                raise ValueError("train.csv must be sorted by date for chunked family-level imports")
+            last_yielded = done['date'].max()
+            yield done
+
+    if carry is not None and len(carry):
+        yield carry
+
+
+def prepare_sales_chunk(chunk, level):
+    """Aggregate one chunk to the product level
+
+    Returns the aggregated frame and its product key columns.
+    """
+    if level == 'family':
+        # Sum across all stores (in float64 so large totals keep precision)
+        agg = chunk.astype({'sales': 'float64'}).groupby(['date', 'family'], observed=True).agg({
+            'sales': 'sum',
+            'onpromotion': 'sum'  # Sum promotion count across stores
+        }).reset_index()
+        key_columns = ['family']
+    else:
+        agg = chunk
+        key_columns = ['store_nbr', 'family']
+
+    agg = agg.astype({'family': str})
+    return agg, key_columns
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if unavailable"""
+    if resource is None:
+        return None
+    # ru_maxrss is KB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 / 1024 if os.uname().sysname == 'Darwin' else maxrss / 1024
+
+
+def insert_sales_records(cur, sales_records, use_staging=False):
+    """Bulk load prepared sales rows with COPY
+
+    With use_staging, rows are copied into an unlogged staging table first and
+    merged into sales_data with a single INSERT ... SELECT, which keeps the
+    COPY itself out of the WAL and leaves sales_data untouched if it fails.
+    """
+    ensure_partitions(cur, 'sales_data', sales_records['sale_date'].min(), sales_records['sale_date'].max())
+    if not use_staging:
+        return copy_dataframe(cur, sales_records, 'sales_data', SALES_COLUMNS)
+
+    cur.execute(
+        """
+        CREATE UNLOGGED TABLE IF NOT EXISTS sales_data_staging (
+            product_id INTEGER, sale_date DATE, quantity_sold INTEGER,
+            total_amount DECIMAL(10, 2), on_promotion INTEGER
+        )
+        """
+    )
+    cur.execute("TRUNCATE sales_data_staging")
+    copy_dataframe(cur, sales_records, 'sales_data_staging', SALES_COLUMNS)
+    cur.execute(
+        f"""
+        INSERT INTO sales_data ({', '.join(SALES_COLUMNS)})
+        SELECT {', '.join(SALES_COLUMNS)} FROM sales_data_staging
+        """
+    )
+    cur.execute("TRUNCATE sales_data_staging")
+    return len(sales_records)
+
+
+def import_store_sales_data(data_dir, use_staging=False, chunksize=None, level='family'):
+    """Import Kaggle Store Sales dataset into PostgreSQL
+
+    Args:
+        data_dir: Directory containing the extracted Kaggle CSV files
+        use_staging: COPY through an unlogged staging table
+        chunksize: Stream train.csv in chunks of this many rows (None reads it whole)
+        level: 'family' sums all stores per family; 'store' keeps store x family products
+    """
 
     print("Starting import of Kaggle Store Sales dataset...")
     print(f"Data directory: {data_dir}")
 
+    train_path = f"{data_dir}/train.csv"
+    if not os.path.exists(train_path):
+        print("ERROR: train.csv not found. Please download the dataset from Kaggle.")
+        return
+
     conn = get_db_connection()
     cur = conn.cursor()
 
     # Clear existing data
     print("\nClearing existing data...")
     cur.execute('DELETE FROM forecasts')
-    cur.execute('DELETE FROM sales_data')
+    cur.execute('DELETE FROM hierarchy_forecasts')
+    cur.execute('DELETE FROM forecast_jobs')
+    cur.execute('DELETE FROM model_fits')
+    cur.execute('DELETE FROM backtest_results')
+    truncate_sales(cur)
     cur.execute('DELETE FROM products')
     conn.commit()
     print("Existing data cleared.")
 
     # Load CSV files
     print("\nLoading CSV files...")
-    try:
-        train_df = pd.read_csv(f"{data_dir}/train.csv")
-        print(f"  train.csv: {len(train_df):,} rows")
-    except FileNotFoundError:
-        print("ERROR: train.csv not found. Please download the dataset from Kaggle.")
-        return
 
     # Load oil prices
     try:
@@ -55,91 +261,25 @@ def import_store_sales_data(data_dir):
         print("  WARNING: holidays_events.csv not found. Continuing without holidays.")
         holidays_df = None
 
-    # Get unique product families (these will be our products)
-    print("\nImporting products (product families)...")
-    families = train_df['family'].unique()
-
-    # Assign reasonable prices to product families (estimated retail prices)
-    family_prices = {
-        'AUTOMOTIVE': 45.99,
-        'BABY CARE': 12.99,
-        'BEAUTY': 18.99,
-        'BEVERAGES': 3.99,
-        'BOOKS': 14.99,
-        'BREAD/BAKERY': 4.99,
-        'CELEBRATION': 24.99,
-        'CLEANING': 8.99,
-        'DAIRY': 5.99,
-        'DELI': 7.99,
-        'EGGS': 3.99,
-        'FROZEN FOODS': 6.99,
-        'GROCERY I': 9.99,
-        'GROCERY II': 11.99,
-        'HARDWARE': 15.99,
-        'HOME AND KITCHEN I': 22.99,
-        'HOME AND KITCHEN II': 28.99,
-        'HOME APPLIANCES': 89.99,
-        'HOME CARE': 12.99,
-        'LADIESWEAR': 34.99,
-        'LAWN AND GARDEN': 19.99,
-        'LINGERIE': 16.99,
-        'LIQUOR,WINE,BEER': 18.99,
-        'MAGAZINES': 5.99,
-        'MEATS': 12.99,
-        'PERSONAL CARE': 9.99,
-        'PET SUPPLIES': 13.99,
-        'PLAYERS AND ELECTRONICS': 129.99,
-        'POULTRY': 8.99,
-        'PREPARED FOODS': 7.99,
-        'PRODUCE': 4.99,
-        'SCHOOL AND OFFICE SUPPLIES': 11.99,
-        'SEAFOOD': 14.99
-    }
-
-    product_id_map = {}
-    for family in sorted(families):
-        # Determine category
-        category = 'Grocery'
-        if 'CARE' in family or 'BEAUTY' in family or 'LINGERIE' in family:
-            category = 'Personal Care'
-        elif 'ELECTRONICS' in family or 'PLAYERS' in family or 'APPLIANCES' in family:
-            category = 'Electronics'
-        elif 'HOME' in family or 'KITCHEN' in family or 'HARDWARE' in family:
-            category = 'Home & Kitchen'
-        elif 'WEAR' in family or 'CLOTHING' in family:
-            category = 'Apparel'
-        elif 'AUTOMOTIVE' in family:
-            category = 'Automotive'
-        elif 'BOOKS' in family or 'MAGAZINES' in family:
-            category = 'Books & Media'
-
-        price = family_prices.get(family, 9.99)
-
-        # Clean up family name for product name
-        product_name = family.title().replace('And', 'and')
-
-        cur.execute(
-            "INSERT INTO products (product_name, category, unit_price) VALUES (%s, %s, %s) RETURNING product_id",
-            (product_name, category, price)
-        )
-        product_id = cur.fetchone()['product_id']
-        product_id_map[family] = product_id
-
-    conn.commit()
-    print(f"Imported {len(product_id_map)} products")
+    # Load stores
+    try:
+        stores_df = pd.read_csv(f"{data_dir}/stores.csv")
+        print(f"  stores.csv: {len(stores_df):,} rows")
+    except FileNotFoundError:
+        print("  WARNING: stores.csv not found. Continuing without store metadata.")
+        stores_df = None
 
     # Import oil prices
     if oil_df is not None:
         print("\nImporting oil prices...")
-        oil_records = []
-        for _, row in oil_df.iterrows():
-            if pd.notna(row['dcoilwtico']):  # Skip missing values
-                oil_records.append((row['date'], float(row['dcoilwtico'])))
-
-        if oil_records:
-            cur.executemany(
-                "INSERT INTO oil_prices (date, dcoilwtico) VALUES (%s, %s) ON CONFLICT (date) DO NOTHING",
-                oil_records
+        oil_records = oil_df.dropna(subset=['dcoilwtico'])  # Skip missing values
+
+        if len(oil_records):
+            # COPY into a temp table so existing dates can be skipped set-based
+            cur.execute("CREATE TEMP TABLE oil_staging (date DATE, dcoilwtico DECIMAL(10, 2)) ON COMMIT DROP")
+            copy_dataframe(cur, oil_records, 'oil_staging', ['date', 'dcoilwtico'])
+            cur.execute(
+                "INSERT INTO oil_prices (date, dcoilwtico) SELECT date, dcoilwtico FROM oil_staging ON CONFLICT (date) DO NOTHING"
             )
             conn.commit()
             print(f"Imported {len(oil_records)} oil price records")
@@ -147,73 +287,83 @@ def import_store_sales_data(data_dir):
     # Import holidays
     if holidays_df is not None:
         print("\nImporting holidays...")
-        holiday_records = []
-        for _, row in holidays_df.iterrows():
-            holiday_records.append((
-                row['date'],
-                row.get('type', ''),
-                row.get('locale', ''),
-                row.get('locale_name', ''),
-                row.get('description', ''),
-                row.get('transferred', False)
-            ))
-
-        if holiday_records:
-            cur.executemany(
-                "INSERT INTO holidays (date, type, locale, locale_name, description, transferred) VALUES (%s, %s, %s, %s, %s, %s)",
-                holiday_records
-            )
+        holiday_records = holidays_df.copy()
+        for col in ['type', 'locale', 'locale_name', 'description']:
+            if col not in holiday_records.columns:
+                holiday_records[col] = ''
+        if 'transferred' not in holiday_records.columns:
+            holiday_records['transferred'] = False
+
+        if len(holiday_records):
+            copy_dataframe(cur, holiday_records, 'holidays',
+                           ['date', 'type', 'locale', 'locale_name', 'description', 'transferred'])
             conn.commit()
             print(f"Imported {len(holiday_records)} holiday records")
 
+    # Import stores (leaf level of the store x family hierarchy)
+    if stores_df is not None:
+        print("\nImporting stores...")
+        cur.execute('DELETE FROM stores')
+        copy_dataframe(cur, stores_df, 'stores', ['store_nbr', 'city', 'state', 'type', 'cluster'])
+        conn.commit()
+        print(f"Imported {len(stores_df)} stores")
+
     # Import sales data
     print("\nImporting sales data...")
-    print("This may take several minutes for large datasets...")
-
-    # Aggregate sales by date and family (sum across all stores)
-    print("  Aggregating sales by date and product family...")
-    sales_agg = train_df.groupby(['date', 'family']).agg({
-        'sales': 'sum',
-        'onpromotion': 'sum'  # Sum promotion count across stores
-    }).reset_index()
-
-    # Prepare data for insertion
-    sales_records = []
-    for _, row in sales_agg.iterrows():
-        product_id = product_id_map[row['family']]
-        sale_date = row['date']
-        quantity_sold = int(row['sales'])  # Sales is already in units
-        on_promotion = int(row['onpromotion']) if pd.notna(row['onpromotion']) else 0
-
-        # Calculate total amount
-        price = None
-        cur.execute("SELECT unit_price FROM products WHERE product_id = %s", (product_id,))
-        result = cur.fetchone()
-        if result:
-            price = float(result['unit_price'])
-
-        total_amount = quantity_sold * price if price else 0
-
-        sales_records.append((
-            product_id,
-            sale_date,
-            quantity_sold,
-            total_amount,
-            on_promotion
-        ))
-
-    print(f"  Inserting {len(sales_records):,} sales records...")
-
-    # Batch insert
-    batch_size = 10000
-    for i in range(0, len(sales_records), batch_size):
-        batch = sales_records[i:i+batch_size]
-        cur.executemany(
-            "INSERT INTO sales_data (product_id, sale_date, quantity_sold, total_amount, on_promotion) VALUES (%s, %s, %s, %s, %s)",
-            batch
-        )
+    if chunksize:
+        print(f"  Streaming train.csv in chunks of {chunksize:,} rows ({level} level)...")
+    else:
+        print(f"  Reading train.csv ({level} level)...")
+    started = time.time()
+
+    reader = pd.read_csv(train_path, usecols=TRAIN_COLUMNS, dtype=TRAIN_DTYPES,
+                         parse_dates=['date'], chunksize=chunksize)
+    if not chunksize:
+        reader = [reader]
+    elif level == 'family':
+        reader = complete_date_chunks(reader)
+
+    products = None
+    total_rows = 0
+    for chunk in reader:
+        agg, key_columns = prepare_sales_chunk(chunk, level)
+
+        # Create products the first time a family (or store x family) appears
+        keys = agg[key_columns].drop_duplicates()
+        if products is not None:
+            known = keys.set_index(key_columns).index.isin(products.set_index(key_columns).index)
+            keys = keys[~known]
+        if len(keys):
+            new_products = create_products(cur, keys)
+            products = new_products if products is None else pd.concat([products, new_products], ignore_index=True)
+
+        # Vectorized row preparation against the in-memory price map
+        agg = agg.merge(products, on=key_columns, how='left')
+        sales_records = pd.DataFrame({
+            'product_id': agg['product_id'].astype('int32'),
+            'sale_date': agg['date'].dt.date,
+            'quantity_sold': agg['sales'].astype('int64'),  # Sales is already in units
+            'on_promotion': agg['onpromotion'].fillna(0).astype('int64')
+        })
+        sales_records['total_amount'] = (sales_records['quantity_sold'] * agg['unit_price']).round(2)
+
+        insert_sales_records(cur, sales_records, use_staging=use_staging)
         conn.commit()
-        print(f"    Inserted {min(i+batch_size, len(sales_records)):,} / {len(sales_records):,} records")
+        total_rows += len(sales_records)
+        if chunksize:
+            print(f"    Inserted {total_rows:,} records")
+
+    elapsed = time.time() - started
+    rows_per_sec = total_rows / elapsed if elapsed > 0 else float('inf')
+
+    # Rebuild the daily rollup the read paths query
+    print("\nRefreshing daily aggregates...")
+    refresh_sales_daily(conn)
+    conn.commit()
+    invalidate_responses('sales', 'forecasts')
+    refresh_sales_store()
+    invalidate_history_panel()
+    invalidate_regressor_calendar()
 
     # Get date range
     cur.execute("SELECT MIN(sale_date) as min_date, MAX(sale_date) as max_date FROM sales_data")
@@ -222,10 +372,14 @@ def import_store_sales_data(data_dir):
     print("\n" + "="*60)
     print("Import completed successfully!")
     print("="*60)
-    print(f"Products imported: {len(product_id_map)}")
-    print(f"Sales records imported: {len(sales_records):,}")
+    print(f"Products imported: {0 if products is None else len(products)}")
+    print(f"Sales records imported: {total_rows:,}")
     print(f"Date range: {date_range['min_date']} to {date_range['max_date']}")
     print(f"Duration: {(date_range['max_date'] - date_range['min_date']).days} days")
+    print(f"Sales ingest: {elapsed:.1f}s ({rows_per_sec:,.0f} rows/sec)")
+    rss = peak_rss_mb()
+    if rss is not None:
+        print(f"Peak memory: {rss:,.0f} MB")
     print("\nYou can now use the forecaster with real Kaggle data!")
 
     cur.close()
@@ -235,7 +389,14 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Import Kaggle Store Sales dataset')
     parser.add_argument('--data-dir', type=str, default='data/store-sales',
                       help='Directory containing the extracted Kaggle CSV files')
+    parser.add_argument('--use-staging', action='store_true',
+                      help='COPY into an unlogged staging table, then merge into sales_data')
+    parser.add_argument('--chunksize', type=int, default=None,
+                      help='Stream train.csv in chunks of this many rows to bound memory')
+    parser.add_argument('--level', choices=['family', 'store'], default='family',
+                      help="'family' sums all stores per family; 'store' imports store x family products")
 
     args = parser.parse_args()
 
-    import_store_sales_data(args.data_dir)
+    import_store_sales_data(args.data_dir, use_staging=args.use_staging,
+                            chunksize=args.chunksize, level=args.level)
@@ -0,0 +1,324 @@
+"""
+Asynchronous forecast jobs backed by the forecast_jobs table.
+
+POST /api/forecast enqueues a job and returns immediately; a small pool of
+worker threads inside the API process claims queued jobs with
+SELECT ... FOR UPDATE SKIP LOCKED and runs generate_forecast_for_product.
+POST /api/forecast/batch, /api/forecast/hierarchy and /api/backtest queue
+'batch', 'hierarchy' and 'backtest' jobs the same way, which run
+batch_forecaster.run_batch_forecast, hierarchy.run_hierarchy_forecast and
+backtesting.run_backtest with the arguments stored in params.
+Postgres is the queue, so no external broker is needed and several API
+processes can share the same work safely.
+"""
+
+import threading
+import time
+from psycopg2.extras import Json
+from backtesting import run_backtest
+from batch_forecaster import run_batch_forecast
+from config import Config
+from database import get_db_connection
+from forecaster import InventoryForecaster
+from hierarchy import run_hierarchy_forecast
+
+JOB_COLUMNS = """
+    job_id, kind, product_id, forecast_days, params, status, result, error, attempts,
+    submitted_at, started_at, finished_at
+"""
+
+# INSERT/SELECT rounds submit_forecast_job tries before giving up
+SUBMIT_ATTEMPTS = 3
+
+# Arguments each job kind accepts (run_batch_forecast, run_hierarchy_forecast, run_backtest)
+JOB_PARAMS = {
+    'batch': ('product_ids', 'forecast_days', 'max_workers', 'timeout', 'engine', 'incremental'),
+    'hierarchy': ('method', 'forecast_days', 'max_workers'),
+    'backtest': ('product_ids', 'horizon', 'num_cutoffs', 'period', 'max_workers', 'engines')
+}
+
+
+def forecast_records(forecast_df):
+    """Convert a forecast DataFrame into the /api/forecast JSON records"""
+    dates = forecast_df['ds'].to_numpy().astype('datetime64[D]').astype(str).tolist()
+    return [
+        {
+            'forecast_date': ds,
+            'predicted_quantity': yhat,
+            'lower_bound': lower,
+            'upper_bound': upper
+        }
+        for ds, yhat, lower, upper in zip(dates, forecast_df['yhat'].tolist(),
+                                          forecast_df['yhat_lower'].tolist(), forecast_df['yhat_upper'].tolist())
+    ]
+
+
+def serialize_job(job):
+    """Make a forecast_jobs row JSON-friendly and add timing fields"""
+    job = dict(job)
+    queue_seconds = run_seconds = None
+    if job['started_at']:
+        queue_seconds = (job['started_at'] - job['submitted_at']).total_seconds()
+        if job['finished_at']:
+            run_seconds = (job['finished_at'] - job['started_at']).total_seconds()
+    for key in ('submitted_at', 'started_at', 'finished_at'):
+        if job[key]:
+            job[key] = job[key].isoformat()
+    job['queue_seconds'] = queue_seconds
+    job['run_seconds'] = run_seconds
+    return job
+
+
+def submit_forecast_job(product_id, forecast_days=30):
+    """Enqueue a forecast job, coalescing onto an in-flight job for the same request
+
+    Returns:
+        (job, created) where created is False if an existing job was reused
+
+    Raises ValueError if the product does not exist, and RuntimeError if no job
+    could be created or found in SUBMIT_ATTEMPTS tries.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute("SELECT 1 FROM products WHERE product_id = %s", (product_id,))
+    if cur.fetchone() is None:
+        cur.close()
+        conn.close()
+        raise ValueError(f"Product {product_id} not found")
+
+    # The in-flight job can finish between the INSERT and SELECT; submit again
+    for _ in range(SUBMIT_ATTEMPTS):
+        cur.execute(
+            f"""
+            INSERT INTO forecast_jobs (product_id, forecast_days)
+            VALUES (%s, %s)
+            ON CONFLICT (product_id, forecast_days) WHERE status IN ('queued', 'running')
+            DO NOTHING
+            RETURNING {JOB_COLUMNS}
+            """,
+            (product_id, forecast_days)
+        )
+        job = cur.fetchone()
+        created = job is not None
+
+        if not created:
+            cur.execute(
+                f"""
+                SELECT {JOB_COLUMNS} FROM forecast_jobs
+                WHERE product_id = %s AND forecast_days = %s AND status IN ('queued', 'running')
+                """,
+                (product_id, forecast_days)
+            )
+            job = cur.fetchone()
+
+        conn.commit()
+        if job is not None:
+            break
+
+    cur.close()
+    conn.close()
+
+    if job is None:
+        raise RuntimeError(f"Could not submit a forecast job for product {product_id} after "
+                           f"{SUBMIT_ATTEMPTS} attempts; in-flight jobs kept finishing mid-submit")
+
+    if created and _worker is not None:
+        _worker.wake()
+    return job, created
+
+
+def submit_job(kind, params):
+    """Enqueue a 'batch', 'hierarchy' or 'backtest' job; params are the arguments listed in JOB_PARAMS"""
+    params = {key: value for key, value in params.items() if key in JOB_PARAMS[kind] and value is not None}
+    # Backtests record their horizon in the forecast_days column
+    forecast_days = params.get('forecast_days', params.get('horizon', 30))
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        INSERT INTO forecast_jobs (kind, forecast_days, params)
+        VALUES (%s, %s, %s)
+        RETURNING {JOB_COLUMNS}
+        """,
+        (kind, forecast_days, Json(params))
+    )
+    job = cur.fetchone()
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    if _worker is not None:
+        _worker.wake()
+    return job
+
+
+def get_job(job_id):
+    """Fetch a job by id, or None"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(f"SELECT {JOB_COLUMNS} FROM forecast_jobs WHERE job_id = %s", (job_id,))
+    job = cur.fetchone()
+    cur.close()
+    conn.close()
+    return job
+
+
+def claim_next_job():
+    """Atomically move the oldest queued job to running and return it"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        UPDATE forecast_jobs
+        SET status = 'running', started_at = CURRENT_TIMESTAMP, attempts = attempts + 1
+        WHERE job_id = (
+            SELECT job_id FROM forecast_jobs
+            WHERE status = 'queued'
+            ORDER BY submitted_at
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING {JOB_COLUMNS}
+        """
+    )
+    job = cur.fetchone()
+    conn.commit()
+    cur.close()
+    conn.close()
+    return job
+
+
+def finish_job(job_id, result=None, error=None):
+    """Record the outcome of a running job"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE forecast_jobs
+        SET status = %s, result = %s, error = %s, finished_at = CURRENT_TIMESTAMP
+        WHERE job_id = %s
+        """,
+        ('failed' if error else 'succeeded', Json(result) if result is not None else None, error, job_id)
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def requeue_stale_jobs(stale_seconds):
+    """Put jobs left 'running' by a crashed worker back on the queue"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE forecast_jobs SET status = 'queued', started_at = NULL
+        WHERE status = 'running' AND started_at < CURRENT_TIMESTAMP - INTERVAL '%s seconds'
+        """,
+        (stale_seconds,)
+    )
+    requeued = cur.rowcount
+    conn.commit()
+    cur.close()
+    conn.close()
+    return requeued
+
+
+def run_batch_job(params):
+    """Run a batch job's forecast and return its JSON-friendly summary"""
+    params = dict(params)
+    if params.pop('incremental', False) and params.get('product_ids') is None:
+        params['product_ids'] = InventoryForecaster().get_products_with_new_data()
+    summary = run_batch_forecast(**params)
+    summary['failed'] = {str(k): v for k, v in summary['failed'].items()}
+    summary['durations'] = {str(k): v for k, v in summary['durations'].items()}
+    return summary
+
+
+def run_job(job):
+    """Execute one claimed job and store its result"""
+    try:
+        if job['kind'] == 'batch':
+            finish_job(job['job_id'], result=run_batch_job(job['params'] or {}))
+            return
+        if job['kind'] == 'hierarchy':
+            finish_job(job['job_id'], result=run_hierarchy_forecast(**(job['params'] or {})))
+            return
+        if job['kind'] == 'backtest':
+            finish_job(job['job_id'], result=run_backtest(**(job['params'] or {})))
+            return
+        forecast_df = InventoryForecaster().generate_forecast_for_product(job['product_id'], job['forecast_days'])
+        finish_job(job['job_id'], result={
+            'product_id': job['product_id'],
+            'forecast': forecast_records(forecast_df)
+        })
+    except Exception as e:
+        finish_job(job['job_id'], error=str(e))
+
+
+class JobWorker:
+    """Pool of daemon threads that drain the forecast job queue"""
+
+    def __init__(self, num_threads, poll_interval=2.0):
+        self.num_threads = num_threads
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        requeue_stale_jobs(Config.JOB_STALE_SECONDS)
+        for i in range(self.num_threads):
+            thread = threading.Thread(target=self._loop, name=f"forecast-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            try:
+                job = claim_next_job()
+            except Exception as e:
+                print(f"Forecast job worker could not poll queue: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            try:
+                run_job(job)
+            except Exception as e:
+                # finish_job itself failed (e.g. the database went away). Keep this
+                # thread alive; the job stays 'running' until a worker start requeues it
+                print(f"Forecast job worker could not record job {job['job_id']}: {e}")
+                self._wakeup.wait(self.poll_interval)
+
+
+_worker = None
+
+
+def start_job_worker(num_threads=None):
+    """Start the process-wide job worker (no-op if already running or disabled)"""
+    global _worker
+    num_threads = Config.JOB_WORKERS if num_threads is None else num_threads
+    if _worker is None and num_threads > 0:
+        _worker = JobWorker(num_threads, poll_interval=Config.JOB_POLL_INTERVAL)
+        _worker.start()
+    return _worker
+
+
+if __name__ == '__main__':
+    # Run a standalone worker process alongside (or instead of) the API's threads
+    print(f"Starting forecast job worker with {Config.JOB_WORKERS or 1} threads...")
+    start_job_worker(Config.JOB_WORKERS or 1)
+    while True:
+        time.sleep(3600)
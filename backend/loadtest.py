@@ -0,0 +1,122 @@
+"""
+HTTP load test for the API server.
+
+Sends requests from a pool of client threads for a fixed duration and reports
+throughput and latency percentiles per endpoint, so serving modes (dev server,
+gunicorn worker/thread counts, cache on/off) can be compared on the same data.
+Only the standard library is used.
+
+Usage:
+    python loadtest.py --url http://localhost:5000 --concurrency 16 --duration 30
+    python loadtest.py --product-ids 1,2,3 --endpoints products,historical --output load.json
+"""
+
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+ENDPOINTS = {
+    'products': '/api/products',
+    'historical': '/api/historical?product_id={product_id}&days_back=90',
+    'forecast': '/api/forecast/{product_id}',
+    'panel': '/api/historical/panel?product_ids={product_ids}&days_back=365',
+    'health': '/api/health'
+}
+
+
+def run_load(base_url, endpoints, product_ids, concurrency=8, duration=30):
+    """Hit the endpoints round-robin from `concurrency` threads for `duration` seconds
+
+    Returns {endpoint: {'latencies': [...], 'errors': n}}.
+    """
+    results = {name: {'latencies': [], 'errors': 0} for name in endpoints}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(worker):
+        i = worker
+        while time.perf_counter() < deadline:
+            name = endpoints[i % len(endpoints)]
+            product_id = product_ids[i % len(product_ids)]
+            path = ENDPOINTS[name].format(product_id=product_id,
+                                          product_ids=','.join(map(str, product_ids)))
+            i += 1
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base_url + path, timeout=60) as response:
+                    response.read()
+                ok = True
+            except (urllib.error.URLError, OSError):
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    results[name]['latencies'].append(elapsed)
+                else:
+                    results[name]['errors'] += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for worker in range(concurrency):
+            executor.submit(client, worker)
+    return results
+
+
+def summarize(results, duration):
+    summary = {}
+    for name, result in results.items():
+        latencies = np.array(result['latencies']) * 1000
+        summary[name] = {
+            'requests': len(latencies),
+            'errors': result['errors'],
+            'requests_per_second': round(len(latencies) / duration, 1),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 2) if len(latencies) else None,
+            'p95_ms': round(float(np.percentile(latencies, 95)), 2) if len(latencies) else None,
+            'p99_ms': round(float(np.percentile(latencies, 99)), 2) if len(latencies) else None
+        }
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the API server')
+    parser.add_argument('--url', type=str, default='http://localhost:5000',
+                      help='Base URL of the running server')
+    parser.add_argument('--endpoints', type=str, default='products,historical,forecast',
+                      help=f'Comma-separated endpoints from {list(ENDPOINTS)}')
+    parser.add_argument('--product-ids', type=str, default='1',
+                      help='Comma-separated product IDs to spread requests over')
+    parser.add_argument('--concurrency', type=int, default=8,
+                      help='Concurrent client threads')
+    parser.add_argument('--duration', type=float, default=30,
+                      help='Seconds to run')
+    parser.add_argument('--output', type=str, default=None,
+                      help='Write the JSON summary to this file')
+
+    args = parser.parse_args()
+    endpoints = args.endpoints.split(',')
+    unknown = [name for name in endpoints if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {unknown}")
+    product_ids = [int(pid) for pid in args.product_ids.split(',')]
+
+    print(f"Load testing {args.url} with {args.concurrency} clients for {args.duration:.0f}s...")
+    results = run_load(args.url, endpoints, product_ids, args.concurrency, args.duration)
+    summary = summarize(results, args.duration)
+
+    total = sum(stats['requests'] for stats in summary.values())
+    print(f"\n{'endpoint':<14}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in summary.items():
+        cols = [stats[k] if stats[k] is not None else float('nan') for k in ('p50_ms', 'p95_ms', 'p99_ms')]
+        print(f"{name:<14}{stats['requests']:>10}{stats['errors']:>8}{stats['requests_per_second']:>10.1f}"
+              f"{cols[0]:>10.2f}{cols[1]:>10.2f}{cols[2]:>10.2f}")
+    print(f"\nTotal: {total / args.duration:.1f} requests/second")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'url': args.url, 'concurrency': args.concurrency, 'duration': args.duration,
+                       'endpoints': summary}, f, indent=2)
+        print(f"\nResults written to {args.output}")
@@ -0,0 +1,159 @@
+"""
+In-process timing metrics, exported in Prometheus text format.
+
+    forecast_stage_seconds{stage}       spans inside train_and_forecast / save_forecasts
+    http_request_seconds{method,endpoint,status}
+    db_query_seconds{operation}         every statement run through InstrumentedCursor
+
+Metrics are histograms kept per process (each server or pool worker process
+reports its own). InstrumentedCursor also keeps per-thread DB time and query
+counts for the current request, which app.py returns in a Server-Timing
+header.
+"""
+
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from psycopg2.extras import RealDictCursor
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+HELP = {
+    'forecast_stage_seconds': 'Duration of forecast pipeline stages',
+    'http_request_seconds': 'Duration of API requests',
+    'db_query_seconds': 'Duration of database statements'
+}
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count for one label set"""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    # Per-thread DB counters, reset at the start of each request
+    def reset_request(self):
+        self._local.db_queries = 0
+        self._local.db_seconds = 0.0
+
+    def add_db_time(self, seconds):
+        self._local.db_queries = getattr(self._local, 'db_queries', 0) + 1
+        self._local.db_seconds = getattr(self._local, 'db_seconds', 0.0) + seconds
+
+    def request_db_stats(self):
+        return getattr(self._local, 'db_queries', 0), getattr(self._local, 'db_seconds', 0.0)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: (list(h.counts), h.total, h.count) for key, h in self._histograms.items()}
+
+
+registry = Registry()
+
+
+@contextmanager
+def span(stage, metric='forecast_stage_seconds', **labels):
+    """Time a block into a histogram (default forecast_stage_seconds{stage=...})"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(metric, time.perf_counter() - started, stage=stage, **labels)
+
+
+def timed(stage, metric='forecast_stage_seconds'):
+    """Decorator form of span()"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage, metric):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class InstrumentedCursor(RealDictCursor):
+    """RealDictCursor that records the duration of every statement"""
+
+    def _timed(self, method, query, *args):
+        started = time.perf_counter()
+        try:
+            return method(query, *args)
+        finally:
+            elapsed = time.perf_counter() - started
+            text = query.decode() if isinstance(query, bytes) else str(query)
+            operation = text.lstrip().split(None, 1)[0].upper() if text.strip() else 'UNKNOWN'
+            registry.observe('db_query_seconds', elapsed, operation=operation)
+            registry.add_db_time(elapsed)
+
+    def execute(self, query, vars=None):
+        return self._timed(super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._timed(super().executemany, query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(super().copy_expert, sql, file, size)
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in items]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def render_prometheus(extra=None):
+    """Prometheus text exposition of all histograms plus extra samples
+
+    extra: {metric_name: (type, help, value)} with type 'gauge' or 'counter'
+    """
+    lines = []
+    by_name = {}
+    for (name, labels), values in sorted(registry.snapshot().items()):
+        by_name.setdefault(name, []).append((labels, values))
+
+    for name, series in by_name.items():
+        lines.append(f"# HELP {name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, (counts, total, count) in series:
+            for bound, bucket_count in zip(BUCKETS, counts):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+    for name, (kind, help_text, value) in (extra or {}).items():
+        if value is None:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {float(value)}")
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,177 @@
+"""
+On-disk cache of fitted Prophet models.
+
+Models are stored as Prophet JSON, keyed by product_id, a hash of the model
+configuration and a fingerprint of the training data (row count, last date
+and a checksum of the training columns). When a product's data has not
+changed since its last fit, the forecaster loads the stored model and only
+runs predict. Least recently used entries are evicted once the cache
+exceeds its entry or size limit.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from config import Config
+
+# Bump to invalidate every cached model after changing how models are built
+CACHE_VERSION = 1
+
+
+def _serialize():
+    """prophet.serialize, imported on first use so the API starts without Prophet"""
+    from prophet import serialize
+    return serialize
+
+
+def data_fingerprint(df, columns):
+    """Fingerprint of the training data: row count, last date and content checksum"""
+    digest = hashlib.sha1()
+    for col in columns:
+        if col == 'ds':
+            values = df[col].values.astype('datetime64[D]').astype(np.int64)
+        else:
+            values = df[col].values.astype(np.float64)
+        digest.update(np.ascontiguousarray(values).tobytes())
+    last_date = df['ds'].max().strftime('%Y%m%d') if len(df) else 'empty'
+    return f"{len(df)}-{last_date}-{digest.hexdigest()[:16]}"
+
+
+def config_hash(config):
+    """Stable short hash of a model configuration dict"""
+    payload = json.dumps({'version': CACHE_VERSION, **config}, sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()[:12]
+
+
+class ModelCache:
+    """LRU cache of serialized Prophet models in a local directory"""
+
+    def __init__(self, directory, max_entries=500, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, product_id, config_key, fingerprint):
+        return os.path.join(self.directory, f"{product_id}_{config_key}_{fingerprint}.json")
+
+    def get(self, product_id, config, df, columns):
+        """Return the cached model for this product/config/data, or None"""
+        path = self._path(product_id, config_hash(config), data_fingerprint(df, columns))
+        try:
+            with open(path, 'r') as f:
+                model = _serialize().model_from_json(f.read())
+        except (FileNotFoundError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # Touch so eviction sees this entry as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # evicted by another thread since we read it
+        with self._lock:
+            self.hits += 1
+        return model
+
+    def get_latest(self, product_id, config):
+        """Return the most recent model for this product/config whatever data it saw
+
+        Used to warm-start a refit after new rows arrive.
+        """
+        prefix = f"{product_id}_{config_hash(config)}_"
+        candidates = [(mtime, path) for mtime, _, path in self._entries()
+                      if os.path.basename(path).startswith(prefix)]
+        if not candidates:
+            return None
+        try:
+            with open(max(candidates)[1], 'r') as f:
+                return _serialize().model_from_json(f.read())
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def put(self, product_id, config, df, columns, model):
+        """Store a fitted model, replacing older fits for the same product/config"""
+        config_key = config_hash(config)
+        path = self._path(product_id, config_key, data_fingerprint(df, columns))
+        prefix = f"{product_id}_{config_key}_"
+
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(_serialize().model_to_json(model))
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            for name in os.listdir(self.directory):
+                stale = os.path.join(self.directory, name)
+                if name.startswith(prefix) and name.endswith('.json') and stale != path:
+                    self._remove(stale)
+            self._evict()
+
+    def invalidate(self, product_id=None):
+        """Drop cached models for one product, or all of them"""
+        with self._lock:
+            for name in os.listdir(self.directory):
+                if name.endswith('.json') and (product_id is None or name.startswith(f"{product_id}_")):
+                    self._remove(os.path.join(self.directory, name))
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, os.path.join(self.directory, name)))
+        return sorted(entries)
+
+    def _evict(self):
+        entries = self._entries()
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+            _, size, path = entries.pop(0)
+            self._remove(path)
+            total_bytes -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_model_cache():
+    """Process-wide model cache, or None when MODEL_CACHE_ENABLED is off"""
+    global _cache
+    if not Config.MODEL_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ModelCache(
+                Config.MODEL_CACHE_DIR,
+                max_entries=Config.MODEL_CACHE_MAX_ENTRIES,
+                max_bytes=Config.MODEL_CACHE_MAX_MB * 1024 * 1024
+            )
+        return _cache
@@ -0,0 +1,252 @@
+"""
+Vectorized statistical forecast engines and the engine selection policy.
+
+Every engine forecasts a whole (days x series) matrix in one pass of NumPy
+array operations, so thousands of short or sparse products (e.g. BOOKS,
+MAGAZINES) cost less than a single Stan fit:
+
+    seasonal_naive  weekday means of the last few weeks
+    holt_winters    additive damped-trend Holt-Winters, weekly season, with
+                    the smoothing constants picked per series from a small grid
+    croston         Croston/SBA for intermittent demand
+
+NaN marks days before a series started; gaps inside a series are zero sales.
+Prophet is only used over a statistical engine when stored backtest errors
+show it is worth the cost (see select_engines). The 'global' engine
+(global_model.py) is selected explicitly only.
+"""
+
+import numpy as np
+import pandas as pd
+from config import Config
+from database import get_db_connection
+
+SEASON = 7
+Z_95 = 1.96
+
+STATISTICAL_ENGINES = ['seasonal_naive', 'holt_winters', 'croston']
+ENGINES = ['auto', 'prophet', 'global'] + STATISTICAL_ENGINES
+
+
+def fill_leading(y, season=SEASON):
+    """Replace each column's leading NaNs by repeating its first observed season backwards"""
+    y = np.asarray(y, dtype=float)
+    observed = ~np.isnan(y)
+    first = np.where(observed.any(axis=0), observed.argmax(axis=0), len(y))
+    t = np.arange(len(y))[:, None]
+    source = np.where(t < first, first + (t - first) % season, t)
+    source = np.minimum(source, len(y) - 1)
+    filled = np.take_along_axis(y, source, axis=0)
+    return np.nan_to_num(filled, nan=0.0)
+
+
+def observed_days(y):
+    """Days since each column's first observation"""
+    return (~np.isnan(y)).sum(axis=0) if len(y) else np.zeros(y.shape[1], dtype=int)
+
+
+class ForecastEngine:
+    """Statistical engine interface
+
+    forecast(y, forecast_days) takes a (days x series) matrix and returns
+    (yhat, lower, upper) arrays of shape (forecast_days x series) with 95%
+    intervals.
+    """
+
+    name = None
+
+    def forecast(self, y, forecast_days):
+        raise NotImplementedError
+
+
+class SeasonalNaiveEngine(ForecastEngine):
+    name = 'seasonal_naive'
+
+    def __init__(self, weeks=4):
+        self.weeks = weeks
+
+    def forecast(self, y, forecast_days):
+        y = fill_leading(y)
+        weeks = min(self.weeks, len(y) // SEASON)
+        steps = np.arange(forecast_days)
+        if weeks == 0:
+            yhat = np.repeat(y.mean(axis=0, keepdims=True), forecast_days, axis=0)
+            sigma = y.std(axis=0)
+        else:
+            window = y[len(y) - SEASON * weeks:]
+            profile = window.reshape(weeks, SEASON, -1).mean(axis=0)
+            # Align the weekday profile with the day after the last observation
+            yhat = profile[steps % SEASON]
+            sigma = (y[SEASON:] - y[:-SEASON]).std(axis=0) if len(y) > SEASON else y.std(axis=0)
+
+        half_width = Z_95 * sigma * np.sqrt(1 + steps // SEASON)[:, None]
+        return yhat, yhat - half_width, yhat + half_width
+
+
+class HoltWintersEngine(ForecastEngine):
+    """Additive Holt-Winters with damped trend, state updated for all series at once"""
+
+    name = 'holt_winters'
+
+    ALPHAS = (0.05, 0.2, 0.5)
+    GAMMAS = (0.05, 0.2)
+    BETA = 0.02
+    PHI = 0.98
+
+    def forecast(self, y, forecast_days):
+        if len(y) < 2 * SEASON:
+            return SeasonalNaiveEngine().forecast(y, forecast_days)
+
+        y = fill_leading(y)
+        grid = np.array([(a, g) for a in self.ALPHAS for g in self.GAMMAS])
+        alpha, gamma = grid[:, 0, None], grid[:, 1, None]
+        num_series = y.shape[1]
+
+        # State per (grid point, series); season holds one slot per weekday
+        level = np.broadcast_to(y[:SEASON].mean(axis=0), (len(grid), num_series)).copy()
+        trend = np.zeros_like(level)
+        season = np.broadcast_to((y[:SEASON] - y[:SEASON].mean(axis=0))[:, None, :],
+                                 (SEASON, len(grid), num_series)).copy()
+        sse = np.zeros_like(level)
+
+        for t in range(SEASON, len(y)):
+            slot = t % SEASON
+            s = season[slot]
+            error = y[t] - (level + self.PHI * trend + s)
+            sse += error ** 2
+            new_level = alpha * (y[t] - s) + (1 - alpha) * (level + self.PHI * trend)
+            trend = self.BETA * (new_level - level) + (1 - self.BETA) * self.PHI * trend
+            season[slot] = gamma * (y[t] - new_level) + (1 - gamma) * s
+            level = new_level
+
+        best = sse.argmin(axis=0)
+        columns = np.arange(num_series)
+        level, trend, sse = level[best, columns], trend[best, columns], sse[best, columns]
+        season = season[:, best, columns]
+
+        steps = np.arange(1, forecast_days + 1)
+        damping = np.cumsum(self.PHI ** steps)[:, None]
+        yhat = level + damping * trend + season[(len(y) + steps - 1) % SEASON]
+
+        sigma = np.sqrt(sse / (len(y) - SEASON))
+        half_width = Z_95 * sigma * np.sqrt(steps)[:, None]
+        return yhat, yhat - half_width, yhat + half_width
+
+
+class CrostonEngine(ForecastEngine):
+    """Croston's method with the Syntetos-Boylan bias correction"""
+
+    name = 'croston'
+
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+
+    def forecast(self, y, forecast_days):
+        started = ~np.isnan(y)
+        y = np.nan_to_num(y, nan=0.0)
+        demand = y > 0
+
+        # Initialise size and interval from each series' overall averages
+        counts = demand.sum(axis=0)
+        size = np.where(counts > 0, y.sum(axis=0) / np.maximum(counts, 1), 0.0)
+        interval = np.where(counts > 0, started.sum(axis=0) / np.maximum(counts, 1), 1.0)
+        since_last = np.zeros(y.shape[1])
+        squared_error = np.zeros(y.shape[1])
+
+        for t in range(len(y)):
+            squared_error += np.where(started[t], (y[t] - size / interval) ** 2, 0.0)
+            since_last += started[t]
+            hit = demand[t]
+            size = np.where(hit, size + self.alpha * (y[t] - size), size)
+            interval = np.where(hit, interval + self.alpha * (since_last - interval), interval)
+            since_last = np.where(hit, 0, since_last)
+
+        rate = (1 - self.alpha / 2) * size / interval
+        yhat = np.repeat(rate[None, :], forecast_days, axis=0)
+        sigma = np.sqrt(squared_error / np.maximum(started.sum(axis=0), 1))
+        return yhat, yhat - Z_95 * sigma, yhat + Z_95 * sigma
+
+
+_ENGINES = {engine.name: engine for engine in (SeasonalNaiveEngine(), HoltWintersEngine(), CrostonEngine())}
+
+
+def get_engine(name):
+    if name not in _ENGINES:
+        raise ValueError(f"Unknown statistical engine '{name}'; expected one of {STATISTICAL_ENGINES}")
+    return _ENGINES[name]
+
+
+def history_matrix(df, days=None, column='y'):
+    """(days x 1) matrix from a forecaster history DataFrame, gaps filled with 0"""
+    series = pd.Series(df[column].to_numpy(dtype=float), index=pd.DatetimeIndex(df['ds']))
+    series = series.groupby(level=0).sum().asfreq('D', fill_value=0.0)
+    days = days or Config.STAT_HISTORY_DAYS
+    return series.to_numpy()[-days:, None]
+
+
+def forecast_frames(last_date, yhat, lower, upper):
+    """One forecaster-shaped DataFrame (ds, yhat, yhat_lower, yhat_upper) per column"""
+    ds = pd.date_range(pd.Timestamp(last_date) + pd.Timedelta(days=1), periods=len(yhat), freq='D')
+    return [
+        pd.DataFrame({'ds': ds, 'yhat': yhat[:, i], 'yhat_lower': lower[:, i], 'yhat_upper': upper[:, i]})
+        for i in range(yhat.shape[1])
+    ]
+
+
+def default_engines(y):
+    """Statistical engine per column from its shape: Croston if intermittent,
+    Holt-Winters with at least two weeks of history, otherwise seasonal naive"""
+    observed = ~np.isnan(y)
+    zero_share = ((y == 0) & observed).sum(axis=0) / np.maximum(observed.sum(axis=0), 1)
+    names = np.where(observed.sum(axis=0) >= 2 * SEASON, 'holt_winters', 'seasonal_naive').astype(object)
+    names[zero_share >= Config.INTERMITTENT_ZERO_SHARE] = 'croston'
+    return names
+
+
+def select_engines(y, backtest_errors=None):
+    """Engine name for every column of y
+
+    Args:
+        y: (days x series) recent history matrix, NaN before a series started
+        backtest_errors: Optional list with a {engine: mae} dict per series
+
+    The best statistical engine is taken from the backtest if one was scored,
+    else from default_engines. Prophet is used instead only when the backtest
+    shows its MAE beating that engine's by ENGINE_ESCALATION_MARGIN.
+    """
+    names = default_engines(y)
+
+    for i in range(len(names)):
+        errors = (backtest_errors[i] if backtest_errors is not None else None) or {}
+        scored = {name: mae for name, mae in errors.items() if name in STATISTICAL_ENGINES}
+        if not scored:
+            continue
+        names[i] = min(scored, key=scored.get)
+        if 'prophet' in errors and errors['prophet'] < (1 - Config.ENGINE_ESCALATION_MARGIN) * scored[names[i]]:
+            names[i] = 'prophet'
+    return names
+
+
+def load_backtest_errors(product_ids):
+    """Mean MAE per product and engine from each engine's latest backtest run"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT r.product_id, r.engine, AVG(r.mae) AS mae
+        FROM backtest_results r
+        WHERE r.product_id = ANY(%s)
+        AND r.run_id = (
+            SELECT MAX(run_id) FROM backtest_results
+            WHERE product_id = r.product_id AND engine = r.engine
+        )
+        GROUP BY r.product_id, r.engine
+        """,
+        (list(product_ids),)
+    )
+    errors = {}
+    for row in cur.fetchall():
+        errors.setdefault(row['product_id'], {})[row['engine']] = float(row['mae'])
+    cur.close()
+    conn.close()
+    return errors
@@ -0,0 +1,392 @@
+"""
+Monthly partitions of sales_data and sales_daily, and their Parquet archive.
+
+Both tables are range-partitioned on sale_date with one partition per month
+(sales_data_2017_08, sales_daily_2017_08, ...). Loaders call
+ensure_partitions() for the dates they are about to write, and re-imports
+clear whole partitions with TRUNCATE instead of deleting rows.
+
+Cold months can be archived: each month's sales_data and sales_daily rows are
+written to data/sales_archive/<table>/YYYY_MM.parquet and the partitions are
+dropped.
+
+Files are written as YYYY_MM.parquet.pending and only renamed once the DROP
+has committed, so readers never see a month both archived and in Postgres.
+Pending files left by an interrupted run are finished (or discarded, if the
+partition still exists) by the next archive or restore.
+
+The history panel and the forecaster read archived sales_daily months back
+through archived_history(), so archiving doesn't change forecasts.
+
+A month stays archived until it is restored; writing new rows into an
+archived month is refused.
+
+Usage:
+    python partitions.py list
+    python partitions.py migrate                   # convert unpartitioned tables
+    python partitions.py archive --before 2016-01-01
+    python partitions.py restore --month 2015-06
+"""
+
+import argparse
+import glob
+import os
+import re
+from datetime import date
+import pandas as pd
+from config import Config
+from database import copy_dataframe, get_db_connection, query_frame
+
+TABLES = ('sales_data', 'sales_daily')
+
+ARCHIVE_COLUMNS = {
+    'sales_data': ['product_id', 'sale_date', 'quantity_sold', 'total_amount', 'on_promotion'],
+    'sales_daily': ['product_id', 'sale_date', 'quantity_sold', 'total_amount', 'on_promotion',
+                    'oil_price', 'is_holiday']
+}
+
+MONTH_SUFFIX = re.compile(r'_(\d{4})_(\d{2})$')
+ARCHIVE_FILE = re.compile(r'^(\d{4})_(\d{2})\.parquet$')
+
+# pg_advisory_lock key held while archiving or restoring
+ARCHIVE_LOCK = 7_210_021
+
+
+def month_start(day):
+    day = pd.Timestamp(day)
+    return date(day.year, day.month, 1)
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_{month.year:04d}_{month.month:02d}"
+
+
+def is_partitioned(cur, table):
+    cur.execute(
+        """
+        SELECT 1 FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = %s
+        """,
+        (table,)
+    )
+    return cur.fetchone() is not None
+
+
+def list_partitions(cur, table):
+    """{month: partition name} of a table's monthly partitions"""
+    cur.execute(
+        """
+        SELECT c.relname AS name
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s
+        """,
+        (table,)
+    )
+    partitions = {}
+    for row in cur.fetchall():
+        match = MONTH_SUFFIX.search(row['name'])
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = row['name']
+    return partitions
+
+
+def ensure_partitions(cur, table, start, end):
+    """Create the monthly partitions covering start..end (no-op if unpartitioned)
+
+    Returns the names of partitions that were missing.
+    """
+    if start is None or end is None or pd.isna(start) or not is_partitioned(cur, table):
+        return []
+
+    months = []
+    month = month_start(start)
+    while month <= month_start(end):
+        months.append(month)
+        month = next_month(month)
+
+    archived = archived_months(table).intersection(months)
+    if archived:
+        raise ValueError(f"{table} months {sorted(m.isoformat()[:7] for m in archived)} are archived; "
+                         f"restore them before writing (python partitions.py restore --month YYYY-MM)")
+
+    existing = list_partitions(cur, table)
+    created = []
+    for month in months:
+        if month in existing:
+            continue
+        name = partition_name(table, month)
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+            (month, next_month(month))
+        )
+        created.append(name)
+    return created
+
+
+def clear_sales(cur, table):
+    """Remove all rows of one partitioned table (full rebuilds); its archive is kept"""
+    cur.execute(f"TRUNCATE {table}")
+
+
+def truncate_sales(cur):
+    """Clear all sales and rollup data, including the Parquet archive (full re-imports)"""
+    cur.execute("TRUNCATE sales_daily, sales_data")
+    for table in TABLES:
+        for pattern in ('*.parquet', '*.parquet.pending'):
+            for path in glob.glob(os.path.join(Config.SALES_ARCHIVE_DIR, table, pattern)):
+                os.remove(path)
+
+
+def _archive_path(table, month):
+    return os.path.join(Config.SALES_ARCHIVE_DIR, table, f"{month.year:04d}_{month.month:02d}.parquet")
+
+
+def _pending_path(table, month):
+    return _archive_path(table, month) + '.pending'
+
+
+def resolve_pending_archives(cur):
+    """Finish or discard archive files left pending by an interrupted archive run
+
+    A pending file whose partition is gone was dropped by a committed
+    transaction and is renamed into the archive; otherwise the DROP never
+    committed and the file is removed.
+    """
+    for table in TABLES:
+        paths = glob.glob(os.path.join(Config.SALES_ARCHIVE_DIR, table, '*.parquet.pending'))
+        if not paths:
+            continue
+        partitions = list_partitions(cur, table)
+        for path in paths:
+            match = ARCHIVE_FILE.match(os.path.basename(path)[:-len('.pending')])
+            if match is None:
+                continue
+            month = date(int(match.group(1)), int(match.group(2)), 1)
+            if month in partitions:
+                os.remove(path)
+            else:
+                os.replace(path, _archive_path(table, month))
+
+
+def archived_months(table='sales_daily'):
+    """Months of a table that are in the Parquet archive"""
+    months = set()
+    for path in glob.glob(os.path.join(Config.SALES_ARCHIVE_DIR, table, '*.parquet')):
+        match = ARCHIVE_FILE.match(os.path.basename(path))
+        if match:
+            months.add(date(int(match.group(1)), int(match.group(2)), 1))
+    return months
+
+
+def archived_history(product_ids=None, since=None):
+    """Archived sales_daily rows, optionally for some products and from `since`
+
+    Returns a DataFrame with the sales_daily columns (empty if nothing is archived).
+    """
+    months = sorted(archived_months())
+    if since is not None:
+        since = pd.Timestamp(since).date()
+        months = [month for month in months if next_month(month) > since]
+
+    filters = [('product_id', 'in', list(product_ids))] if product_ids is not None else None
+    frames = [pd.read_parquet(_archive_path('sales_daily', month), filters=filters) for month in months]
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame(columns=ARCHIVE_COLUMNS['sales_daily'])
+
+    df = pd.concat(frames, ignore_index=True)
+    df['sale_date'] = pd.to_datetime(df['sale_date'])
+    if since is not None:
+        df = df[df['sale_date'] >= pd.Timestamp(since)]
+    return df
+
+
+def _lock_archive(cur):
+    # One archive/restore at a time, so pending files always belong to a finished run
+    cur.execute("SELECT pg_advisory_lock(%s)", (ARCHIVE_LOCK,))
+    resolve_pending_archives(cur)
+
+
+def _unlock_archive(conn, cur):
+    conn.rollback()
+    cur.execute("SELECT pg_advisory_unlock(%s)", (ARCHIVE_LOCK,))
+    cur.close()
+    conn.close()
+
+
+def archive_partitions(before):
+    """Move every month ending on or before `before` to Parquet and drop its partitions
+
+    Each month is written (both tables) and dropped in its own transaction.
+    Returns {month: rows archived from sales_data}.
+    """
+    before = pd.Timestamp(before).date()
+    conn = get_db_connection()
+    cur = conn.cursor()
+    if not all(is_partitioned(cur, table) for table in TABLES):
+        cur.close()
+        conn.close()
+        raise ValueError("sales tables are not partitioned; run `python partitions.py migrate` first")
+
+    _lock_archive(cur)
+    archived = {}
+    try:
+        partitions = {table: list_partitions(cur, table) for table in TABLES}
+        months = sorted(month for month in set(partitions['sales_data']) | set(partitions['sales_daily'])
+                        if next_month(month) <= before)
+
+        for month in months:
+            rows = 0
+            written = []
+            for table in TABLES:
+                name = partitions[table].get(month)
+                if name is None:
+                    continue
+                df = query_frame(f"SELECT {', '.join(ARCHIVE_COLUMNS[table])} FROM {name}",
+                                 parse_dates=['sale_date'], conn=conn)
+                path = _pending_path(table, month)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                df.to_parquet(path, index=False)
+                written.append(table)
+                cur.execute(f"DROP TABLE {name}")
+                if table == 'sales_data':
+                    rows = len(df)
+            conn.commit()
+            # Published only now that the partitions are gone
+            for table in written:
+                os.replace(_pending_path(table, month), _archive_path(table, month))
+            archived[month] = rows
+            print(f"  Archived {month.isoformat()[:7]}: {rows:,} sales rows")
+    finally:
+        _unlock_archive(conn, cur)
+
+    # Imported here: storage reads the archive through this module
+    from history_panel import invalidate_history_panel
+    from storage import refresh_sales_store
+    refresh_sales_store(months=[])
+    invalidate_history_panel()
+    return archived
+
+
+def restore_partition(month):
+    """Load an archived month back into fresh partitions and delete its Parquet files
+
+    The files are set aside as pending first, so the month is never read
+    from both the archive and the new partitions.
+    """
+    month = month_start(month)
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    _lock_archive(cur)
+    restored = {}
+    try:
+        tables = [table for table in TABLES if os.path.exists(_archive_path(table, month))]
+        for table in tables:
+            os.replace(_archive_path(table, month), _pending_path(table, month))
+        try:
+            for table in tables:
+                df = pd.read_parquet(_pending_path(table, month))
+                cur.execute(
+                    f"CREATE TABLE {partition_name(table, month)} PARTITION OF {table} "
+                    f"FOR VALUES FROM (%s) TO (%s)",
+                    (month, next_month(month))
+                )
+                restored[table] = copy_dataframe(cur, df, table, ARCHIVE_COLUMNS[table])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            for table in tables:
+                os.replace(_pending_path(table, month), _archive_path(table, month))
+            raise
+
+        for table in tables:
+            os.remove(_pending_path(table, month))
+    finally:
+        _unlock_archive(conn, cur)
+
+    from history_panel import invalidate_history_panel
+    from storage import refresh_sales_store
+    refresh_sales_store(months=[month])
+    invalidate_history_panel()
+    return restored
+
+
+def migrate_to_partitions():
+    """Convert unpartitioned sales_data / sales_daily tables in place (one transaction)"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    pending = [table for table in TABLES if not is_partitioned(cur, table)]
+    if not pending:
+        print("sales_data and sales_daily are already partitioned.")
+        cur.close()
+        conn.close()
+        return
+
+    for table in pending:
+        # Free the names the partitioned tables and their indexes will use
+        cur.execute(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned")
+        cur.execute(f"ALTER TABLE {table}_unpartitioned RENAME CONSTRAINT {table}_pkey TO {table}_unpartitioned_pkey")
+    cur.execute("DROP INDEX IF EXISTS idx_sales_date, idx_sales_date_brin, idx_sales_product_date, "
+                "idx_sales_daily_date_brin")
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database', 'schema.sql')) as f:
+        cur.execute(f.read())
+
+    for table in pending:
+        columns = ', '.join(ARCHIVE_COLUMNS[table])
+        cur.execute(f"SELECT MIN(sale_date) AS first, MAX(sale_date) AS last FROM {table}_unpartitioned")
+        bounds = cur.fetchone()
+        ensure_partitions(cur, table, bounds['first'], bounds['last'])
+        cur.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {table}_unpartitioned")
+        print(f"  {table}: moved {cur.rowcount:,} rows into monthly partitions")
+        cur.execute(f"DROP TABLE {table}_unpartitioned")
+
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage monthly sales partitions and their Parquet archive')
+    parser.add_argument('command', choices=['list', 'migrate', 'archive', 'restore'])
+    parser.add_argument('--before', type=str, default=None,
+                      help='archive: months ending on or before YYYY-MM-DD')
+    parser.add_argument('--month', type=str, default=None,
+                      help='restore: month to restore (YYYY-MM)')
+
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        conn = get_db_connection()
+        cur = conn.cursor()
+        for table in TABLES:
+            if not is_partitioned(cur, table):
+                print(f"{table}: not partitioned (run `python partitions.py migrate`)")
+                continue
+            months = sorted(list_partitions(cur, table))
+            span = f"{months[0].isoformat()[:7]} .. {months[-1].isoformat()[:7]}" if months else "none"
+            print(f"{table}: {len(months)} partitions ({span}), {len(archived_months(table))} archived months")
+        cur.close()
+        conn.close()
+    elif args.command == 'migrate':
+        print("Converting sales tables to monthly partitions...")
+        migrate_to_partitions()
+    elif args.command == 'archive':
+        if not args.before:
+            parser.error("archive needs --before YYYY-MM-DD")
+        print(f"Archiving months before {args.before} to {Config.SALES_ARCHIVE_DIR}...")
+        archived = archive_partitions(args.before)
+        print(f"Archived {len(archived)} months, {sum(archived.values()):,} sales rows")
+    else:
+        if not args.month:
+            parser.error("restore needs --month YYYY-MM")
+        restored = restore_partition(f"{args.month}-01")
+        print(f"Restored {args.month}: {restored}")
@@ -0,0 +1,142 @@
+"""
+Process-wide calendar of the global forecast regressors.
+
+Oil prices and holidays are the same for every product, so they are loaded
+once into dense day-indexed NumPy arrays instead of being re-joined and
+re-filled per product:
+
+    oil_price   forward/backward filled over the calendar, and carried past
+                the last known price
+    national    holiday flags by locale level (any region / city for
+    regional    regional and local)
+    local
+
+A holiday counts on the day it is actually observed: rows marked
+`transferred` are skipped (the day off moved to a 'Transfer' row) and
+'Work Day' rows, which make up for bridge days, are not holidays. Dates
+outside the loaded range have no holiday.
+
+Lookups are vectorized: a date array becomes integer offsets into the
+arrays. Importers call invalidate_regressor_calendar() after loading oil or
+holiday data; that bumps a version file so every server process reloads on
+its next lookup.
+"""
+
+import os
+import threading
+import time
+import numpy as np
+from config import Config
+from database import query_frame
+
+LOCALES = ('National', 'Regional', 'Local')
+
+OIL_QUERY = "SELECT date, dcoilwtico FROM oil_prices WHERE dcoilwtico IS NOT NULL ORDER BY date"
+
+HOLIDAY_QUERY = """
+    SELECT date, locale
+    FROM holidays
+    WHERE NOT COALESCE(transferred, FALSE)
+    AND COALESCE(type, '') <> 'Work Day'
+"""
+
+
+class RegressorCalendar:
+    """Dense daily oil price and holiday arrays from `start` to `end` inclusive"""
+
+    def __init__(self, oil, holidays):
+        oil_dates = oil['date'].values.astype('datetime64[D]')
+        holiday_dates = holidays['date'].values.astype('datetime64[D]')
+        known = np.concatenate([oil_dates, holiday_dates])
+        if len(known) == 0:
+            today = np.datetime64('today', 'D')
+            known = np.array([today, today])
+        self.start = known.min()
+        self.end = known.max()
+        days = int((self.end - self.start).astype(int)) + 1
+
+        self.oil_price = np.full(days, np.nan)
+        self.oil_price[(oil_dates - self.start).astype(int)] = oil['dcoilwtico'].values
+        self._fill(self.oil_price)
+
+        self.holidays = {}
+        for locale in LOCALES:
+            flags = np.zeros(days, dtype=np.int8)
+            dates = holiday_dates[holidays['locale'].values == locale]
+            flags[(dates - self.start).astype(int)] = 1
+            self.holidays[locale] = flags
+
+    @staticmethod
+    def _fill(values):
+        """In-place forward fill, then backward fill, then 0"""
+        known = ~np.isnan(values)
+        if not known.any():
+            values[:] = 0.0
+            return
+        index = np.where(known, np.arange(len(values)), 0)
+        np.maximum.accumulate(index, out=index)
+        index[:np.argmax(known)] = np.argmax(known)
+        values[:] = values[index]
+
+    def _positions(self, dates):
+        """Offsets of dates into the arrays, and a mask of those inside the range"""
+        offsets = (np.asarray(dates).astype('datetime64[D]') - self.start).astype(int)
+        inside = (offsets >= 0) & (offsets < len(self.oil_price))
+        return np.clip(offsets, 0, len(self.oil_price) - 1), inside
+
+    def oil(self, dates):
+        """Oil price per date; dates past the end get the last known price"""
+        offsets, _ = self._positions(dates)
+        return self.oil_price[offsets]
+
+    def is_holiday(self, dates, locale='National'):
+        """0/1 holiday flag per date for one locale level"""
+        offsets, inside = self._positions(dates)
+        return np.where(inside, self.holidays[locale][offsets], 0).astype(np.int8)
+
+
+def load_regressor_calendar(conn=None):
+    """Build the calendar from the oil_prices and holidays tables"""
+    oil = query_frame(OIL_QUERY, parse_dates=['date'], conn=conn)
+    holidays = query_frame(HOLIDAY_QUERY, parse_dates=['date'], conn=conn)
+    return RegressorCalendar(oil, holidays)
+
+
+_calendar = None
+_calendar_version = None
+_calendar_lock = threading.Lock()
+
+
+def _read_version():
+    try:
+        with open(Config.CALENDAR_VERSION_FILE) as f:
+            return f.read()
+    except FileNotFoundError:
+        return '0'
+
+
+def get_regressor_calendar():
+    """Process-wide calendar, reloaded when another process invalidated it"""
+    global _calendar, _calendar_version
+    version = _read_version()
+    with _calendar_lock:
+        if _calendar is None or version != _calendar_version:
+            _calendar = load_regressor_calendar()
+            _calendar_version = version
+        return _calendar
+
+
+def invalidate_regressor_calendar():
+    """Reload the calendar everywhere on next use (call after importing oil/holidays)"""
+    global _calendar
+    with _calendar_lock:
+        _calendar = None
+    try:
+        path = Config.CALENDAR_VERSION_FILE
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(f"{time.time_ns()}-{os.getpid()}")
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"WARNING: could not invalidate regressor calendar: {e}")
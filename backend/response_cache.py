@@ -0,0 +1,228 @@
+"""
+Response cache for the read-only API endpoints.
+
+Rendered JSON bodies are kept in process memory (and optionally in a shared
+directory, so every server process can reuse them) with a TTL. Each entry
+depends on one or more namespaces:
+
+    sales       products and sales history (changed by imports)
+    forecasts   saved forecasts (changed by forecast runs and imports)
+
+Writers call invalidate_responses(namespace) after committing. That bumps a
+small version file under RESPONSE_CACHE_DIR, so invalidation also reaches
+server processes other than the one that wrote the data, e.g. when an
+importer runs from the command line. Responses carry an ETag and a
+Last-Modified date and are revalidated by the browser, which turns repeat
+requests into 304 Not Modified.
+"""
+
+import base64
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import Response, make_response, request
+from config import Config
+
+NAMESPACES = ('sales', 'forecasts')
+
+
+class ResponseCache:
+    """TTL + LRU cache of response bodies keyed by request path and Accept header"""
+
+    def __init__(self, directory, ttl=300, max_entries=1000, shared=False):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+        os.makedirs(os.path.join(directory, 'entries'), exist_ok=True)
+
+    def _version_path(self, namespace):
+        return os.path.join(self.directory, f"{namespace}.version")
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, 'entries', hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def versions(self, namespaces):
+        """Current (token, modified time) of each namespace"""
+        versions = []
+        for namespace in namespaces:
+            try:
+                with open(self._version_path(namespace)) as f:
+                    versions.append((f.read(), os.path.getmtime(self._version_path(namespace))))
+            except FileNotFoundError:
+                versions.append(('0', None))
+        return versions
+
+    def _valid(self, entry, versions):
+        return (entry['versions'] == [token for token, _ in versions]
+                and time.time() - entry['created'] < self.ttl)
+
+    def get(self, key, versions):
+        """Cached entry for key if fresh and built from these versions, else None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._valid(entry, versions):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        if self.shared:
+            try:
+                with open(self._entry_path(key)) as f:
+                    entry = json.load(f)
+            except (FileNotFoundError, ValueError):
+                entry = None
+            if entry is not None and self._valid(entry, versions):
+                entry['body'] = base64.b64decode(entry['body'])
+                self._remember(key, entry)
+                with self._lock:
+                    self.hits += 1
+                return entry
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, namespaces, versions, body, mimetype):
+        """Store a body rendered from data at the given namespace versions"""
+        modified = [mtime for _, mtime in versions if mtime is not None]
+        entry = {
+            'namespaces': list(namespaces),
+            'versions': [token for token, _ in versions],
+            'created': time.time(),
+            'last_modified': max(modified) if modified else time.time(),
+            'etag': hashlib.sha1(body).hexdigest(),
+            'mimetype': mimetype,
+            'body': body
+        }
+        self._remember(key, entry)
+
+        if self.shared:
+            path = self._entry_path(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({**entry, 'body': base64.b64encode(body).decode()}, f)
+            os.replace(tmp_path, path)
+        return entry
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *namespaces):
+        """Mark everything built from these namespaces as stale, in every process"""
+        for namespace in namespaces:
+            path = self._version_path(namespace)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(f"{time.time_ns()}-{os.getpid()}")
+            os.replace(tmp_path, path)
+        with self._lock:
+            stale = [key for key, entry in self._entries.items()
+                     if not set(entry.get('namespaces', NAMESPACES)).isdisjoint(namespaces)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += 1
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'shared': self.shared
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Process-wide response cache, or None when RESPONSE_CACHE_ENABLED is off"""
+    global _cache
+    if not Config.RESPONSE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                Config.RESPONSE_CACHE_DIR,
+                ttl=Config.RESPONSE_CACHE_TTL,
+                max_entries=Config.RESPONSE_CACHE_MAX_ENTRIES,
+                shared=Config.RESPONSE_CACHE_SHARED
+            )
+        return _cache
+
+
+def invalidate_responses(*namespaces):
+    """Invalidation hook for writers; call after the data change is committed"""
+    cache = get_response_cache()
+    if cache is None:
+        return
+    try:
+        cache.invalidate(*(namespaces or NAMESPACES))
+    except OSError as e:
+        print(f"WARNING: could not invalidate response cache: {e}")
+
+
+def cached_response(*namespaces):
+    """Cache a view's 200 responses until TTL expiry or invalidation of namespaces
+
+    Responses get an ETag and Last-Modified and are answered with 304 when the
+    client's If-None-Match / If-Modified-Since still matches. Profiled
+    requests (?profile=1 or X-Profile) bypass the cache.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = get_response_cache()
+            if cache is None or request.args.get('profile') or request.headers.get('X-Profile'):
+                return view(*args, **kwargs)
+
+            # Accept is part of the key: the same URL can negotiate different formats
+            key = f"{request.full_path}|{request.headers.get('Accept', '')}"
+            # Read versions before rendering so an invalidation during the
+            # request leaves this entry stale rather than caching old data
+            versions = cache.versions(namespaces)
+            entry = cache.get(key, versions)
+            status = 'HIT'
+            if entry is None:
+                status = 'MISS'
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = cache.put(key, namespaces, versions, response.get_data(), response.mimetype)
+
+            response = Response(entry['body'], mimetype=entry['mimetype'])
+            response.vary.add('Accept')
+            response.set_etag(entry['etag'])
+            response.last_modified = entry['last_modified']
+            response.cache_control.no_cache = True
+            response.headers['X-Cache'] = status
+            response = response.make_conditional(request)
+            if response.status_code == 304:
+                cache.record_not_modified()
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,112 @@
+"""
+Content-negotiated formats for tabular API responses.
+
+    records   JSON list of row objects (the default the frontend reads)
+    columns   JSON object with one array per column
+    arrow     Apache Arrow IPC stream
+    parquet   Parquet file
+
+The format comes from ?format= or, failing that, the Accept header. Every
+format is rendered from the DataFrame's column arrays in one pass per
+column; pyarrow is only needed for arrow and parquet.
+"""
+
+import io
+import json
+import numpy as np
+from flask import Response, request
+
+MIMETYPES = {
+    'records': 'application/json',
+    'columns': 'application/json',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+FORMATS = list(MIMETYPES)
+
+
+class UnsupportedFormat(ValueError):
+    """Requested format is unknown or its library is not installed"""
+
+
+def negotiate_format(default='records'):
+    """Response format from ?format= or the Accept header"""
+    fmt = request.args.get('format')
+    if fmt is not None:
+        if fmt not in MIMETYPES:
+            raise UnsupportedFormat(f"format must be one of {FORMATS}")
+        return fmt
+
+    best = request.accept_mimetypes.best_match(
+        [MIMETYPES['arrow'], MIMETYPES['parquet'], 'application/x-parquet', 'application/json'])
+    if best == MIMETYPES['arrow']:
+        return 'arrow'
+    if best in (MIMETYPES['parquet'], 'application/x-parquet'):
+        return 'parquet'
+    return default
+
+
+def _json_column(series):
+    """Column as a list of JSON-ready values: dates as ISO strings, NaN/NA as null"""
+    values = series.to_numpy()
+    if np.issubdtype(values.dtype, np.datetime64):
+        days = values.astype('datetime64[D]')
+        if (days == values).all():
+            text = days.astype(str)
+        else:
+            text = np.datetime_as_string(values.astype('datetime64[us]'), unit='us')
+        return [None if t == 'NaT' else t for t in text.tolist()]
+    if series.isna().any():
+        return series.astype(object).where(series.notna(), None).tolist()
+    return values.tolist()
+
+
+def _arrow_table(df):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise UnsupportedFormat("arrow/parquet responses need pyarrow installed")
+
+    arrays = {}
+    for name in df.columns:
+        values = df[name].to_numpy()
+        if np.issubdtype(values.dtype, np.datetime64):
+            days = values.astype('datetime64[D]')
+            # Dates go out as date32, timestamps as microsecond timestamps
+            values = days if (days == values).all() else values.astype('datetime64[us]')
+        arrays[name] = pa.array(values, from_pandas=True)
+    return pa.table(arrays)
+
+
+def render_table(df, fmt):
+    """Encode a DataFrame in the given format; returns (body, mimetype)"""
+    if fmt == 'records':
+        columns = [_json_column(df[name]) for name in df.columns]
+        body = json.dumps([dict(zip(df.columns, row)) for row in zip(*columns)])
+    elif fmt == 'columns':
+        body = json.dumps({name: _json_column(df[name]) for name in df.columns})
+    elif fmt == 'arrow':
+        table = _arrow_table(df)
+        import pyarrow as pa
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        body = sink.getvalue()
+    elif fmt == 'parquet':
+        table = _arrow_table(df)
+        import pyarrow.parquet as pq
+        sink = io.BytesIO()
+        pq.write_table(table, sink)
+        body = sink.getvalue()
+    else:
+        raise UnsupportedFormat(f"format must be one of {FORMATS}")
+    return body, MIMETYPES[fmt]
+
+
+def table_response(df, fmt):
+    """Flask response for a DataFrame in the negotiated format"""
+    body, mimetype = render_table(df, fmt)
+    response = Response(body, mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
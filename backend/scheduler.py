@@ -0,0 +1,333 @@
+"""
+Staleness-aware forecast refresh scheduler.
+
+A product is stale when its latest sale date in sales_daily is newer than
+the watermark of its last model fit (model_fits.fitted_through). Each
+refresh run queues forecast jobs (job_queue.py) for stale products only,
+highest recent revenue first, with at most SCHEDULER_CONCURRENCY jobs in
+flight, and stops admitting new ones once the run's job time (measured, plus
+estimates for running jobs and the next one) would exceed
+SCHEDULER_BUDGET_SECONDS. Products left over stay stale and are picked up by
+the next run.
+
+Runs are triggered by:
+
+    SCHEDULER_CRON                  5-field cron expression (e.g. "0 2 * * *")
+    NOTIFY sales_data_changed       sent by a trigger on sales_data inserts
+                                    (database/schema.sql), with the earliest
+                                    inserted sale date; a run starts once no
+                                    new notification arrived for
+                                    SCHEDULER_DEBOUNCE_SECONDS, after
+                                    rebuilding sales_daily from that date if
+                                    the rollup is behind
+
+Usage:
+    python scheduler.py                 # daemon, with its own job worker threads
+    python scheduler.py --no-worker     # daemon; API processes execute the jobs
+    python scheduler.py --once
+    python scheduler.py --dry-run       # list stale products in refresh order
+"""
+
+import argparse
+import select
+import time
+from datetime import datetime, timedelta
+import psycopg2
+from config import Config
+from daily_aggregates import refresh_sales_daily
+from database import get_db_connection
+from job_queue import get_job, start_job_worker, submit_forecast_job
+
+CHANNEL = 'sales_data_changed'
+
+# Estimated job seconds for products that were never fitted, until a run has measurements
+DEFAULT_JOB_SECONDS = 10.0
+
+# Failed products are not retried for this long (they stay stale until then)
+FAILED_RETRY_HOURS = 24
+
+# Window for the revenue / volume ranking, counted back from each product's latest sale
+RANKING_DAYS = 28
+
+
+class CronSchedule:
+    """Minimal 5-field cron expression: minute hour day-of-month month day-of-week
+
+    Fields accept *, numbers, ranges (1-5), steps (*/15, 0-30/10) and lists.
+    Day-of-week is 0-6 from Sunday (7 is also Sunday). As in cron, when both
+    day fields are restricted a day matching either one matches.
+    """
+
+    RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron expression needs 5 fields, got {expression!r}")
+        self.expression = expression
+        values = [self._parse(field, low, high) for field, (low, high) in zip(fields, self.RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = values
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for part in field.split(','):
+            step = 1
+            if '/' in part:
+                part, step = part.split('/')
+                step = int(step)
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = (int(v) for v in part.split('-'))
+            else:
+                start = end = int(part)
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"invalid cron field {field!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, when):
+        day = when.day in self.days
+        weekday = (when.weekday() + 1) % 7 in self.weekdays
+        if self.any_day and self.any_weekday:
+            return True
+        if self.any_day:
+            return weekday
+        if self.any_weekday:
+            return day
+        return day or weekday
+
+    def next_after(self, when):
+        """First matching minute strictly after `when`"""
+        t = when.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = datetime(t.year + t.month // 12, t.month % 12 + 1, 1)
+            elif not self._day_matches(t):
+                t = datetime(t.year, t.month, t.day) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = datetime(t.year, t.month, t.day, t.hour) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"cron expression {self.expression!r} never matches")
+
+
+def stale_products():
+    """Stale products in refresh order (recent revenue, then volume)
+
+    Returns a list of dicts with product_id, latest_sale, fitted_through,
+    fit_seconds (of the last fit, or None), revenue and volume.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        WITH latest AS (
+            SELECT product_id, MAX(sale_date) AS latest_sale
+            FROM sales_daily
+            GROUP BY product_id
+        ), stale AS (
+            SELECT l.product_id, l.latest_sale, f.fitted_through, f.fit_seconds
+            FROM latest l
+            LEFT JOIN model_fits f ON f.product_id = l.product_id
+            WHERE f.fitted_through IS NULL OR l.latest_sale > f.fitted_through
+        )
+        SELECT st.product_id, st.latest_sale, st.fitted_through, st.fit_seconds,
+               COALESCE(SUM(s.total_amount), 0) AS revenue,
+               COALESCE(SUM(s.quantity_sold), 0) AS volume
+        FROM stale st
+        JOIN sales_daily s ON s.product_id = st.product_id
+            AND s.sale_date > st.latest_sale - INTERVAL '%s days'
+        WHERE NOT EXISTS (
+            SELECT 1 FROM forecast_jobs j
+            WHERE j.product_id = st.product_id AND j.status = 'failed'
+            AND j.finished_at > CURRENT_TIMESTAMP - INTERVAL '%s hours'
+        )
+        GROUP BY st.product_id, st.latest_sale, st.fitted_through, st.fit_seconds
+        ORDER BY revenue DESC, volume DESC, st.product_id
+        """,
+        (RANKING_DAYS, FAILED_RETRY_HOURS)
+    )
+    products = cur.fetchall()
+    cur.close()
+    conn.close()
+    return products
+
+
+def job_estimate(product, measured):
+    """Expected seconds for a product's job: its last fit time, else the run's mean"""
+    if product['fit_seconds'] is not None:
+        return float(product['fit_seconds'])
+    if measured:
+        return sum(measured) / len(measured)
+    return DEFAULT_JOB_SECONDS
+
+
+def run_refresh(budget_seconds=None, concurrency=None, forecast_days=None, poll_interval=1.0):
+    """Queue forecast jobs for stale products within the compute budget and wait for them
+
+    Returns:
+        Summary dict with stale/succeeded/failed/deferred product ids and the
+        job seconds spent
+    """
+    budget_seconds = budget_seconds or Config.SCHEDULER_BUDGET_SECONDS
+    concurrency = concurrency or Config.SCHEDULER_CONCURRENCY
+    forecast_days = forecast_days or Config.SCHEDULER_FORECAST_DAYS
+
+    started = time.time()
+    pending = stale_products()
+    summary = {'stale': [p['product_id'] for p in pending], 'succeeded': [], 'failed': {},
+               'deferred': [], 'job_seconds': 0.0}
+    measured = []
+    in_flight = {}
+
+    while pending or in_flight:
+        # Admit jobs in ranking order while under the concurrency limit and budget
+        while pending and len(in_flight) < concurrency:
+            estimate = job_estimate(pending[0], measured)
+            committed = summary['job_seconds'] + sum(e for _, e in in_flight.values())
+            if committed > 0 and committed + estimate > budget_seconds:
+                summary['deferred'] = [p['product_id'] for p in pending]
+                pending = []
+                break
+            product = pending.pop(0)
+            job, _ = submit_forecast_job(product['product_id'], forecast_days)
+            in_flight[job['job_id']] = (product['product_id'], estimate)
+
+        if not in_flight:
+            break
+        time.sleep(poll_interval)
+
+        for job_id, (product_id, _) in list(in_flight.items()):
+            job = get_job(job_id)
+            if job is None or job['status'] in ('queued', 'running'):
+                continue
+            del in_flight[job_id]
+            seconds = (job['finished_at'] - job['started_at']).total_seconds() if job['started_at'] else 0.0
+            measured.append(seconds)
+            summary['job_seconds'] += seconds
+            if job['status'] == 'succeeded':
+                summary['succeeded'].append(product_id)
+            else:
+                summary['failed'][product_id] = job['error']
+
+    summary['duration_seconds'] = time.time() - started
+    return summary
+
+
+def rollup_behind(since):
+    """True if sales_daily doesn't match sales_data from `since` onwards"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT
+            (SELECT COALESCE(SUM(quantity_sold), 0) FROM sales_data WHERE sale_date >= %s) <>
+            (SELECT COALESCE(SUM(quantity_sold), 0) FROM sales_daily WHERE sale_date >= %s) AS behind
+        """,
+        (since, since)
+    )
+    behind = cur.fetchone()['behind']
+    cur.close()
+    conn.close()
+    return behind
+
+
+def _print_summary(summary):
+    print(f"  {len(summary['stale'])} stale, {len(summary['succeeded'])} refreshed, "
+          f"{len(summary['failed'])} failed, {len(summary['deferred'])} deferred "
+          f"({summary['job_seconds']:.1f}s of jobs in {summary['duration_seconds']:.1f}s)")
+    for product_id, error in summary['failed'].items():
+        print(f"    product {product_id}: {error}")
+
+
+class Scheduler:
+    """Cron and LISTEN/NOTIFY driven loop around run_refresh"""
+
+    def __init__(self, cron=None, debounce_seconds=None):
+        self.cron = CronSchedule(cron or Config.SCHEDULER_CRON)
+        self.debounce_seconds = Config.SCHEDULER_DEBOUNCE_SECONDS if debounce_seconds is None else debounce_seconds
+        self.changed_since = None
+        self.last_notification = None
+
+    def _listen(self):
+        # LISTEN needs its own autocommit connection, outside the pool
+        conn = psycopg2.connect(Config.DATABASE_URL)
+        conn.autocommit = True
+        conn.cursor().execute(f"LISTEN {CHANNEL}")
+        return conn
+
+    def _drain(self, conn):
+        conn.poll()
+        while conn.notifies:
+            payload = conn.notifies.pop(0).payload
+            if payload:
+                day = datetime.strptime(payload, '%Y-%m-%d').date()
+                self.changed_since = day if self.changed_since is None else min(self.changed_since, day)
+            self.last_notification = time.time()
+
+    def _refresh(self, reason):
+        print(f"[{datetime.now().isoformat(timespec='seconds')}] Refresh ({reason})...")
+        try:
+            if self.changed_since is not None and rollup_behind(self.changed_since):
+                print(f"  Rebuilding sales_daily from {self.changed_since}")
+                refresh_sales_daily(since=self.changed_since)
+            self.changed_since = self.last_notification = None
+            _print_summary(run_refresh())
+        except Exception as e:
+            print(f"  Refresh failed: {e}")
+
+    def run_forever(self):
+        conn = self._listen()
+        next_run = self.cron.next_after(datetime.now())
+        print(f"Scheduler listening on {CHANNEL}; next scheduled refresh at {next_run}")
+
+        while True:
+            timeout = (next_run - datetime.now()).total_seconds()
+            if self.last_notification is not None:
+                timeout = min(timeout, self.last_notification + self.debounce_seconds - time.time())
+
+            if timeout > 0 and select.select([conn], [], [], timeout)[0]:
+                self._drain(conn)
+                continue
+
+            if datetime.now() >= next_run:
+                self._refresh('scheduled')
+                next_run = self.cron.next_after(datetime.now())
+            elif self.last_notification is not None:
+                self._refresh('new sales')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Refit stale products on a schedule and on new sales')
+    parser.add_argument('--once', action='store_true',
+                      help='Run a single refresh now and exit')
+    parser.add_argument('--dry-run', action='store_true',
+                      help='List stale products in refresh order and exit')
+    parser.add_argument('--no-worker', action='store_true',
+                      help="Don't start job worker threads in this process")
+
+    args = parser.parse_args()
+
+    if args.dry_run:
+        products = stale_products()
+        print(f"{len(products)} stale products (budget {Config.SCHEDULER_BUDGET_SECONDS}s, "
+              f"concurrency {Config.SCHEDULER_CONCURRENCY})")
+        for product in products:
+            print(f"  product {product['product_id']}: sales through {product['latest_sale']}, "
+                  f"fitted through {product['fitted_through'] or '-'}, "
+                  f"revenue {float(product['revenue']):,.2f}, est {job_estimate(product, []):.1f}s")
+    else:
+        if not args.no_worker:
+            start_job_worker(Config.SCHEDULER_CONCURRENCY)
+        if args.once:
+            _print_summary(run_refresh())
+        else:
+            Scheduler().run_forever()
@@ -0,0 +1,83 @@
+"""
+Startup timing and background warm-up of the forecasting libraries.
+
+Prophet (and with it cmdstanpy and the compiled Stan model) is imported
+lazily by forecaster.py and model_cache.py, so the API can serve the
+read-only endpoints as soon as Flask and the database layer are loaded. The
+warm-up loads Prophet ahead of the first forecast, either in a background
+thread after the server starts or synchronously in the gunicorn master
+(wsgi.py) so forked workers inherit it.
+
+Each startup phase is timed; /api/ready reports the phases and whether
+forecasting is warm.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+STARTED = time.perf_counter()
+
+_phases = {}
+_lock = threading.Lock()
+_warmup = {'state': 'not_started', 'error': None, 'thread': None}
+
+
+def record_phase(name, seconds):
+    with _lock:
+        _phases[name] = round(seconds, 3)
+
+
+@contextmanager
+def phase(name):
+    """Time a startup phase into the report"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - started)
+
+
+def warm_up():
+    """Import Prophet and load the Stan model (idempotent)"""
+    with _lock:
+        if _warmup['state'] in ('running', 'ready'):
+            return
+        _warmup['state'] = 'running'
+    try:
+        with phase('import_prophet'):
+            from prophet import Prophet
+            import prophet.serialize  # used by model_cache
+        with phase('load_stan_model'):
+            # Constructing a model loads the Stan backend and compiled binary
+            Prophet()
+    except Exception as e:
+        with _lock:
+            _warmup.update(state='failed', error=str(e))
+        print(f"WARNING: forecasting warm-up failed: {e}")
+        return
+    with _lock:
+        _warmup['state'] = 'ready'
+
+
+def start_warmup():
+    """Run warm_up() in a daemon thread; returns immediately"""
+    with _lock:
+        if _warmup['thread'] is not None or _warmup['state'] == 'ready':
+            return
+        _warmup['thread'] = threading.Thread(target=warm_up, name='forecast-warmup', daemon=True)
+    _warmup['thread'].start()
+
+
+def forecasting_ready():
+    return _warmup['state'] == 'ready'
+
+
+def startup_report():
+    with _lock:
+        return {
+            'uptime_seconds': round(time.perf_counter() - STARTED, 3),
+            'phases': dict(_phases),
+            'warmup': _warmup['state'],
+            'warmup_error': _warmup['error']
+        }
@@ -0,0 +1,377 @@
+"""
+Storage backends for sales history reads.
+
+Every read of the sales_daily rollup goes through a SalesStore:
+
+    product_history   one product's forecaster history (InventoryForecaster)
+    recent_history    last N days for some products (/api/historical, panels),
+                      optionally summed per week or month
+    panel_frame       every product's full history (HistoryPanel)
+
+STORAGE_BACKEND selects the implementation:
+
+    postgres   queries sales_daily in PostgreSQL (default)
+    duckdb     an embedded DuckDB scanning a Parquet mirror of sales_daily in
+               WAREHOUSE_DIR, one file per month sorted by product, so scans
+               are columnar and product filters skip row groups
+
+Both also read months archived by partitions.py. PostgreSQL stays the system
+of record: imports, forecasts and jobs are written there, and writers call
+refresh_sales_store() after changing sales_daily so the DuckDB mirror
+re-exports the affected months.
+"""
+
+import glob
+import io
+import os
+import threading
+from datetime import datetime, timedelta
+import pandas as pd
+from config import Config
+from database import get_db_connection, query_frame
+from downsampling import BUCKETS, bucket_frame, bucket_start
+from partitions import ARCHIVE_COLUMNS, ARCHIVE_FILE, archived_history, archived_months, next_month
+
+HISTORY_COLUMNS = ['ds', 'y', 'on_promotion', 'oil_price', 'is_holiday']
+
+PANEL_QUERY = """
+    SELECT product_id, sale_date AS ds, quantity_sold AS y, total_amount,
+           on_promotion, oil_price, is_holiday
+    FROM sales_daily
+    ORDER BY product_id, sale_date
+"""
+
+PANEL_COLUMNS = ['product_id', 'ds', 'y', 'total_amount', 'on_promotion', 'oil_price', 'is_holiday']
+
+PANEL_DTYPES = {
+    'product_id': 'int32',
+    'y': 'float64',
+    'total_amount': 'float64',
+    'on_promotion': 'float32',
+    'oil_price': 'float64',
+    'is_holiday': 'int8'
+}
+
+RECENT_COLUMNS = ['product_id', 'sale_date', 'quantity_sold', 'total_amount']
+
+BACKENDS = ['postgres', 'duckdb']
+
+
+def _since(days_back):
+    return None if days_back is None else (datetime.now() - timedelta(days=days_back)).date()
+
+
+def _check_bucket(bucket):
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {BUCKETS}")
+
+
+def _file_month(path):
+    """Month of a YYYY_MM.parquet file, or None for other files"""
+    match = ARCHIVE_FILE.match(os.path.basename(path))
+    return datetime(int(match.group(1)), int(match.group(2)), 1).date() if match else None
+
+
+def _archived_panel():
+    archived = archived_history()
+    if not len(archived):
+        return None
+    return archived.rename(columns={'sale_date': 'ds', 'quantity_sold': 'y'})[PANEL_COLUMNS].astype(PANEL_DTYPES)
+
+
+class PostgresStore:
+    """Reads sales_daily from PostgreSQL"""
+
+    name = 'postgres'
+
+    # The window starts at the beginning of the bucket holding the first day,
+    # so the leading week/month is complete
+    RECENT_QUERY = """
+        SELECT {columns}sale_date, quantity_sold, total_amount
+        FROM sales_daily
+        WHERE product_id = ANY(%s)
+        AND sale_date >= (
+            SELECT date_trunc('{bucket}', MAX(sale_date) - INTERVAL '%s days')::date
+            FROM sales_daily
+            WHERE product_id = ANY(%s)
+        )
+        ORDER BY {columns}sale_date
+    """
+
+    BUCKETED_QUERY = """
+        SELECT {columns}date_trunc('{bucket}', sale_date)::date AS sale_date,
+               SUM(quantity_sold) AS quantity_sold, SUM(total_amount) AS total_amount,
+               COUNT(*) AS days
+        FROM sales_daily
+        WHERE product_id = ANY(%s)
+        AND sale_date >= (
+            SELECT date_trunc('{bucket}', MAX(sale_date) - INTERVAL '%s days')::date
+            FROM sales_daily
+            WHERE product_id = ANY(%s)
+        )
+        GROUP BY {columns}date_trunc('{bucket}', sale_date)
+        ORDER BY {columns}sale_date
+    """
+
+    def product_history(self, product_id, days_back=None):
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        if days_back is None:
+            # Get all available data with regressors
+            query = """
+                SELECT sale_date as ds, quantity_sold as y, on_promotion, oil_price, is_holiday
+                FROM sales_daily
+                WHERE product_id = %s
+                ORDER BY sale_date
+            """
+            cur.execute(query, (product_id,))
+        else:
+            # Get data from last N days with regressors
+            query = """
+                SELECT sale_date as ds, quantity_sold as y, on_promotion, oil_price, is_holiday
+                FROM sales_daily
+                WHERE product_id = %s
+                AND sale_date >= CURRENT_DATE - INTERVAL '%s days'
+                ORDER BY sale_date
+            """
+            cur.execute(query, (product_id, days_back))
+
+        df = pd.DataFrame(cur.fetchall(), columns=HISTORY_COLUMNS)
+        cur.close()
+        conn.close()
+
+        # Months moved to the Parquet archive by partitions.py
+        archived = archived_history([product_id], since=_since(days_back))
+        if len(archived):
+            archived = archived.rename(columns={'sale_date': 'ds', 'quantity_sold': 'y'})[HISTORY_COLUMNS]
+            df = pd.concat([archived, df], ignore_index=True)
+            df['ds'] = pd.to_datetime(df['ds'])
+            df = df.sort_values('ds', kind='stable', ignore_index=True)
+        return df
+
+    def recent_history(self, product_ids, days_back, with_product_id=False, bucket='day'):
+        # Most recent N days counted from the latest date among the products
+        _check_bucket(bucket)
+        columns = 'product_id, ' if with_product_id else ''
+        params = (list(product_ids), days_back, list(product_ids))
+        if bucket != 'day' and not archived_months():
+            # Aggregate in SQL; with archived months the daily rows are merged first
+            query = self.BUCKETED_QUERY.format(columns=columns, bucket=bucket)
+            return query_frame(query, params, parse_dates=['sale_date'])
+        df = query_frame(self.RECENT_QUERY.format(columns=columns, bucket=bucket), params,
+                         parse_dates=['sale_date'])
+
+        # The window only reaches archived months when the hot data is short
+        since = bucket_start(df['sale_date'].max() - pd.Timedelta(days=days_back), bucket) if len(df) else None
+        archived = archived_history(product_ids, since=since)
+        if len(archived):
+            archived = archived[RECENT_COLUMNS if with_product_id else RECENT_COLUMNS[1:]]
+            df = pd.concat([archived, df], ignore_index=True)
+            since = bucket_start(df['sale_date'].max() - pd.Timedelta(days=days_back), bucket)
+            df = df[df['sale_date'] >= since].sort_values(
+                ['product_id', 'sale_date'] if with_product_id else 'sale_date', ignore_index=True)
+        return bucket_frame(df, 'sale_date', ['quantity_sold', 'total_amount'], bucket,
+                            by='product_id' if with_product_id else None)
+
+    def panel_frame(self, conn=None):
+        own_conn = conn is None
+        if own_conn:
+            conn = get_db_connection()
+        cur = conn.cursor()
+
+        buf = io.BytesIO()
+        cur.copy_expert(f"COPY ({PANEL_QUERY}) TO STDOUT WITH (FORMAT csv)", buf)
+        cur.close()
+        if own_conn:
+            conn.close()
+
+        buf.seek(0)
+        df = pd.read_csv(buf, header=None, names=PANEL_COLUMNS, dtype=PANEL_DTYPES, parse_dates=['ds'])
+        archived = _archived_panel()
+        return df if archived is None else pd.concat([archived, df], ignore_index=True)
+
+    def refresh(self, since=None, months=None):
+        """Nothing to do: PostgreSQL is the source"""
+        return 0
+
+
+class DuckDBStore:
+    """Embedded DuckDB over monthly Parquet files mirrored from sales_daily"""
+
+    name = 'duckdb'
+
+    def __init__(self, directory):
+        try:
+            import duckdb
+        except ImportError:
+            raise ValueError("STORAGE_BACKEND=duckdb needs the duckdb package installed")
+        self.directory = directory
+        self._conn = duckdb.connect()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, 'sales_daily'), exist_ok=True)
+
+    def _month_path(self, month):
+        return os.path.join(self.directory, 'sales_daily', f"{month.year:04d}_{month.month:02d}.parquet")
+
+    def _source(self, since=None):
+        """read_parquet() over the mirrored and archived month files, or None if there are none"""
+        files = []
+        for pattern in [os.path.join(self.directory, 'sales_daily', '*.parquet'),
+                        os.path.join(Config.SALES_ARCHIVE_DIR, 'sales_daily', '*.parquet')]:
+            for path in glob.glob(pattern):
+                month = _file_month(path)
+                # Skip whole files that end before `since`
+                if month is not None and (since is None or next_month(month) > since):
+                    files.append(path)
+        if not files:
+            return None
+        quoted = ', '.join("'" + path.replace("'", "''") + "'" for path in sorted(files))
+        return f"read_parquet([{quoted}], union_by_name = true)"
+
+    def _query(self, sql, params=None):
+        with self._lock:
+            cur = self._conn.cursor()
+        try:
+            return cur.execute(sql, params or []).df()
+        finally:
+            cur.close()
+
+    def product_history(self, product_id, days_back=None):
+        since = _since(days_back)
+        source = self._source(since)
+        if source is None:
+            return pd.DataFrame(columns=HISTORY_COLUMNS)
+        return self._query(
+            f"""
+            SELECT sale_date AS ds, quantity_sold AS y, on_promotion, oil_price, is_holiday
+            FROM {source}
+            WHERE product_id = ? AND sale_date >= ?
+            ORDER BY sale_date
+            """,
+            [int(product_id), since or datetime(1900, 1, 1).date()]
+        )
+
+    def recent_history(self, product_ids, days_back, with_product_id=False, bucket='day'):
+        _check_bucket(bucket)
+        source = self._source()
+        columns = RECENT_COLUMNS if with_product_id else RECENT_COLUMNS[1:]
+        if source is None or not product_ids:
+            return pd.DataFrame(columns=columns)
+        ids = ', '.join(str(int(pid)) for pid in product_ids)
+        select = 'product_id, ' if with_product_id else ''
+        if bucket == 'day':
+            values, group = "sale_date, quantity_sold, total_amount", ""
+        else:
+            day = f"CAST(date_trunc('{bucket}', sale_date) AS DATE)"
+            values = (f"{day} AS sale_date, SUM(quantity_sold) AS quantity_sold, "
+                      "SUM(total_amount) AS total_amount, COUNT(*) AS days")
+            group = f"GROUP BY {select}{day}"
+        df = self._query(
+            f"""
+            WITH sales AS (
+                SELECT product_id, sale_date, quantity_sold, total_amount
+                FROM {source}
+                WHERE product_id IN ({ids})
+            )
+            SELECT {select}{values}
+            FROM sales
+            WHERE sale_date >= CAST(date_trunc('{bucket}', (SELECT MAX(sale_date) FROM sales)
+                                                - to_days(CAST(? AS INTEGER))) AS DATE)
+            {group}
+            ORDER BY {select}sale_date
+            """,
+            [days_back]
+        )
+        df['sale_date'] = pd.to_datetime(df['sale_date'])
+        return df
+
+    def panel_frame(self, conn=None):
+        source = self._source()
+        if source is None:
+            return pd.DataFrame({name: pd.Series(dtype=PANEL_DTYPES.get(name, 'datetime64[ns]'))
+                                 for name in PANEL_COLUMNS})
+        df = self._query(
+            f"""
+            SELECT product_id, sale_date AS ds, quantity_sold AS y, total_amount,
+                   on_promotion, oil_price, is_holiday
+            FROM {source}
+            ORDER BY product_id, sale_date
+            """
+        )
+        for name, dtype in PANEL_DTYPES.items():
+            df[name] = df[name].fillna(0).astype(dtype) if name != 'oil_price' else df[name].astype(dtype)
+        return df
+
+    def refresh(self, since=None, months=None):
+        """Re-export sales_daily months from PostgreSQL
+
+        Exports the months from `since`, or only the given `months`, or all.
+        Mirror files for months no longer in sales_daily (e.g. archived) are
+        removed either way. Returns the number of rows exported.
+        """
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT DISTINCT date_trunc('month', sale_date)::date AS month FROM sales_daily")
+        present = {row['month'] for row in cur.fetchall()}
+        cur.close()
+
+        for path in glob.glob(os.path.join(self.directory, 'sales_daily', '*.parquet')):
+            if _file_month(path) not in present:
+                os.remove(path)
+
+        exported = 0
+        columns = ', '.join(ARCHIVE_COLUMNS['sales_daily'])
+        for month in sorted(present):
+            if since is not None and next_month(month) <= pd.Timestamp(since).date():
+                continue
+            if months is not None and month not in months:
+                continue
+            df = query_frame(
+                f"""
+                SELECT {columns} FROM sales_daily
+                WHERE sale_date >= %s AND sale_date < %s
+                ORDER BY product_id, sale_date
+                """,
+                (month, next_month(month)), parse_dates=['sale_date'], conn=conn
+            )
+            path = self._month_path(month)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            df.to_parquet(tmp_path, index=False, row_group_size=100000)
+            os.replace(tmp_path, path)
+            exported += len(df)
+        conn.close()
+        return exported
+
+
+def make_sales_store(backend=None):
+    """New store for a backend name (default: Config.STORAGE_BACKEND)"""
+    backend = backend or Config.STORAGE_BACKEND
+    if backend == 'postgres':
+        return PostgresStore()
+    if backend == 'duckdb':
+        return DuckDBStore(Config.WAREHOUSE_DIR)
+    raise ValueError(f"STORAGE_BACKEND must be one of {BACKENDS}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_sales_store():
+    """Process-wide store for Config.STORAGE_BACKEND"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = make_sales_store()
+        return _store
+
+
+def refresh_sales_store(since=None, months=None):
+    """Writer hook: call after sales_daily changed and was committed"""
+    if Config.STORAGE_BACKEND == 'postgres':
+        return
+    try:
+        get_sales_store().refresh(since=since, months=months)
+    except Exception as e:
+        print(f"WARNING: could not refresh the {Config.STORAGE_BACKEND} sales store: {e}")
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from downsampling import bucket_frame, bucket_start, downsample, lttb_indices
+
+
+def test_lttb_keeps_everything_below_threshold():
+    assert lttb_indices(np.arange(5), np.arange(5), 10).tolist() == [0, 1, 2, 3, 4]
+    assert lttb_indices(np.arange(5), np.arange(5), 2).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_lttb_keeps_endpoints_and_extremes():
+    x = np.arange(100)
+    y = np.zeros(100)
+    y[37], y[71] = 50.0, -40.0
+    selected = lttb_indices(x, y, 10)
+
+    assert len(selected) == 10
+    assert selected[0] == 0 and selected[-1] == 99
+    assert np.all(np.diff(selected) > 0)
+    assert 37 in selected and 71 in selected
+
+
+def test_lttb_exact_selection():
+    # Four inner points in two buckets; the spike wins each bucket
+    y = np.array([0.0, 1.0, 5.0, 0.0, 9.0, 0.0])
+    assert lttb_indices(np.arange(6), y, 4).tolist() == [0, 2, 4, 5]
+
+
+def test_bucket_start():
+    assert bucket_start('2024-01-03', 'day') == pd.Timestamp('2024-01-03')
+    assert bucket_start('2024-01-03', 'week') == pd.Timestamp('2024-01-01')   # Monday
+    assert bucket_start('2024-01-07', 'week') == pd.Timestamp('2024-01-01')   # Sunday
+    assert bucket_start('2024-02-29', 'month') == pd.Timestamp('2024-02-01')
+
+
+@pytest.fixture
+def sales():
+    return pd.DataFrame({
+        'product_id': [1, 1, 1, 1, 2],
+        'sale_date': pd.to_datetime(['2024-01-06', '2024-01-07', '2024-01-08', '2024-02-01', '2024-01-07']),
+        'quantity_sold': [1.0, 2.0, 3.0, 4.0, 10.0],
+        'total_amount': [10.0, 20.0, 30.0, 40.0, 100.0]
+    })
+
+
+def test_bucket_frame_weeks(sales):
+    out = bucket_frame(sales, 'sale_date', ['quantity_sold', 'total_amount'], 'week', by='product_id')
+    assert out['product_id'].tolist() == [1, 1, 1, 2]
+    assert out['sale_date'].dt.strftime('%Y-%m-%d').tolist() == ['2024-01-01', '2024-01-08', '2024-01-29',
+                                                                  '2024-01-01']
+    assert out['quantity_sold'].tolist() == [3.0, 3.0, 4.0, 10.0]
+    assert out['total_amount'].tolist() == [30.0, 30.0, 40.0, 100.0]
+    assert out['days'].tolist() == [2, 1, 1, 1]
+
+
+def test_bucket_frame_months_without_grouping(sales):
+    out = bucket_frame(sales, 'sale_date', ['quantity_sold'], 'month')
+    assert out['sale_date'].dt.strftime('%Y-%m-%d').tolist() == ['2024-01-01', '2024-02-01']
+    assert out['quantity_sold'].tolist() == [16.0, 4.0]
+    assert out['days'].tolist() == [4, 1]
+
+
+def test_bucket_frame_day_and_empty(sales):
+    assert bucket_frame(sales, 'sale_date', ['quantity_sold'], 'day') is sales
+    empty = bucket_frame(sales.iloc[:0], 'sale_date', ['quantity_sold'], 'week')
+    assert empty.empty and empty.columns.tolist() == ['sale_date', 'quantity_sold', 'days']
+
+
+def test_downsample_per_series():
+    dates = pd.date_range('2024-01-01', periods=50)
+    df = pd.DataFrame({
+        'product_id': np.repeat([1, 2], 50),
+        'sale_date': np.tile(dates, 2),
+        'quantity_sold': np.arange(100.0)
+    })
+    out = downsample(df, 'sale_date', 'quantity_sold', 5, by='product_id')
+    assert out.groupby('product_id').size().tolist() == [5, 5]
+    assert out.groupby('product_id')['sale_date'].min().tolist() == [dates[0]] * 2
+    assert out.groupby('product_id')['sale_date'].max().tolist() == [dates[-1]] * 2
+    assert downsample(df, 'sale_date', 'quantity_sold', None) is df
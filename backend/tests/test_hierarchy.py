@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from hierarchy import RECONCILIATION_METHODS, Hierarchy, reconcile
+from history_panel import HistoryPanel
+
+HORIZON = 5
+
+
+@pytest.fixture
+def hierarchy():
+    # Two families: A with stores 1-2 (leaves 1, 2), B with store 1 (leaf 3)
+    leaves = pd.DataFrame({'product_id': [1, 2, 3], 'family': ['A', 'A', 'B'], 'store_nbr': [1, 2, 1]})
+    dates = pd.date_range('2024-01-01', periods=10)
+    levels = {1: 1.0, 2: 3.0, 3: 4.0}
+    panel = HistoryPanel(pd.DataFrame({
+        'product_id': np.repeat([1, 2, 3], len(dates)).astype('int32'),
+        'ds': np.tile(dates, 3),
+        'y': np.concatenate([np.full(len(dates), levels[pid]) for pid in (1, 2, 3)]),
+        'total_amount': 0.0,
+        'on_promotion': 0.0,
+        'oil_price': 50.0,
+        'is_holiday': 0
+    }))
+    return Hierarchy(leaves, panel)
+
+
+@pytest.fixture
+def base():
+    rng = np.random.default_rng(0)
+    return {
+        'total': rng.uniform(5, 15, HORIZON),
+        'families': rng.uniform(2, 8, (HORIZON, 2)),
+        'leaves': rng.uniform(0, 5, (HORIZON, 3))
+    }
+
+
+def test_summing_matrix(hierarchy):
+    assert hierarchy.summing_matrix().tolist() == [
+        [1, 1, 1],
+        [1, 1, 0], [0, 0, 1],
+        [1, 0, 0], [0, 1, 0], [0, 0, 1]
+    ]
+
+
+def test_bottom_up_keeps_leaf_forecasts(hierarchy, base):
+    np.testing.assert_allclose(reconcile(hierarchy, 'bottom_up', base), base['leaves'])
+
+
+def test_top_down_splits_total_by_history(hierarchy, base):
+    leaves = reconcile(hierarchy, 'top_down', base)
+    np.testing.assert_allclose(leaves.sum(axis=1), base['total'])
+    np.testing.assert_allclose(leaves / base['total'][:, None], np.tile([1 / 8, 3 / 8, 4 / 8], (HORIZON, 1)))
+
+
+def test_middle_out_splits_each_family(hierarchy, base):
+    leaves = reconcile(hierarchy, 'middle_out', base)
+    np.testing.assert_allclose(leaves @ hierarchy.family_matrix, base['families'])
+    np.testing.assert_allclose(leaves[:, 0] / leaves[:, 1], 1 / 3)
+
+
+def test_mint_returns_coherent_forecasts_unchanged(hierarchy, base):
+    leaves = base['leaves']
+    coherent = {'total': leaves.sum(axis=1), 'families': leaves @ hierarchy.family_matrix, 'leaves': leaves}
+    np.testing.assert_allclose(reconcile(hierarchy, 'mint', coherent), leaves)
+
+
+def test_mint_is_a_projection(hierarchy, base):
+    # Reconciling the coherent forecasts MinT produced must not move them again
+    leaves = reconcile(hierarchy, 'mint', base)
+    again = reconcile(hierarchy, 'mint', {'total': leaves.sum(axis=1),
+                                         'families': leaves @ hierarchy.family_matrix, 'leaves': leaves})
+    np.testing.assert_allclose(again, leaves)
+
+
+@pytest.mark.parametrize('method', RECONCILIATION_METHODS)
+def test_every_method_returns_one_column_per_leaf(hierarchy, base, method):
+    assert reconcile(hierarchy, method, base).shape == (HORIZON, hierarchy.num_leaves)
+
+
+def test_unknown_method(hierarchy, base):
+    with pytest.raises(ValueError):
+        reconcile(hierarchy, 'average', base)
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import history_panel
+from history_panel import HistoryPanel, get_history_panel, invalidate_history_panel
+
+
+@pytest.fixture
+def panel():
+    return HistoryPanel(pd.DataFrame({
+        'product_id': np.array([2, 1, 1, 1, 2], dtype='int32'),
+        'ds': pd.to_datetime(['2024-01-03', '2024-01-01', '2024-01-02', '2024-01-04', '2024-01-05']),
+        'y': [7.0, 1.0, 2.0, 4.0, 9.0],
+        'total_amount': [70.0, 10.0, 20.0, 40.0, 90.0],
+        'on_promotion': [1.0, 0.0, 3.0, np.nan, 0.0],
+        'oil_price': [np.nan, 50.0, np.nan, 52.0, np.nan],
+        'is_holiday': [0, 1, 0, 0, 0]
+    }))
+
+
+def test_columns_are_sorted_slices(panel):
+    assert panel.product_ids == [1, 2]
+    cols = panel.columns(1)
+    assert cols['ds'].astype(str).tolist() == ['2024-01-01', '2024-01-02', '2024-01-04']
+    assert cols['y'].tolist() == [1.0, 2.0, 4.0]
+    assert panel.columns(1, since='2024-01-02')['y'].tolist() == [2.0, 4.0]
+    assert panel.latest_date(2) == np.datetime64('2024-01-05')
+    assert panel.latest_date(99) is None and len(panel.columns(99)['y']) == 0
+
+
+def test_oil_is_filled_over_the_calendar(panel):
+    # 01-03 and 01-05 take the previous day's price whichever product they belong to
+    assert panel.columns(2)['oil_price'].tolist() == [50.0, 52.0]
+    assert panel.columns(1)['oil_price'].tolist() == [50.0, 50.0, 52.0]
+
+
+def test_matrix_layout(panel):
+    dates, y = panel.matrix([1, 2, 99])
+    assert dates.astype(str).tolist() == ['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04', '2024-01-05']
+    expected = np.array([
+        [1.0, np.nan, np.nan],
+        [2.0, np.nan, np.nan],
+        [0.0, 7.0, np.nan],     # gap inside product 1's history is a zero
+        [4.0, 0.0, np.nan],
+        [0.0, 9.0, np.nan],
+    ])
+    np.testing.assert_array_equal(y, expected)
+
+    dates, y = panel.matrix([1, 2], until='2024-01-03', days=2)
+    assert dates.astype(str).tolist() == ['2024-01-02', '2024-01-03']
+    np.testing.assert_array_equal(y, [[2.0, np.nan], [0.0, 7.0]])
+
+    _, promo = panel.matrix([1], column='on_promotion')
+    assert promo[:, 0].tolist() == [0.0, 3.0, 0.0, 0.0]
+
+
+@pytest.fixture
+def loads(tmp_path, monkeypatch):
+    loads = []
+    monkeypatch.setattr(history_panel.Config, 'HISTORY_PANEL_VERSION_FILE', str(tmp_path / 'panel.version'))
+    monkeypatch.setattr(history_panel, 'load_history_panel', lambda: loads.append(object()) or loads[-1])
+    monkeypatch.setattr(history_panel, '_panel', None)
+    return loads
+
+
+def test_panel_is_cached_until_invalidated(loads):
+    first = get_history_panel()
+    assert get_history_panel() is first
+
+    invalidate_history_panel()
+    second = get_history_panel()
+    assert second is not first and get_history_panel() is second
+    assert len(loads) == 2
+
+
+def test_invalidation_from_another_process_reloads(loads, tmp_path):
+    first = get_history_panel()
+    (tmp_path / 'panel.version').write_text('written-by-another-process')
+    assert get_history_panel() is not first
+    assert len(loads) == 2
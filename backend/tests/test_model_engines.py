@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from model_engines import (SEASON, CrostonEngine, HoltWintersEngine, SeasonalNaiveEngine, default_engines,
+                           fill_leading, get_engine, select_engines)
+
+WEEK = np.array([10.0, 12.0, 14.0, 16.0, 18.0, 30.0, 40.0])
+
+
+def weekly(weeks, offset=0):
+    """Column of `weeks` repetitions of WEEK, starting `offset` days into it"""
+    return np.roll(np.tile(WEEK, weeks), -offset)[:, None]
+
+
+def test_fill_leading_repeats_first_season():
+    y = np.array([np.nan, np.nan, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0])[:, None]
+    filled = fill_leading(y)
+    assert filled[:, 0].tolist() == [6.0, 7.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0]
+    assert fill_leading(np.full((3, 1), np.nan)).tolist() == [[0.0], [0.0], [0.0]]
+
+
+@pytest.mark.parametrize('offset', [0, 3])
+def test_seasonal_naive_continues_the_weekday_profile(offset):
+    y = weekly(6, offset)
+    yhat, lower, upper = SeasonalNaiveEngine().forecast(y, 14)
+    expected = np.roll(np.tile(WEEK, 2), -offset)
+    np.testing.assert_allclose(yhat[:, 0], expected)
+    # A perfectly periodic series has zero seasonal error
+    np.testing.assert_allclose(lower, yhat)
+    np.testing.assert_allclose(upper, yhat)
+
+
+def test_seasonal_naive_averages_recent_weeks_and_widens_intervals():
+    y = np.vstack([weekly(4), weekly(4) + 4.0])
+    yhat, lower, upper = SeasonalNaiveEngine(weeks=4).forecast(y, 14)
+    np.testing.assert_allclose(yhat[:SEASON, 0], WEEK + 4.0)
+    width = upper - lower
+    assert np.all(width[SEASON:] > width[:SEASON])
+
+
+def test_seasonal_naive_short_history_uses_mean():
+    y = np.array([[1.0], [2.0], [6.0]])
+    yhat, _, _ = SeasonalNaiveEngine().forecast(y, 3)
+    np.testing.assert_allclose(yhat[:, 0], [3.0, 3.0, 3.0])
+
+
+def test_holt_winters_tracks_season_and_is_vectorized():
+    y = np.hstack([weekly(8), weekly(8, 2) * 3])
+    yhat, lower, upper = HoltWintersEngine().forecast(y, SEASON)
+    np.testing.assert_allclose(yhat[:, 0], WEEK, rtol=0.05)
+    np.testing.assert_allclose(yhat[:, 1], np.roll(WEEK, -2) * 3, rtol=0.05)
+    assert np.all(lower <= yhat) and np.all(upper >= yhat)
+
+
+def test_holt_winters_falls_back_for_short_series():
+    y = weekly(1)
+    np.testing.assert_allclose(HoltWintersEngine().forecast(y, 5)[0], SeasonalNaiveEngine().forecast(y, 5)[0])
+
+
+def test_croston_flat_rate_for_regular_intermittent_demand():
+    # 6 units every third day: demand rate 2 per day, SBA-corrected by (1 - alpha / 2)
+    y = np.tile([0.0, 0.0, 6.0], 30)[:, None]
+    yhat, lower, upper = CrostonEngine(alpha=0.1).forecast(y, 10)
+    np.testing.assert_allclose(yhat[:, 0], 0.95 * 2.0)
+    assert np.all(lower < yhat) and np.all(upper > yhat)
+
+
+def test_croston_ignores_days_before_the_series_started():
+    y = np.concatenate([np.full(30, np.nan), np.tile([0.0, 4.0], 20)])[:, None]
+    yhat, _, _ = CrostonEngine(alpha=0.1).forecast(y, 1)
+    np.testing.assert_allclose(yhat[0, 0], 0.95 * 2.0)
+
+
+def test_default_engines():
+    intermittent = np.tile([5.0, 0.0, 0.0], 10)
+    regular = np.arange(1.0, 31.0)
+    short = np.concatenate([np.full(20, np.nan), np.arange(1.0, 11.0)])
+    names = default_engines(np.column_stack([intermittent, regular, short]))
+    assert names.tolist() == ['croston', 'holt_winters', 'seasonal_naive']
+
+
+def test_select_engines_prefers_backtest_and_escalates_to_prophet():
+    y = np.column_stack([np.arange(1.0, 31.0)] * 3)
+    errors = [
+        {'seasonal_naive': 1.0, 'holt_winters': 2.0},
+        {'holt_winters': 2.0, 'prophet': 1.0},
+        {'holt_winters': 2.0, 'prophet': 1.95},
+    ]
+    assert select_engines(y, errors).tolist() == ['seasonal_naive', 'prophet', 'holt_winters']
+    # Without backtest results every series stays on its statistical default
+    assert select_engines(y).tolist() == ['holt_winters'] * 3
+    assert select_engines(y, [{'prophet': 1.0}, None, {}]).tolist() == ['holt_winters'] * 3
+
+
+def test_get_engine_rejects_unknown_names():
+    assert get_engine('croston').name == 'croston'
+    with pytest.raises(ValueError):
+        get_engine('prophet')
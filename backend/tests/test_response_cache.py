@@ -0,0 +1,119 @@
+import pytest
+from flask import Flask, jsonify
+
+import response_cache
+from response_cache import ResponseCache, cached_response, invalidate_responses
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path), ttl=300)
+    monkeypatch.setattr(response_cache, '_cache', cache)
+    monkeypatch.setattr(response_cache.Config, 'RESPONSE_CACHE_ENABLED', True)
+    return cache
+
+
+@pytest.fixture
+def calls():
+    return {'sales': 0, 'forecasts': 0}
+
+
+@pytest.fixture
+def client(cache, calls):
+    app = Flask(__name__)
+
+    @app.route('/sales')
+    @cached_response('sales')
+    def sales():
+        calls['sales'] += 1
+        return jsonify({'calls': calls['sales']})
+
+    @app.route('/forecasts')
+    @cached_response('forecasts')
+    def forecasts():
+        calls['forecasts'] += 1
+        return jsonify({'calls': calls['forecasts']})
+
+    @app.route('/missing')
+    @cached_response('sales')
+    def missing():
+        return jsonify({'error': 'not found'}), 404
+
+    return app.test_client()
+
+
+def test_miss_then_hit(client, calls):
+    first = client.get('/sales')
+    second = client.get('/sales')
+    assert first.headers['X-Cache'] == 'MISS' and second.headers['X-Cache'] == 'HIT'
+    assert first.get_json() == second.get_json() == {'calls': 1}
+    assert calls['sales'] == 1
+    assert first.headers['ETag'] == second.headers['ETag']
+    assert 'Accept' in first.headers['Vary']
+
+
+def test_if_none_match_returns_304(client, cache):
+    etag = client.get('/sales').headers['ETag']
+    response = client.get('/sales', headers={'If-None-Match': etag})
+    assert response.status_code == 304 and response.data == b''
+    assert client.get('/sales', headers={'If-None-Match': '"other"'}).status_code == 200
+    assert cache.stats()['not_modified'] == 1
+
+
+def test_if_modified_since_returns_304(client):
+    last_modified = client.get('/sales').headers['Last-Modified']
+    assert client.get('/sales', headers={'If-Modified-Since': last_modified}).status_code == 304
+
+
+def test_invalidation_changes_body_and_etag(client, calls):
+    etag = client.get('/sales').headers['ETag']
+    invalidate_responses('sales')
+    response = client.get('/sales', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['X-Cache'] == 'MISS'
+    assert response.get_json() == {'calls': 2}
+    assert response.headers['ETag'] != etag
+
+
+def test_invalidation_only_drops_its_namespace(client, cache, calls):
+    client.get('/sales')
+    client.get('/forecasts')
+    invalidate_responses('forecasts')
+    assert cache.stats()['entries'] == 1
+    assert client.get('/sales').headers['X-Cache'] == 'HIT'
+    assert client.get('/forecasts').headers['X-Cache'] == 'MISS'
+    assert calls == {'sales': 1, 'forecasts': 2}
+
+
+def test_accept_header_is_part_of_the_key(client, calls):
+    client.get('/sales', headers={'Accept': 'application/json'})
+    assert client.get('/sales', headers={'Accept': 'application/vnd.apache.arrow.stream'}).headers['X-Cache'] == 'MISS'
+    assert calls['sales'] == 2
+
+
+def test_profiled_requests_bypass_the_cache(client, cache, calls):
+    response = client.get('/sales?profile=1')
+    assert 'X-Cache' not in response.headers
+    assert client.get('/sales', headers={'X-Profile': '1'}).get_json() == {'calls': 2}
+    assert cache.stats()['entries'] == 0
+
+
+def test_errors_are_not_cached(client, cache):
+    assert client.get('/missing').status_code == 404
+    assert cache.stats()['entries'] == 0
+
+
+def test_ttl_expiry(client, cache, calls, monkeypatch):
+    client.get('/sales')
+    monkeypatch.setattr(cache, 'ttl', 0)
+    assert client.get('/sales').headers['X-Cache'] == 'MISS'
+    assert calls['sales'] == 2
+
+
+def test_shared_entries_reach_other_processes(tmp_path, client, cache, calls, monkeypatch):
+    cache.shared = True
+    client.get('/sales')
+    # A second process: same directory, empty memory
+    other = ResponseCache(str(tmp_path), ttl=300, shared=True)
+    monkeypatch.setattr(response_cache, '_cache', other)
+    assert client.get('/sales').headers['X-Cache'] == 'HIT'
+    assert calls['sales'] == 1
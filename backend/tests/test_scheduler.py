@@ -0,0 +1,53 @@
+from datetime import datetime
+
+import pytest
+
+from scheduler import DEFAULT_JOB_SECONDS, CronSchedule, job_estimate
+
+
+@pytest.mark.parametrize('expression, when, expected', [
+    ('0 2 * * *', datetime(2024, 3, 10, 1, 59), datetime(2024, 3, 10, 2, 0)),
+    ('0 2 * * *', datetime(2024, 3, 10, 2, 0), datetime(2024, 3, 11, 2, 0)),
+    ('*/15 * * * *', datetime(2024, 3, 10, 8, 7, 30), datetime(2024, 3, 10, 8, 15)),
+    ('0-30/10 9 * * *', datetime(2024, 3, 10, 9, 25), datetime(2024, 3, 10, 9, 30)),
+    ('30 6 * * 1-5', datetime(2024, 3, 8, 7, 0), datetime(2024, 3, 11, 6, 30)),     # Fri -> Mon
+    ('0 0 * * 7', datetime(2024, 3, 11, 0, 0), datetime(2024, 3, 17, 0, 0)),        # 7 is Sunday
+    ('0 0 1 * *', datetime(2024, 1, 31, 12, 0), datetime(2024, 2, 1, 0, 0)),
+    ('0 0 29 2 *', datetime(2023, 3, 1), datetime(2024, 2, 29, 0, 0)),
+    ('0 0 31 12 *', datetime(2024, 12, 31, 0, 0), datetime(2025, 12, 31, 0, 0)),
+])
+def test_next_after(expression, when, expected):
+    assert CronSchedule(expression).next_after(when) == expected
+
+
+def test_restricted_day_fields_match_either():
+    # Day 15 or any Monday, as in cron
+    schedule = CronSchedule('0 0 15 * 1')
+    assert schedule.next_after(datetime(2024, 3, 12)) == datetime(2024, 3, 15)   # Fri the 15th
+    assert schedule.next_after(datetime(2024, 3, 15)) == datetime(2024, 3, 18)   # Monday
+
+
+def test_lists():
+    schedule = CronSchedule('5,45 8,20 * * *')
+    runs = [datetime(2024, 1, 1)]
+    for _ in range(4):
+        runs.append(schedule.next_after(runs[-1]))
+    assert [(r.hour, r.minute) for r in runs[1:]] == [(8, 5), (8, 45), (20, 5), (20, 45)]
+
+
+@pytest.mark.parametrize('expression', ['* * * *', '60 * * * *', '* 24 * * *', '5-1 * * * *',
+                                        '*/0 * * * *', '* * 0 * *'])
+def test_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
+
+
+def test_never_matching_expression():
+    with pytest.raises(ValueError):
+        CronSchedule('0 0 31 2 *').next_after(datetime(2024, 1, 1))
+
+
+def test_job_estimate():
+    assert job_estimate({'fit_seconds': 4}, [1.0, 2.0]) == 4.0
+    assert job_estimate({'fit_seconds': None}, [1.0, 2.0]) == 1.5
+    assert job_estimate({'fit_seconds': None}, []) == DEFAULT_JOB_SECONDS
@@ -0,0 +1,26 @@
+"""
+Production WSGI entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+With PRELOAD_FORECASTING (the default) Prophet, cmdstanpy and the compiled Stan
+model are loaded here, at import time. With gunicorn's preload_app the master
+imports this module once before forking, so every worker shares those pages
+copy-on-write instead of loading its own copy. With PRELOAD_FORECASTING=false
+workers start serving immediately and warm up in a background thread instead.
+Under gunicorn, job threads are started per worker after the fork
+(gunicorn.conf.py post_fork). Any other WSGI server that imports this module
+gets them at import time, so queued forecast jobs still run.
+"""
+
+import sys
+from config import Config
+import startup
+
+if Config.PRELOAD_FORECASTING:
+    startup.warm_up()
+
+from app import app, start_background_workers
+
+if 'gunicorn.arbiter' not in sys.modules:
+    start_background_workers()
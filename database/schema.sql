@@ -10,21 +10,69 @@ CREATE TABLE IF NOT EXISTS products (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- Sales data table (time-series)
+-- Stores (from the Kaggle stores.csv; store_nbr is the leaf level of the forecast hierarchy)
+CREATE TABLE IF NOT EXISTS stores (
+    store_nbr INTEGER PRIMARY KEY,
+    city VARCHAR(100),
+    state VARCHAR(100),
+    type VARCHAR(10),
+    cluster INTEGER
+);
+
+-- Source family and store for imported products (store is NULL for family-level products)
+ALTER TABLE products ADD COLUMN IF NOT EXISTS family VARCHAR(100);
+ALTER TABLE products ADD COLUMN IF NOT EXISTS store_nbr INTEGER;
+
+-- Sales data table (time-series), range-partitioned by month on sale_date.
+-- Monthly partitions (sales_data_YYYY_MM) are created by the loaders through
+-- partitions.py; convert an existing unpartitioned table with
+-- `python partitions.py migrate`
 CREATE TABLE IF NOT EXISTS sales_data (
-    sale_id SERIAL PRIMARY KEY,
+    sale_id SERIAL,
     product_id INTEGER REFERENCES products(product_id),
     sale_date DATE NOT NULL,
     quantity_sold INTEGER NOT NULL,
     total_amount DECIMAL(10, 2),
     on_promotion INTEGER DEFAULT 0,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (sale_id, sale_date)
+) PARTITION BY RANGE (sale_date);
 
--- Create index for time-series queries
-CREATE INDEX IF NOT EXISTS idx_sales_date ON sales_data(sale_date);
+-- Rows arrive in date order, so a BRIN index covers date ranges at a fraction
+-- of a B-tree's size; per-product reads use the composite B-tree
+CREATE INDEX IF NOT EXISTS idx_sales_date_brin ON sales_data USING BRIN (sale_date);
 CREATE INDEX IF NOT EXISTS idx_sales_product_date ON sales_data(product_id, sale_date);
 
+-- Wake the refresh scheduler (scheduler.py) on new sales, once per statement,
+-- with the earliest sale date inserted
+CREATE OR REPLACE FUNCTION notify_sales_data_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('sales_data_changed', COALESCE((SELECT MIN(sale_date) FROM new_rows)::text, ''));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sales_data_changed ON sales_data;
+CREATE TRIGGER sales_data_changed
+    AFTER INSERT ON sales_data
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_sales_data_changed();
+
+-- Daily rollup of sales_data with regressors resolved (maintained by daily_aggregates.py),
+-- partitioned by month like sales_data
+CREATE TABLE IF NOT EXISTS sales_daily (
+    product_id INTEGER NOT NULL,
+    sale_date DATE NOT NULL,
+    quantity_sold BIGINT NOT NULL,
+    total_amount DECIMAL(14, 2),
+    on_promotion INTEGER DEFAULT 0,
+    oil_price DECIMAL(10, 2),
+    is_holiday SMALLINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (product_id, sale_date)
+) PARTITION BY RANGE (sale_date);
+
+CREATE INDEX IF NOT EXISTS idx_sales_daily_date_brin ON sales_daily USING BRIN (sale_date);
+
 -- Oil prices table (external regressor)
 CREATE TABLE IF NOT EXISTS oil_prices (
     oil_id SERIAL PRIMARY KEY,
@@ -63,3 +111,97 @@ CREATE TABLE IF NOT EXISTS forecasts (
 
 -- Create index for forecast queries
 CREATE INDEX IF NOT EXISTS idx_forecast_product_date ON forecasts(product_id, forecast_date);
+
+-- Forecast runs: every save_forecasts call writes one run atomically
+CREATE TABLE IF NOT EXISTS forecast_runs (
+    run_id SERIAL PRIMARY KEY,
+    product_count INTEGER,
+    status VARCHAR(20) DEFAULT 'running',
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP
+);
+
+ALTER TABLE forecasts ADD COLUMN IF NOT EXISTS run_id INTEGER;
+
+-- One forecast per product and date; save_forecasts upserts on it
+CREATE UNIQUE INDEX IF NOT EXISTS idx_forecast_product_date_unique ON forecasts(product_id, forecast_date);
+
+-- Reconciled forecasts for aggregate hierarchy nodes (total and family);
+-- store x family leaves are stored in forecasts
+CREATE TABLE IF NOT EXISTS hierarchy_forecasts (
+    hierarchy_forecast_id SERIAL PRIMARY KEY,
+    level VARCHAR(20) NOT NULL,
+    node VARCHAR(100) NOT NULL,
+    forecast_date DATE NOT NULL,
+    predicted_quantity DECIMAL(12, 2) NOT NULL,
+    lower_bound DECIMAL(12, 2),
+    upper_bound DECIMAL(12, 2),
+    method VARCHAR(20) NOT NULL,
+    generated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_hierarchy_forecast_node ON hierarchy_forecasts(level, node, forecast_date);
+
+-- Forecast job queue (POST /api/forecast submits, background workers execute)
+CREATE TABLE IF NOT EXISTS forecast_jobs (
+    job_id SERIAL PRIMARY KEY,
+    product_id INTEGER REFERENCES products(product_id),
+    forecast_days INTEGER NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    result JSONB,
+    error TEXT,
+    attempts INTEGER DEFAULT 0,
+    submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- At most one in-flight job per product/horizon; duplicate submissions coalesce onto it
+CREATE UNIQUE INDEX IF NOT EXISTS idx_forecast_jobs_inflight
+    ON forecast_jobs(product_id, forecast_days)
+    WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_forecast_jobs_status ON forecast_jobs(status, submitted_at);
+
+-- Batch jobs (POST /api/forecast/batch) have no product; their arguments are in params
+ALTER TABLE forecast_jobs ADD COLUMN IF NOT EXISTS kind VARCHAR(20) NOT NULL DEFAULT 'product';
+ALTER TABLE forecast_jobs ADD COLUMN IF NOT EXISTS params JSONB;
+
+-- Last production model fit per product (watermark for incremental refits)
+CREATE TABLE IF NOT EXISTS model_fits (
+    product_id INTEGER PRIMARY KEY REFERENCES products(product_id),
+    fitted_through DATE NOT NULL,
+    training_rows INTEGER,
+    fit_seconds DECIMAL(10, 3),
+    warm_started BOOLEAN DEFAULT FALSE,
+    fitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Rolling-origin backtests (written by backtesting.py, served by /api/accuracy)
+CREATE TABLE IF NOT EXISTS backtest_runs (
+    run_id SERIAL PRIMARY KEY,
+    horizon INTEGER NOT NULL,
+    num_cutoffs INTEGER NOT NULL,
+    period INTEGER NOT NULL,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS backtest_results (
+    backtest_result_id SERIAL PRIMARY KEY,
+    run_id INTEGER REFERENCES backtest_runs(run_id),
+    product_id INTEGER REFERENCES products(product_id),
+    cutoff DATE NOT NULL,
+    horizon INTEGER NOT NULL,
+    mae DECIMAL(14, 4),
+    mape DECIMAL(10, 4),
+    rmse DECIMAL(14, 4),
+    coverage DECIMAL(5, 4),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_backtest_product_run ON backtest_results(product_id, run_id);
+
+-- Forecast engine per fit and per backtest result (prophet or a model_engines engine)
+ALTER TABLE model_fits ADD COLUMN IF NOT EXISTS engine VARCHAR(30) DEFAULT 'prophet';
+ALTER TABLE backtest_results ADD COLUMN IF NOT EXISTS engine VARCHAR(30) NOT NULL DEFAULT 'prophet';
+CREATE INDEX IF NOT EXISTS idx_backtest_product_engine_run ON backtest_results(product_id, engine, run_id);
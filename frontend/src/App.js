@@ -14,11 +14,20 @@ import {
 } from 'recharts';
 import './App.css';
 
+// Most points per series the chart asks the API for (LTTB downsampling)
+const CHART_POINTS = 500;
+
+// Forecast job polling: backoff from 0.5s up to 8s, give up after 10 minutes
+const JOB_POLL_MIN_MS = 500;
+const JOB_POLL_MAX_MS = 8000;
+const JOB_TIMEOUT_MS = 10 * 60 * 1000;
+
 function App() {
   const [products, setProducts] = useState([]);
   const [selectedProduct, setSelectedProduct] = useState('');
   const [historicalDays, setHistoricalDays] = useState(90);
   const [forecastDays, setForecastDays] = useState(30);
+  const [bucket, setBucket] = useState('day');
   const [historicalData, setHistoricalData] = useState([]);
   const [forecastData, setForecastData] = useState([]);
   const [accuracyMetrics, setAccuracyMetrics] = useState(null);
@@ -50,7 +59,9 @@ function App() {
       const response = await axios.get('/api/historical', {
         params: {
           product_id: selectedProduct,
-          days_back: historicalDays
+          days_back: historicalDays,
+          bucket: bucket,
+          points: CHART_POINTS
         }
       });
       setHistoricalData(response.data);
@@ -59,6 +70,20 @@ function App() {
     }
   };
 
+  const waitForJob = async (jobId) => {
+    // Poll the job with exponential backoff until it finishes or the deadline passes
+    const deadline = Date.now() + JOB_TIMEOUT_MS;
+    let delay = JOB_POLL_MIN_MS;
+    while (Date.now() < deadline) {
+      const response = await axios.get(`/api/jobs/${jobId}`);
+      if (response.data.status === 'succeeded') return response.data;
+      if (response.data.status === 'failed') throw new Error(response.data.error);
+      await new Promise(resolve => setTimeout(resolve, Math.min(delay, deadline - Date.now())));
+      delay = Math.min(delay * 2, JOB_POLL_MAX_MS);
+    }
+    throw new Error(`job ${jobId} did not finish within ${JOB_TIMEOUT_MS / 60000} minutes`);
+  };
+
   const generateForecast = async () => {
     if (!selectedProduct) return;
 
@@ -66,12 +91,21 @@ function App() {
     setError('');
 
     try {
-      // Generate forecast
+      // Submit forecast job and wait for it to finish
       const response = await axios.post('/api/forecast', {
         product_id: selectedProduct,
         forecast_days: forecastDays
       });
-      setForecastData(response.data.forecast);
+      const job = await waitForJob(response.data.job_id);
+      if (bucket === 'day') {
+        setForecastData(job.result.forecast);
+      } else {
+        // Weekly/monthly totals of the saved forecast, matching the history
+        const saved = await axios.get(`/api/forecast/${selectedProduct}`, {
+          params: { bucket: bucket, points: CHART_POINTS }
+        });
+        setForecastData(saved.data);
+      }
 
       // Fetch accuracy metrics
       try {
@@ -189,10 +223,22 @@ function App() {
                 value={historicalDays}
                 onChange={(e) => setHistoricalDays(parseInt(e.target.value))}
                 min="30"
-                max="730"
+                max="3650"
               />
             </div>
 
+            <div className="form-group">
+              <label>Resolution</label>
+              <select
+                value={bucket}
+                onChange={(e) => setBucket(e.target.value)}
+              >
+                <option value="day">Daily</option>
+                <option value="week">Weekly</option>
+                <option value="month">Monthly</option>
+              </select>
+            </div>
+
             <div className="form-group">
               <label>Forecast Days</label>
               <input